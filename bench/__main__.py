@@ -0,0 +1,132 @@
+import argparse
+import asyncio
+import functools
+import json
+import logging
+import os
+import platform
+import sys
+from datetime import datetime
+
+from bench.scenarios import SCRIPTS
+
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), "baselines")
+
+# Окружение бенчмарка задается до импорта бота: локальная БД и лимиты, не мешающие нагрузке
+BENCH_ENV = {
+    "BOT_TOKEN": "123456:bench-token",
+    "DATABASE_URL": "sqlite:///bench.db",
+    "THROTTLE_RATE": "100000",
+    "THROTTLE_BURST": "100000",
+    "THROTTLE_GLOBAL_RATE": "100000",
+    "THROTTLE_GLOBAL_BURST": "100000",
+    "SEND_CHAT_RATE": "100000",
+    "SEND_CHAT_BURST": "100000",
+    "SEND_GLOBAL_RATE": "100000",
+    "SEND_GLOBAL_BURST": "100000",
+    "METRICS_PORT": "0",
+    "LOG_FILE": "",
+}
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog="python -m bench", description="Нагрузочный прогон диспетчера бота")
+    parser.add_argument("--database-url", help="БД для прогона (по умолчанию sqlite:///bench.db или BENCH_DATABASE_URL)")
+    parser.add_argument("--scenario", default="session", choices=sorted(SCRIPTS), help="Сценарий виртуального пользователя")
+    parser.add_argument("--users", type=int, default=200, help="Число виртуальных пользователей")
+    parser.add_argument("--concurrency", type=int, default=20, help="Одновременно активных пользователей")
+    parser.add_argument("--warmup", type=int, default=10, help="Пользователей для прогрева (не учитываются)")
+    parser.add_argument("--fixtures", type=int, default=10000, help="Синтетических записей в persons")
+    parser.add_argument("--save", metavar="NAME", help="Сохранить результат как базовый в bench/baselines/NAME.json")
+    parser.add_argument("--compare", metavar="NAME", help="Сравнить с базовым bench/baselines/NAME.json")
+    parser.add_argument("--threshold", type=float, default=1.2, help="Допустимый рост p95 относительно базового")
+    parser.add_argument("--log-level", default="WARNING", help="Уровень логов бота во время прогона")
+    return parser.parse_args()
+
+def print_report(report):
+    print(f"Обновлений: {report['updates']} за {report['elapsed_s']} с, "
+          f"{report['throughput_ups']} обн/с (пользователей {report['users']}, параллельно {report['concurrency']})")
+    print(f"Запросов к БД на обновление: {report['db_queries_per_update']}, "
+          f"вызовов Bot API на обновление: {report['api_calls_per_update']}")
+    for title, key in (("Обработчик", "handlers"), ("Шаг сценария", "steps")):
+        print(f"\n{title:<28} {'N':>6} {'p50 мс':>9} {'p95 мс':>9} {'p99 мс':>9} {'БД':>6}")
+        for name, stats in report[key].items():
+            print(f"{name:<28} {stats['count']:>6} {stats['p50_ms']:>9} {stats['p95_ms']:>9} "
+                  f"{stats['p99_ms']:>9} {stats['db_queries']:>6}")
+
+def compare(report, baseline, threshold):
+    """Печатает изменения относительно базового прогона. Возвращает список регрессий"""
+    regressions = []
+    print(f"\nСравнение с базовым ({baseline['meta']['created_at']}):")
+    print(f"  пропускная способность: {baseline['throughput_ups']} -> {report['throughput_ups']} обн/с")
+    print(f"  запросов к БД на обновление: {baseline['db_queries_per_update']} -> {report['db_queries_per_update']}")
+    for name, stats in report["handlers"].items():
+        before = baseline["handlers"].get(name)
+        if not before or not before["p95_ms"]:
+            continue
+        ratio = stats["p95_ms"] / before["p95_ms"]
+        mark = ""
+        if ratio > threshold:
+            mark = "  <- регрессия"
+            regressions.append(name)
+        print(f"  {name:<28} p95 {before['p95_ms']} -> {stats['p95_ms']} мс (x{ratio:.2f}){mark}")
+    if report["db_queries_per_update"] > baseline["db_queries_per_update"] * threshold:
+        regressions.append("db_queries_per_update")
+    return regressions
+
+async def run(args):
+    import bot
+    from database import get_engine, run_db
+    from utils.logs import setup_logging
+    from bench.fixtures import load_fixtures
+    from bench.harness import Harness
+
+    setup_logging()
+    logging.getLogger().setLevel(args.log_level.upper())
+    bot.check_schema()
+    dp = bot.create_app()
+    engine = get_engine()
+    added = await run_db(load_fixtures, args.fixtures)
+    if added:
+        print(f"Добавлено синтетических записей: {added}")
+    harness = Harness(dp, engine, bot.router)
+    script = functools.partial(
+        SCRIPTS[args.scenario], user_code=bot.USER_ACCESS_CODE, admin_code=bot.ADMIN_ACCESS_CODE
+    )
+    await bot.on_startup(dp)
+    try:
+        report = await harness.run(script, args.users, args.concurrency, args.warmup)
+    finally:
+        await bot.lifecycle.shutdown()
+    report["meta"] = {
+        "created_at": datetime.utcnow().isoformat(timespec="seconds"),
+        "scenario": args.scenario,
+        "database": engine.dialect.name,
+        "fixtures": args.fixtures,
+        "python": platform.python_version(),
+    }
+    return report
+
+def main():
+    args = parse_args()
+    # Рабочие токен и БД из .env не используются: адрес БД для прогона задается явно
+    os.environ.update(BENCH_ENV)
+    os.environ["DATABASE_URL"] = args.database_url or os.getenv("BENCH_DATABASE_URL") or BENCH_ENV["DATABASE_URL"]
+
+    report = asyncio.run(run(args))
+    print_report(report)
+
+    if args.save:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        path = os.path.join(BASELINE_DIR, f"{args.save}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nБазовый результат сохранен: {path}")
+    if args.compare:
+        with open(os.path.join(BASELINE_DIR, f"{args.compare}.json"), encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        if regressions:
+            print(f"\nРегрессии: {', '.join(regressions)}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,18 @@
+import random
+from sqlalchemy import insert, func, select
+
+from bench.scenarios import fake_person
+from database import Person, get_db_session
+
+def load_fixtures(count, seed=0, batch_size=1000):
+    """Дополняет таблицу persons синтетическими записями до count штук. Возвращает число добавленных"""
+    rng = random.Random(seed)
+    with get_db_session() as db:
+        existing = db.execute(select(func.count()).select_from(Person)).scalar()
+    added = 0
+    for start in range(existing, count, batch_size):
+        rows = [fake_person(rng, number) for number in range(start, min(start + batch_size, count))]
+        with get_db_session() as db:
+            db.execute(insert(Person), rows)
+        added += len(rows)
+    return added
@@ -0,0 +1,198 @@
+import asyncio
+import functools
+import itertools
+import json
+import random
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from sqlalchemy import event
+
+from aiogram import Bot, Dispatcher, types
+
+from bench.scenarios import message_payload, callback_payload, inline_callbacks
+
+def percentile(values, share):
+    """Перцентиль методом ближайшего ранга"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(share * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+def summarize(samples):
+    """Сводка по выборке задержек (секунды -> миллисекунды)"""
+    return {
+        "count": len(samples),
+        "p50_ms": round(percentile(samples, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(samples, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(samples, 0.99) * 1000, 3),
+        "mean_ms": round(sum(samples) / len(samples) * 1000, 3) if samples else 0.0,
+    }
+
+class FakeTelegram:
+    """
+    Подменяет запросы бота к Bot API: ответы формируются локально,
+    поэтому замеряется только обработка обновлений ботом.
+    """
+
+    def __init__(self, bot):
+        self.calls = 0
+        self.last_markup = {}
+        self._message_ids = itertools.count(1)
+        bot.request = self.request
+
+    async def request(self, method, data=None, files=None, **kwargs):
+        self.calls += 1
+        data = data or {}
+        chat_id = data.get("chat_id")
+        if "reply_markup" in data and chat_id is not None:
+            markup = data["reply_markup"]
+            self.last_markup[int(chat_id)] = json.loads(markup) if isinstance(markup, str) else markup
+        if method in ("sendMessage", "editMessageText"):
+            return {
+                "message_id": data.get("message_id") or next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": int(chat_id or 0), "type": "private"},
+                "text": data.get("text", ""),
+            }
+        return True
+
+    def inline_callbacks(self, chat_id):
+        """callback_data кнопок последней inline-клавиатуры, отправленной в чат"""
+        return inline_callbacks(self.last_markup.get(chat_id))
+
+class QueryCounter:
+    """
+    Считает обращения к БД (выполненные SQL-операторы) через события SQLAlchemy:
+    всего и отдельно для текущего обновления — run_db() передает контекст задачи в поток БД.
+    """
+
+    def __init__(self, engine):
+        self.count = 0
+        self._current = ContextVar("bench_queries", default=None)
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args):
+        self.count += 1
+        counter = self._current.get()
+        if counter is not None:
+            counter[0] += 1
+
+    def track(self):
+        """Начинает отдельный счет для текущей задачи, возвращает изменяемый счетчик"""
+        counter = [0]
+        self._current.set(counter)
+        return counter
+
+    def current(self):
+        counter = self._current.get()
+        return counter[0] if counter is not None else 0
+
+class Harness:
+    """Прогоняет синтетические обновления через диспетчер и собирает метрики"""
+
+    def __init__(self, dispatcher: Dispatcher, engine, router=None):
+        self.dp = dispatcher
+        self.telegram = FakeTelegram(dispatcher.bot)
+        self.queries = QueryCounter(engine)
+        self.handler_times = defaultdict(list)
+        self.handler_queries = defaultdict(list)
+        self.step_times = defaultdict(list)
+        self.step_queries = defaultdict(list)
+        self.recording = False
+        self._update_ids = itertools.count(1)
+        for handlers in (self.dp.message_handlers, self.dp.callback_query_handlers):
+            for handler_obj in handlers.handlers:
+                handler_obj.handler = self._timed(handler_obj.handler)
+        # Обработчики за MessageRouter вызываются им самим, а не диспетчером
+        for route in (router.routes() if router is not None else ()):
+            route.handler = self._timed(route.handler)
+
+    def _timed(self, handler):
+        @functools.wraps(handler)
+        async def wrapper(*args, **kwargs):
+            queries = self.queries.current()
+            started = time.perf_counter()
+            try:
+                return await handler(*args, **kwargs)
+            finally:
+                if self.recording:
+                    self.handler_times[handler.__name__].append(time.perf_counter() - started)
+                    self.handler_queries[handler.__name__].append(self.queries.current() - queries)
+        return wrapper
+
+    def message_update(self, user_id, text):
+        return types.Update(**message_payload(next(self._update_ids), user_id, text))
+
+    def callback_update(self, user_id, data):
+        return types.Update(**callback_payload(next(self._update_ids), user_id, data))
+
+    async def _process(self, update):
+        counter = self.queries.track()
+        await self.dp.process_update(update)
+        return counter[0]
+
+    async def feed(self, step, update):
+        """Обрабатывает одно обновление, замеряет время и число запросов к БД"""
+        Bot.set_current(self.dp.bot)
+        Dispatcher.set_current(self.dp)
+        started = time.perf_counter()
+        # Как и в aiogram, каждое обновление — отдельная задача: фильтр состояний кэширует его в контексте
+        queries = await asyncio.create_task(self._process(update))
+        if self.recording:
+            self.step_times[step].append(time.perf_counter() - started)
+            self.step_queries[step].append(queries)
+
+    async def play(self, user_id, steps):
+        """Проигрывает шаги сценария одного пользователя по очереди"""
+        for step, kind, value in steps:
+            if kind == "callback":
+                callbacks = self.telegram.inline_callbacks(user_id)
+                if not callbacks:
+                    continue
+                update = self.callback_update(user_id, callbacks[0])
+            else:
+                update = self.message_update(user_id, value)
+            await self.feed(step, update)
+
+    async def run(self, script, users, concurrency, warmup=0):
+        """
+        Проигрывает script(user_id, index) для warmup + users виртуальных
+        пользователей, не больше concurrency одновременно. Прогрев не учитывается.
+        Возвращает отчет с задержками, пропускной способностью и числом запросов к БД;
+        в общий счет входят и фоновые записи (пакеты аудита, обслуживание).
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+        base_id = random.randint(10 ** 9, 2 * 10 ** 9)
+
+        async def play(index):
+            async with semaphore:
+                await self.play(base_id + index, script(base_id + index, index))
+
+        if warmup:
+            await asyncio.gather(*(play(index) for index in range(warmup)))
+        self.recording = True
+        queries, calls = self.queries.count, self.telegram.calls
+        started = time.perf_counter()
+        await asyncio.gather(*(play(index) for index in range(warmup, warmup + users)))
+        elapsed = time.perf_counter() - started
+        self.recording = False
+        updates = sum(len(samples) for samples in self.step_times.values())
+        return {
+            "users": users,
+            "concurrency": concurrency,
+            "updates": updates,
+            "elapsed_s": round(elapsed, 3),
+            "throughput_ups": round(updates / elapsed, 1) if elapsed else 0.0,
+            "db_queries_per_update": round((self.queries.count - queries) / updates, 2) if updates else 0.0,
+            "api_calls_per_update": round((self.telegram.calls - calls) / updates, 2) if updates else 0.0,
+            "steps": {
+                step: dict(summarize(samples), db_queries=round(sum(self.step_queries[step]) / len(samples), 2))
+                for step, samples in sorted(self.step_times.items())
+            },
+            "handlers": {
+                name: dict(summarize(samples), db_queries=round(sum(self.handler_queries[name]) / len(samples), 2))
+                for name, samples in sorted(self.handler_times.items())
+            },
+        }
@@ -0,0 +1,357 @@
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import random
+import time
+from collections import Counter, defaultdict
+from aiohttp import web, ClientSession, ClientTimeout, ClientError
+
+from bench.harness import summarize
+from bench.scenarios import SCRIPTS, message_payload, callback_payload, inline_callbacks
+
+logger = logging.getLogger(__name__)
+
+# Методы, ответ на которые считается ответом бота пользователю
+REPLY_METHODS = {"sendMessage", "editMessageText"}
+# Методы, в которые внедряются задержки и ошибки (исходящие сообщения бота)
+FAULT_METHODS = REPLY_METHODS | {"answerCallbackQuery"}
+
+class VirtualUser:
+    """Пользователь с заранее заданным сценарием: следующий шаг отправляется после ответа бота"""
+
+    def __init__(self, user_id, steps):
+        self.user_id = user_id
+        self.steps = iter(steps)
+        self.step = None
+        self.sent_at = None
+        self.markup = None
+        self.timeout_handle = None
+
+class MockBotAPI:
+    """
+    Локальная замена Telegram Bot API для нагрузочных прогонов без сети.
+
+    Отдает обновления виртуальных пользователей через getUpdates (long polling) или
+    отправляет их на webhook после setWebhook, принимает sendMessage и остальные
+    методы, внедряет задержки, ошибки 5xx и ответы 429 с retry_after. Все случайные
+    решения берутся из генератора с фиксированным seed, поэтому прогоны повторяемы.
+    """
+
+    def __init__(self, script, users, think=0.0, ramp=0.0, latency=0.0, jitter=0.0,
+                 error_rate=0.0, retry_after_rate=0.0, retry_after=1, step_timeout=10.0, seed=0):
+        self.script = script
+        self.user_count = users
+        self.think = think
+        self.ramp = ramp
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.retry_after_rate = retry_after_rate
+        self.retry_after = retry_after
+        self.step_timeout = step_timeout
+        self.rng = random.Random(seed)
+        self.seed = seed
+
+        self.users = {}
+        self.active = 0
+        self.finished = asyncio.Event()
+        self._update_ids = itertools.count(1)
+        self._started_at = None
+        self._pending = []
+        self._new_updates = asyncio.Event()
+
+        self.webhook_url = None
+        self.webhook_secret = None
+        self._push_queue = asyncio.Queue()
+        self._push_workers = []
+        self._session = None
+
+        self.methods = Counter()
+        self.injected = Counter()
+        self.latencies = defaultdict(list)
+        self.delivered = 0
+        self.replies = 0
+        self.timeouts = 0
+        self.webhook_rejected = 0
+
+    def app(self):
+        app = web.Application()
+        app.router.add_route("*", "/bot{token}/{method}", self.handle)
+        app.router.add_get("/stats", self.handle_stats)
+        app.on_cleanup.append(self._cleanup)
+        return app
+
+    # Поток обновлений
+
+    def _start_stream(self):
+        """Создает виртуальных пользователей; вызывается, когда бот готов получать обновления"""
+        if self._started_at is not None:
+            return
+        self._started_at = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        base_id = 10 ** 9 + self.seed * 10 ** 6
+        for index in range(self.user_count):
+            user_id = base_id + index
+            user = VirtualUser(user_id, self.script(user_id, index))
+            self.users[user_id] = user
+            self.active += 1
+            delay = self.ramp * index / self.user_count if self.user_count else 0
+            loop.call_later(delay, self._next_step, user)
+        logger.info("Поток обновлений запущен: %s пользователей", self.user_count)
+
+    def _next_step(self, user):
+        for step, kind, value in user.steps:
+            update_id = next(self._update_ids)
+            if kind == "callback":
+                callbacks = inline_callbacks(user.markup)
+                if not callbacks:
+                    continue
+                update = callback_payload(update_id, user.user_id, callbacks[0])
+            else:
+                update = message_payload(update_id, user.user_id, value)
+            user.step = step
+            user.sent_at = time.perf_counter()
+            user.timeout_handle = asyncio.get_running_loop().call_later(self.step_timeout, self._on_timeout, user)
+            self._deliver(update)
+            return
+        user.step = None
+        self.active -= 1
+        if not self.active:
+            self.finished.set()
+
+    def _deliver(self, update):
+        if self.webhook_url:
+            self._push_queue.put_nowait(update)
+        else:
+            self._pending.append(update)
+            self._new_updates.set()
+
+    def _on_reply(self, chat_id, data):
+        user = self.users.get(chat_id)
+        if user is None:
+            return
+        if "reply_markup" in data:
+            markup = data["reply_markup"]
+            user.markup = json.loads(markup) if isinstance(markup, str) else markup
+        if user.sent_at is None:
+            return
+        # Первый ответ завершает шаг; следующий шаг — после паузы, в которую попадают остальные ответы
+        self.latencies[user.step].append(time.perf_counter() - user.sent_at)
+        user.sent_at = None
+        user.timeout_handle.cancel()
+        asyncio.get_running_loop().call_later(self.think, self._next_step, user)
+
+    def _on_timeout(self, user):
+        if user.sent_at is None:
+            return
+        logger.warning("Нет ответа пользователю %s на шаге %s", user.user_id, user.step)
+        self.timeouts += 1
+        user.sent_at = None
+        self._next_step(user)
+
+    # Bot API
+
+    async def handle(self, request):
+        method = request.match_info["method"]
+        if request.content_type == "application/json":
+            data = await request.json()
+        else:
+            data = dict(await request.post())
+        self.methods[method] += 1
+
+        if method in FAULT_METHODS:
+            delay = self.latency + self.rng.uniform(0, self.jitter)
+            if delay:
+                await asyncio.sleep(delay)
+            roll = self.rng.random()
+            if roll < self.retry_after_rate:
+                self.injected["retry_after"] += 1
+                return self._error(429, f"Too Many Requests: retry after {self.retry_after}",
+                                   parameters={"retry_after": self.retry_after})
+            if roll < self.retry_after_rate + self.error_rate:
+                self.injected["error"] += 1
+                return self._error(500, "Internal Server Error")
+
+        if method in REPLY_METHODS and not str(data.get("text") or "").strip():
+            # Как в Telegram: текст из одних пробелов отклоняется
+            return self._error(400, "Bad Request: message text is empty")
+        handler = getattr(self, f"api_{method}", None)
+        result = await handler(data) if handler is not None else True
+        return web.json_response({"ok": True, "result": result})
+
+    def _error(self, status, description, parameters=None):
+        body = {"ok": False, "error_code": status, "description": description}
+        if parameters:
+            body["parameters"] = parameters
+        return web.json_response(body, status=status)
+
+    async def api_getMe(self, data):
+        return {"id": 1, "is_bot": True, "first_name": "Mock", "username": "mock_bot"}
+
+    async def api_getUpdates(self, data):
+        offset = int(data.get("offset") or 0)
+        limit = int(data.get("limit") or 100)
+        timeout = int(data.get("timeout") or 0)
+        # Длинный опрос означает, что бот запущен (короткие запросы — пропуск старых обновлений)
+        if timeout >= 2:
+            self._start_stream()
+        if offset:
+            self._pending = [update for update in self._pending if update["update_id"] >= offset]
+        if not self._pending and timeout:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        updates = self._pending[:limit]
+        self.delivered += len(updates)
+        return updates
+
+    async def api_setWebhook(self, data):
+        self.webhook_url = data["url"]
+        self.webhook_secret = data.get("secret_token")
+        connections = int(data.get("max_connections") or 40)
+        if data.get("drop_pending_updates") in (True, "true", "True"):
+            self._pending.clear()
+        for update in self._pending:
+            self._push_queue.put_nowait(update)
+        self._pending.clear()
+        self._session = self._session or ClientSession(timeout=ClientTimeout(total=60))
+        self._push_workers += [asyncio.create_task(self._push()) for _ in range(connections)]
+        self._start_stream()
+        return True
+
+    async def api_deleteWebhook(self, data):
+        self.webhook_url = None
+        if data.get("drop_pending_updates") in (True, "true", "True"):
+            self._pending.clear()
+        return True
+
+    async def api_getWebhookInfo(self, data):
+        return {"url": self.webhook_url or "", "has_custom_certificate": False,
+                "pending_update_count": len(self._pending) + self._push_queue.qsize()}
+
+    async def api_sendMessage(self, data):
+        chat_id = int(data["chat_id"])
+        self.replies += 1
+        self._on_reply(chat_id, data)
+        return {
+            "message_id": self.replies,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "text": data.get("text", ""),
+        }
+
+    async def api_editMessageText(self, data):
+        chat_id = int(data["chat_id"])
+        self._on_reply(chat_id, data)
+        return {
+            "message_id": int(data.get("message_id") or 0),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "text": data.get("text", ""),
+        }
+
+    async def _push(self):
+        """Доставка обновлений на webhook; отклоненные обновления повторяются, как в Telegram"""
+        headers = {"X-Telegram-Bot-Api-Secret-Token": self.webhook_secret} if self.webhook_secret else {}
+        while True:
+            update = await self._push_queue.get()
+            try:
+                async with self._session.post(self.webhook_url, json=update, headers=headers) as response:
+                    accepted = response.status == 200
+            except (ClientError, asyncio.TimeoutError):
+                accepted = False
+            if accepted:
+                self.delivered += 1
+            else:
+                self.webhook_rejected += 1
+                await asyncio.sleep(0.5)
+                self._push_queue.put_nowait(update)
+
+    async def _cleanup(self, app):
+        for worker in self._push_workers:
+            worker.cancel()
+        if self._session is not None:
+            await self._session.close()
+
+    # Результаты
+
+    def report(self):
+        elapsed = time.perf_counter() - self._started_at if self._started_at else 0.0
+        samples = [latency for latencies in self.latencies.values() for latency in latencies]
+        return {
+            "mode": "webhook" if self.webhook_url else "polling",
+            "users": self.user_count,
+            "updates": self.delivered,
+            "replies": self.replies,
+            "elapsed_s": round(elapsed, 3),
+            "throughput_ups": round(self.delivered / elapsed, 1) if elapsed else 0.0,
+            "latency": summarize(samples),
+            "steps": {step: summarize(latencies) for step, latencies in sorted(self.latencies.items())},
+            "timeouts": self.timeouts,
+            "webhook_rejected": self.webhook_rejected,
+            "injected": dict(self.injected),
+            "methods": dict(self.methods),
+        }
+
+    async def handle_stats(self, request):
+        return web.json_response(self.report())
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog="python -m bench.mock_api", description="Локальный сервер Bot API для прогонов")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--scenario", default="session", choices=sorted(SCRIPTS), help="Сценарий виртуального пользователя")
+    parser.add_argument("--users", type=int, default=100, help="Число виртуальных пользователей")
+    parser.add_argument("--user-code", default="12345", help="Код доступа пользователя в сценарии")
+    parser.add_argument("--admin-code", default="77777", help="Код доступа администратора в сценарии")
+    parser.add_argument("--think", type=float, default=0.05, help="Пауза пользователя после ответа бота, секунд")
+    parser.add_argument("--ramp", type=float, default=0.0, help="За сколько секунд подключаются все пользователи")
+    parser.add_argument("--latency", type=float, default=0.0, help="Задержка ответа на исходящие методы, секунд")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Случайная добавка к задержке, секунд")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Доля ответов 500 на исходящие методы")
+    parser.add_argument("--retry-after-rate", type=float, default=0.0, help="Доля ответов 429 на исходящие методы")
+    parser.add_argument("--retry-after", type=int, default=1, help="retry_after в ответах 429, секунд")
+    parser.add_argument("--step-timeout", type=float, default=10.0, help="Сколько ждать ответа на шаг, секунд")
+    parser.add_argument("--duration", type=float, help="Остановиться через столько секунд, даже если сценарии не завершены")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Сохранить отчет в JSON-файл")
+    return parser.parse_args()
+
+async def serve(args):
+    script = lambda user_id, index: SCRIPTS[args.scenario](user_id, index, args.user_code, args.admin_code)
+    api = MockBotAPI(
+        script, args.users, think=args.think, ramp=args.ramp, latency=args.latency, jitter=args.jitter,
+        error_rate=args.error_rate, retry_after_rate=args.retry_after_rate, retry_after=args.retry_after,
+        step_timeout=args.step_timeout, seed=args.seed
+    )
+    runner = web.AppRunner(api.app(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, args.host, args.port).start()
+    logger.info("Bot API: http://%s:%s (BOT_API_URL для бота), ожидание запуска бота", args.host, args.port)
+    try:
+        await asyncio.wait_for(api.finished.wait(), args.duration)
+    except asyncio.TimeoutError:
+        logger.warning("Время прогона истекло до завершения сценариев")
+    finally:
+        report = api.report()
+        await runner.cleanup()
+    return report
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    try:
+        report = asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        return
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import random
+import time
+
+# Синтетические данные: случайные сочетания, телефоны из несуществующего диапазона 7000xxxxxxx
+LAST_NAMES = ["Тестов", "Примеров", "Образцов", "Пробный", "Шаблонов", "Макетов", "Условный", "Выдуманный"]
+FIRST_NAMES = ["Иван", "Пётр", "Сидор", "Фёдор", "Олег", "Глеб", "Антон", "Степан"]
+MIDDLE_NAMES = ["Иванович", "Петрович", "Сидорович", "Фёдорович", "Олегович", "Глебович"]
+STREETS = ["Тестовая", "Примерная", "Нулевая", "Условная", "Шаблонная"]
+
+def fake_fio(rng):
+    return f"{rng.choice(LAST_NAMES)} {rng.choice(FIRST_NAMES)} {rng.choice(MIDDLE_NAMES)}"
+
+def fake_phone(number, prefix="7000"):
+    return f"{prefix}{number % 10 ** 7:07d}"
+
+def fake_person(rng, number):
+    return {
+        "fio": fake_fio(rng),
+        "phone": fake_phone(number),
+        "birth": f"{rng.randint(1950, 2005)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        "car_number": f"Т{rng.randint(100, 999)}СТ{rng.randint(10, 199)}" if rng.random() < 0.5 else None,
+        "address": f"г. Тестовск, ул. {rng.choice(STREETS)}, д. {rng.randint(1, 99)}" if rng.random() < 0.5 else None,
+        "passport": f"00{rng.randint(10, 99)} {rng.randint(100000, 999999)}" if rng.random() < 0.3 else None,
+    }
+
+# Шаг сценария: (имя шага, "message" и текст | "callback" и None — первая кнопка последней inline-клавиатуры)
+
+def session_script(user_id, index, user_code, admin_code, admin_every=10):
+    """
+    Типичная сессия: вход, авторизация, поиск кнопкой и командой,
+    добавление записи; каждый admin_every-й пользователь — администратор и смотрит логи.
+    """
+    rng = random.Random(user_id)
+    is_admin = admin_every and index % admin_every == 0
+    steps = [
+        ("start", "message", "/start"),
+        ("auth_failed", "message", "00000"),
+        ("auth", "message", admin_code if is_admin else user_code),
+        ("start", "message", "/start"),
+        ("search_button", "message", "🔍 Поиск"),
+        ("search_query", "message", rng.choice(LAST_NAMES)),
+        ("find_command", "message", f"/find {fake_phone(rng.randrange(1000))}"),
+        ("add_button", "message", "➕ Добавить"),
+        ("add_fio", "message", fake_fio(rng)),
+        # Телефоны добавляемых записей не пересекаются с фикстурами (7000xxxxxxx)
+        ("add_phone", "message", fake_phone(user_id, prefix="7001")),
+        ("add_birth", "message", f"{rng.randint(1950, 2005)}-0{rng.randint(1, 9)}-1{rng.randint(0, 9)}"),
+        ("add_car", "message", "пропустить"),
+        ("add_address", "message", "пропустить"),
+        ("add_passport", "message", "пропустить"),
+    ]
+    if is_admin:
+        steps += [
+            ("logs_command", "message", "/logs"),
+            ("logs_page", "callback", None),
+            ("logs_button", "message", "📊 Логи"),
+            ("stats_command", "message", "/stats"),
+        ]
+    steps.append(("unknown_text", "message", "привет"))
+    return steps
+
+def chatter_script(user_id, index, user_code, admin_code, repeat=20):
+    """Легкие запросы без обращения к данным: авторизация и повторяющиеся /start"""
+    return [("auth", "message", user_code)] + [("start", "message", "/start")] * repeat
+
+SCRIPTS = {
+    "session": session_script,
+    "chatter": chatter_script,
+}
+
+def _user(user_id):
+    return {"id": user_id, "is_bot": False, "first_name": "Bench", "username": f"bench{user_id}"}
+
+def message_payload(update_id, user_id, text):
+    """JSON обновления с текстовым сообщением от пользователя"""
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": _user(user_id),
+            "text": text,
+        },
+    }
+
+def callback_payload(update_id, user_id, data):
+    """JSON обновления с нажатием inline-кнопки"""
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": _user(user_id),
+            "chat_instance": "bench",
+            "data": data,
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "text": "",
+            },
+        },
+    }
+
+def inline_callbacks(markup):
+    """callback_data кнопок inline-клавиатуры"""
+    return [button["callback_data"] for row in (markup or {}).get("inline_keyboard", []) for button in row]
@@ -0,0 +1,100 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Точки входа: импортируемый модуль и шаги запуска после импорта (имя этапа, код)
+ENTRY_POINTS = {
+    # Procfile: worker: python bot.py
+    "worker": ("bot", [("schema", "bot.check_schema()"), ("app", "bot.create_app()")]),
+    # Procfile: release: python -m database.migrations
+    "release": ("database.migrations", [("schema", "database.migrations.ensure_schema()")]),
+    "legacy_logs": ("database.legacy_logs", []),
+}
+
+# Код дочернего процесса: время импорта и каждого шага, JSON в stdout
+CHILD = """
+import json, time
+started = time.perf_counter()
+import {module}
+stages = {{"import": time.perf_counter() - started}}
+for name, code in {steps!r}:
+    started = time.perf_counter()
+    exec(code)
+    stages[name] = time.perf_counter() - started
+print(json.dumps(stages))
+"""
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog="python -m bench.startup", description="Время запуска точек входа бота")
+    parser.add_argument("--entry", action="append", choices=sorted(ENTRY_POINTS), help="Точка входа (по умолчанию все)")
+    parser.add_argument("--runs", type=int, default=5, help="Запусков каждой точки входа")
+    parser.add_argument("--database-url", help="БД для проверки схемы (по умолчанию временная SQLite)")
+    parser.add_argument("--top", type=int, default=8, help="Самых дорогих пакетов в разбивке импорта (0 — без разбивки)")
+    return parser.parse_args()
+
+def child_env(database_url):
+    env = dict(os.environ)
+    env.update({
+        "BOT_TOKEN": "123456:startup-token",
+        "DATABASE_URL": database_url,
+        "METRICS_PORT": "0",
+        "LOG_FILE": "",
+    })
+    return env
+
+def run_entry(entry, env):
+    """Один запуск точки входа в новом процессе. Возвращает {этап: секунды}, process — весь процесс"""
+    module, steps = ENTRY_POINTS[entry]
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD.format(module=module, steps=steps)],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    )
+    stages = json.loads(result.stdout.strip().splitlines()[-1])
+    stages["process"] = time.perf_counter() - started
+    return stages
+
+def import_breakdown(entry, env):
+    """Собственное время импорта модулей (-X importtime), сложенное по пакетам верхнего уровня, секунд"""
+    module, _ = ENTRY_POINTS[entry]
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    )
+    packages = defaultdict(float)
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        own, _, name = line[len("import time:"):].split("|")
+        packages[name.strip().split(".")[0]] += int(own) / 1e6
+    return sorted(packages.items(), key=lambda item: -item[1])
+
+def main():
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        database_url = args.database_url or f"sqlite:///{os.path.join(directory, 'startup.db')}"
+        env = child_env(database_url)
+        for entry in args.entry or ENTRY_POINTS:
+            # Первый запуск применяет миграции к пустой БД и не учитывается
+            run_entry(entry, env)
+            runs = [run_entry(entry, env) for _ in range(args.runs)]
+            print(f"\n{entry} ({ENTRY_POINTS[entry][0]}), запусков {args.runs}")
+            print(f"  {'Этап':<10} {'медиана мс':>11} {'макс мс':>9}")
+            for stage in runs[0]:
+                values = [run[stage] * 1000 for run in runs]
+                print(f"  {stage:<10} {statistics.median(values):>11.1f} {max(values):>9.1f}")
+            if args.top:
+                print("  Импорт по пакетам, мс:")
+                for package, seconds in import_breakdown(entry, env)[:args.top]:
+                    print(f"    {package:<24} {seconds * 1000:>8.1f}")
+
+if __name__ == "__main__":
+    main()
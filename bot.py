@@ -1,84 +1,62 @@
-import os
-import json
+import time
+
+# Отсчет времени импорта модулей бота (STARTUP_SECONDS, python -m bench.startup)
+_IMPORT_STARTED = time.perf_counter()
+
+import functools
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta
 from aiogram import Bot, Dispatcher, types
-from aiogram.utils import executor
+from aiogram.bot.api import TelegramAPIServer, TELEGRAM_PRODUCTION
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
-from aiogram.contrib.fsm_storage.memory import MemoryStorage
 from aiogram.dispatcher import FSMContext
 from aiogram.dispatcher.filters.state import State, StatesGroup
-from dotenv import load_dotenv
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Text, Index
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from contextlib import contextmanager
+from aiogram.utils.exceptions import MessageNotModified
+from sqlalchemy.exc import SQLAlchemyError
 import re
 
-# Загружаем токен из .env
-load_dotenv()
-BOT_TOKEN = os.getenv("BOT_TOKEN")
-DATABASE_URL = os.getenv("DATABASE_URL")
-
-# Настройка базы данных с пулом соединений
-Base = declarative_base()
-engine = create_engine(
-    DATABASE_URL,
-    pool_size=5,  # Размер пула соединений
-    max_overflow=10,  # Максимальное количество дополнительных соединений
-    pool_recycle=3600,  # Время жизни соединения в секундах (1 час)
-    pool_pre_ping=True  # Проверка соединений перед использованием
+from config import BOT_TOKEN, BOT_API_URL, BOT_MODE, THROTTLE_STORAGE, BOT_WORKERS, BOT_WORKER_ID, AUDIT_DRAIN_TIMEOUT
+from utils.auth import is_authorized, authorize, revoke, AuthMiddleware
+from utils.router import MessageRouter
+from utils.throttling import RateLimiter, ThrottlingMiddleware
+from utils.sender import MessageSender
+from utils.logs import setup_logging
+from utils.metrics import Gauge, STARTUP_SECONDS
+from utils.metrics_middleware import MetricsMiddleware
+from server.metrics import metrics_server
+from server.lifecycle import lifecycle, close_dispatcher, STOP_RECEIVING, DRAIN_QUEUES, CLOSE
+from utils.watchdog import loop_watchdog
+from utils.profiling import ProfilingMiddleware
+from database import (
+    run_db,
+    dispose,
+    init_engine,
+    QueryTimeout,
+    ensure_schema,
+    audit_writer,
+    partition_manager,
+    DBStorage,
+    create_storage,
+    save_person,
+    phone_exists,
+    normalize_phone,
+    search_persons,
+    get_logs_page,
+    get_audit_stats,
 )
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-# Модели данных
-class Person(Base):
-    __tablename__ = "persons"
-    
-    id = Column(Integer, primary_key=True, index=True)
-    fio = Column(String, nullable=False, index=True)  # Индекс для быстрого поиска
-    phone = Column(String, nullable=False, index=True, unique=True)  # Индекс и уникальность
-    birth = Column(String, nullable=False)
-    car_number = Column(String, nullable=True, index=True)  # Индекс для поиска
-    address = Column(Text, nullable=True)
-    passport = Column(String, nullable=True, index=True)  # Индекс для поиска
-    
-    # Составной индекс для поиска
-    __table_args__ = (
-        Index('idx_person_search', 'fio', 'phone'),
-    )
 
-class UserLog(Base):
-    __tablename__ = "user_logs"
-    
-    id = Column(Integer, primary_key=True, index=True)
-    timestamp = Column(DateTime, default=datetime.utcnow, index=True)  # Индекс для сортировки
-    user_id = Column(Integer, nullable=False, index=True)  # Индекс для фильтрации
-    username = Column(String, nullable=True)
-    action = Column(String, nullable=False, index=True)  # Индекс для фильтрации
-    details = Column(Text, nullable=True)
-    
-    # Составной индекс для частых запросов
-    __table_args__ = (
-        Index('idx_log_user_action', 'user_id', 'action', 'timestamp'),
-    )
+# Бот, диспетчер и их зависимости создает create_app(): импорт модуля не обращается
+# к БД и Bot API и не настраивает логирование
+bot = None
+storage = None
+dp = None
+sender = None
+limiter = None
+Gauge("bot_send_queue_depth", "Сообщения в очереди на отправку", function=lambda: sender.pending if sender is not None else 0)
+
+# Команды и кнопки вне диалогов: обработчик находится по таблице, доступ проверяется один раз
+router = MessageRouter()
 
-# Создаем таблицы
-Base.metadata.create_all(bind=engine)
-
-bot = Bot(token=BOT_TOKEN)
-storage = MemoryStorage()
-dp = Dispatcher(bot, storage=storage)
-
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('bot.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
 # Коды доступа для разных ролей
@@ -100,14 +78,6 @@ class SearchStates(StatesGroup):
 class CancelStates(StatesGroup):
     waiting_for_cancel = State()    # Состояние для отмены (не используется, но нужно для разделения)
 
-# Глобальные переменные для отслеживания авторизации
-authorized_users = set()  # Обычные пользователи
-authorized_admins = set()  # Администраторы
-authorized_usernames = set()  # Список имен пользователей, прошедших авторизацию
-
-# Словарь для хранения временных данных пользователей при добавлении записи
-user_temp_data = {}
-
 # Функция для красивого форматирования записи
 def format_record(record):
     """Форматирует запись в простом и чистом виде"""
@@ -124,190 +94,49 @@ def format_record(record):
     
     return result.rstrip()  # Убираем последний перенос строки
 
-# Функции для работы с базой данных
-@contextmanager
-def get_db_session():
-    """Контекстный менеджер для работы с сессией БД"""
-    db = SessionLocal()
-    try:
-        yield db
-        db.commit()
-    except Exception as e:
-        db.rollback()
-        logger.error(f"Ошибка в сессии БД: {e}")
-        raise
-    finally:
-        db.close()
-
-def load_database():
-    """Загружает все записи из базы данных"""
-    try:
-        with get_db_session() as db:
-            persons = db.query(Person).all()
-            return persons
-    except Exception as e:
-        logger.error(f"Ошибка загрузки базы данных: {e}")
-        return []
-
-def save_person(person_data):
-    """Сохраняет новую запись в базу данных"""
-    try:
-        with get_db_session() as db:
-            person = Person(**person_data)
-            db.add(person)
-            db.flush()  # Получаем ID без коммита
-            db.refresh(person)
-            logger.info(f"Запись успешно сохранена с ID: {person.id}")
-            return person
-    except Exception as e:
-        logger.error(f"Ошибка сохранения записи: {e}", exc_info=True)
-        return None
-
-def normalize_phone(phone):
-    """Нормализует телефон к формату 11 цифр"""
-    # Удаляем все нецифровые символы
-    digits = re.sub(r'\D', '', phone)
-    # Если начинается с 8, заменяем на 7
-    if len(digits) == 11 and digits.startswith('8'):
-        digits = '7' + digits[1:]
-    # Если начинается с +7 или просто 7, но меньше 11 цифр, добавляем недостающие
-    if len(digits) == 10:
-        digits = '7' + digits
-    return digits
-
-def normalize_query(query):
-    """Нормализует поисковый запрос"""
-    # Удаляем лишние пробелы, приводим к нижнему регистру
-    return ' '.join(query.strip().lower().split())
-
-def search_persons(query, limit=100):
-    """Улучшенный поиск записей по запросу с нормализацией"""
-    try:
-        query = query.strip()
-        if not query:
-            return []
+def split_search_results(persons):
+    """Формирует сообщения с результатами поиска (Telegram ограничивает длину 4096 символами)"""
+    MAX_MESSAGE_LENGTH = 4000  # Оставляем запас
+    messages = []
+    current_message = f"🔍 <b>Найдено результатов: {len(persons)}</b>\n\n"
+    for i, person in enumerate(persons, 1):
+        person_text = f"<b>Результат {i}:</b>\n{format_record(person)}\n\n"
         
-        # Проверяем, является ли запрос телефоном (много цифр)
-        digits_only = re.sub(r'\D', '', query)
-        
-        db = SessionLocal()
-        try:
-            # Всегда ищем по всем полям, но для цифровых запросов также нормализуем
-            persons_query = db.query(Person)
-            
-            # Для цифровых запросов (>=7 цифр) - ищем по телефону и паспорту
-            if len(digits_only) >= 7:
-                normalized_phone = normalize_phone(query)
-                logger.info(f"Поиск по телефону: оригинал='{query}', цифр={len(digits_only)}, нормализованный='{normalized_phone}'")
-                
-                # Ищем по нормализованному телефону, оригинальному запросу и цифрам
-                persons = persons_query.filter(
-                    Person.phone.contains(digits_only) |
-                    Person.phone.contains(normalized_phone) |
-                    Person.phone.contains(query) |
-                    Person.passport.contains(digits_only) |
-                    Person.passport.contains(query)
-                ).limit(limit).all()
-            else:
-                # Текстовый поиск по всем полям с регистронезависимым поиском
-                normalized_query = normalize_query(query)
-                logger.info(f"Текстовый поиск: оригинал='{query}', нормализованный='{normalized_query}'")
-                
-                persons = persons_query.filter(
-                    Person.fio.ilike(f'%{normalized_query}%') |
-                    Person.phone.contains(normalized_query) |
-                    Person.phone.contains(query) |
-                    Person.car_number.ilike(f'%{normalized_query}%') |
-                    Person.address.ilike(f'%{normalized_query}%') |
-                    Person.passport.contains(normalized_query) |
-                    Person.passport.contains(query)
-                ).limit(limit).all()
-            
-            logger.info(f"Найдено записей: {len(persons)}")
-            return persons
-        finally:
-            db.close()
-    except Exception as e:
-        logger.error(f"Ошибка поиска: {e}", exc_info=True)
-        return []
-
-# Инициализация базы данных
-try:
-    # Проверяем подключение к базе данных
-    from sqlalchemy import text
-    with engine.connect() as conn:
-        conn.execute(text("SELECT 1"))
-    logger.info("Подключение к базе данных успешно")
-except Exception as e:
-    logger.error(f"Ошибка подключения к базе данных: {e}")
-    logger.error("Бот будет работать с ограниченным функционалом")
+        # Если сообщение станет слишком длинным, начинаем новое
+        if len(current_message) + len(person_text) > MAX_MESSAGE_LENGTH:
+            messages.append(current_message)
+            current_message = f"<b>Продолжение (результаты {i}-{len(persons)}):</b>\n\n{person_text}"
+        else:
+            current_message += person_text
+    messages.append(current_message)
+    return messages
 
 # Функции для логирования
-def log_user_action(user_id, username, action, details=""):
-    """Записывает действие пользователя в лог"""
+async def log_user_action(user_id, username, action, details="", *args):
+    """
+    Записывает действие пользователя в лог. details — шаблон из database/actions.py,
+    args — его аргументы: в БД хранятся коды шаблона и действия, а не готовый текст
+    """
     # Не логируем события авторизации для уже авторизованных пользователей
     try:
-        normalized_username = (username or "").strip()
-        if action.startswith("AUTH") and (
-            user_id in authorized_users or
-            user_id in authorized_admins or
-            (normalized_username and normalized_username in authorized_usernames)
-        ):
+        if action.startswith("AUTH") and await is_authorized(user_id):
             return
     except Exception:
         # В случае любых сбоев проверки — не блокируем основное логирование
         pass
     
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    log_message = f"USER: {user_id} ({username}) | ACTION: {action} | DETAILS: {details}"
-    logger.info(log_message)
+    # Поля события попадают в JSON-лог отдельно, строка собирается только если запись будет выведена
+    text = details % args if args else details
+    logger.info(
+        "USER: %s (%s) | ACTION: %s | DETAILS: %s", user_id, username, action, text,
+        extra={"user_id": user_id, "username": username, "action": action, "details": text},
+    )
     
-    # Записываем в базу данных
-    try:
-        with get_db_session() as db:
-            log_entry = UserLog(
-                user_id=user_id,
-                username=username,
-                action=action,
-                details=details
-            )
-            db.add(log_entry)
-    except Exception as e:
-        logger.error(f"Ошибка записи в базу данных: {e}")
-
-def get_user_logs(limit=10):
-    """Получает последние логи пользователей"""
+    # Ставим запись в очередь: в базу данных она попадет пачкой в фоне
     try:
-        with get_db_session() as db:
-            logs = db.query(UserLog).order_by(UserLog.timestamp.desc()).limit(limit).all()
-            return [{
-                "timestamp": log.timestamp.strftime("%Y-%m-%d %H:%M:%S"),
-                "user_id": log.user_id,
-                "username": log.username,
-                "action": log.action,
-                "details": log.details
-            } for log in logs]
+        await audit_writer.log(user_id, username, action, details, *args)
     except Exception as e:
-        logger.error(f"Ошибка чтения логов: {e}")
-        return []
-
-def get_failed_auth_logs(limit=10):
-    """Получает только неудачные попытки авторизации"""
-    try:
-        with get_db_session() as db:
-            logs = db.query(UserLog).filter(
-                UserLog.action == 'AUTH_FAILED'
-            ).order_by(UserLog.timestamp.desc()).limit(limit).all()
-            return [{
-                "timestamp": log.timestamp.strftime("%Y-%m-%d %H:%M:%S"),
-                "user_id": log.user_id,
-                "username": log.username,
-                "action": log.action,
-                "details": log.details
-            } for log in logs]
-    except Exception as e:
-        logger.error(f"Ошибка чтения логов: {e}")
-        return []
+        logger.error("Ошибка записи в базу данных: %s", e)
 
 # Создаем клавиатуры
 def get_main_keyboard():
@@ -334,6 +163,10 @@ def get_admin_keyboard():
     )
     return keyboard
 
+def get_keyboard(role):
+    """Возвращает клавиатуру, соответствующую роли пользователя"""
+    return get_admin_keyboard() if role == "admin" else get_main_keyboard()
+
 def get_inline_keyboard():
     """Создает inline клавиатуру с быстрыми действиями"""
     keyboard = InlineKeyboardMarkup(
@@ -345,34 +178,86 @@ def get_inline_keyboard():
     )
     return keyboard
 
-# Функции проверки авторизации и ролей
-def is_authorized(user_id):
-    """Проверяет, авторизован ли пользователь (любая роль)"""
-    return user_id in authorized_users or user_id in authorized_admins
-
-def is_admin(user_id):
-    """Проверяет, является ли пользователь администратором"""
-    return user_id in authorized_admins
-
-def get_user_role(user_id):
-    """Возвращает роль пользователя"""
-    if user_id in authorized_admins:
-        return "admin"
-    elif user_id in authorized_users:
-        return "user"
+# Просмотр логов администраторами: страницы по (timestamp, id) с кнопками листания
+LOGS_PAGE_SIZE = 10
+EPOCH = datetime(1970, 1, 1)
+
+def encode_cursor(cursor):
+    """Кодирует курсор (timestamp, id) для callback_data"""
+    timestamp, log_id = cursor
+    return f"{(timestamp - EPOCH) // timedelta(microseconds=1)}:{log_id}"
+
+def decode_cursor(value):
+    """Восстанавливает курсор из callback_data"""
+    microseconds, log_id = value.split(":")
+    return EPOCH + timedelta(microseconds=int(microseconds)), int(log_id)
+
+def format_logs_page(page):
+    """Форматирует страницу неудачных попыток авторизации"""
+    log_text = "🚨 Неудачные попытки авторизации:\n\n"
+    for log in reversed(page["logs"]):  # Показываем в обратном порядке (новые снизу)
+        log_text += f"🕐 {log['timestamp']}\n"
+        log_text += f"👤 {log['username']} (ID: {log['user_id']})\n"
+        log_text += f"❌ {log['action']}\n"
+        if log['details']:
+            log_text += f"📝 {log['details']}\n"
+        log_text += "─" * 30 + "\n"
+    return log_text
+
+def get_logs_page_keyboard(page):
+    """Создает кнопки перехода к более новым и более старым записям"""
+    buttons = []
+    if page["has_newer"]:
+        buttons.append(InlineKeyboardButton(
+            text="⬅️ Новее", callback_data=f"logs:newer:{encode_cursor(page['logs'][0]['cursor'])}"))
+    if page["has_older"]:
+        buttons.append(InlineKeyboardButton(
+            text="Старее ➡️", callback_data=f"logs:older:{encode_cursor(page['logs'][-1]['cursor'])}"))
+    return InlineKeyboardMarkup(inline_keyboard=[buttons]) if buttons else None
+
+# Ответы, когда запрос к БД не уложился в срок (DB_STATEMENT_TIMEOUT, DB_SEARCH_TIMEOUT)
+SEARCH_TIMEOUT_TEXT = (
+    "⏳ <b>Поиск занял слишком много времени.</b>\n\n"
+    "Уточните запрос (например, полное ФИО или номер телефона) и попробуйте еще раз."
+)
+DB_TIMEOUT_TEXT = "⏳ База данных сейчас отвечает слишком долго. Попробуйте еще раз через минуту."
+# Ответ администратору, когда логи или сводку не удалось прочитать из БД
+DB_ERROR_TEXT = "❌ Не удалось получить данные из базы. Попробуйте еще раз позже."
+
+# Запрос к БД обработчика без своей обработки QueryTimeout: пользователь получает ответ, а не тишину
+async def query_timeout_handler(update: types.Update, error: QueryTimeout):
+    if update.callback_query is not None:
+        await update.callback_query.answer(DB_TIMEOUT_TEXT, show_alert=True)
+    elif update.message is not None:
+        await update.message.answer(DB_TIMEOUT_TEXT)
+    return True
+
+# Отказ в доступе к команде или кнопке: общий для всех маршрутов
+@router.access_denied
+async def access_denied(message: types.Message, role: str, route):
+    user_id = message.from_user.id
+    username = message.from_user.username or "Unknown"
+    
+    if role == "unauthorized":
+        if route.denied:
+            action, subject = route.denied
+            await log_user_action(user_id, username, action, "Попытка %s без авторизации", subject)
+        await message.answer("Доступ запрещен! Сначала введите код доступа через /start")
     else:
-        return "unauthorized"
+        if route.denied:
+            action, subject = route.denied
+            await log_user_action(user_id, username, action, "Попытка %s без прав администратора", subject)
+        await message.answer("🚫 Доступ запрещен! Эта команда доступна только администраторам.")
 
 # Команда /start
-@dp.message_handler(commands=["start"])
-async def start_cmd(message: types.Message):
+@router.command("start")
+async def start_cmd(message: types.Message, role: str):
     user_id = message.from_user.id
     username = message.from_user.username or "Unknown"
     
-    if is_authorized(user_id):
-        role = get_user_role(user_id)
+    if role != "unauthorized":
         if role == "admin":
-            log_user_action(user_id, username, "START_COMMAND", "Вход администратора")
+            await log_user_action(user_id, username, "START_COMMAND", "Вход администратора")
             help_text = """👑 Добро пожаловать, администратор!
 
 🤖 Бот для работы с базой данных
@@ -381,27 +266,25 @@ async def start_cmd(message: types.Message):
 Выберите действие с помощью кнопок ниже:"""
             await message.answer(help_text, reply_markup=get_admin_keyboard())
         else:
-            log_user_action(user_id, username, "START_COMMAND", "Вход обычного пользователя")
+            await log_user_action(user_id, username, "START_COMMAND", "Вход обычного пользователя")
             help_text = """🤖 Добро пожаловать в бот для работы с базой данных!
 
 Выберите действие с помощью кнопок ниже:"""
             await message.answer(help_text, reply_markup=get_main_keyboard())
     else:
-        log_user_action(user_id, username, "START_COMMAND", "Попытка входа без авторизации")
+        await log_user_action(user_id, username, "START_COMMAND", "Попытка входа без авторизации")
         await message.answer("Для доступа к боту требуется код авторизации.\n\nВведите код доступа:")
 
-# Глобальный обработчик проверки кода доступа
-@dp.message_handler(lambda message: not is_authorized(message.from_user.id) and not message.text.startswith('/'))
+# Глобальный обработчик проверки кода доступа: любой текст от неавторизованного пользователя, кроме команд
+@router.unauthorized_text
 async def check_access_code(message: types.Message):
     entered_code = message.text.strip()
     user_id = message.from_user.id
     username = message.from_user.username or "Unknown"
     
     if entered_code == USER_ACCESS_CODE:
-        authorized_users.add(user_id)
-        if username:
-            authorized_usernames.add(username)
-        log_user_action(user_id, username, "AUTH_SUCCESS", f"Успешная авторизация пользователя с кодом: {entered_code}")
+        await authorize(user_id, username, "user")
+        await log_user_action(user_id, username, "AUTH_SUCCESS", "Успешная авторизация пользователя с кодом: %s", entered_code)
         help_text = """✅ Код доступа принят! Добро пожаловать!
 
 🤖 Добро пожаловать в бот для работы с базой данных!
@@ -409,10 +292,8 @@ async def check_access_code(message: types.Message):
 Выберите действие с помощью кнопок ниже:"""
         await message.answer(help_text, reply_markup=get_main_keyboard())
     elif entered_code == ADMIN_ACCESS_CODE:
-        authorized_admins.add(user_id)
-        if username:
-            authorized_usernames.add(username)
-        log_user_action(user_id, username, "AUTH_SUCCESS", f"Успешная авторизация администратора с кодом: {entered_code}")
+        await authorize(user_id, username, "admin")
+        await log_user_action(user_id, username, "AUTH_SUCCESS", "Успешная авторизация администратора с кодом: %s", entered_code)
         help_text = """👑 Код администратора принят! Добро пожаловать!
 
 🤖 Бот для работы с базой данных
@@ -421,15 +302,13 @@ async def check_access_code(message: types.Message):
 Выберите действие с помощью кнопок ниже:"""
         await message.answer(help_text, reply_markup=get_admin_keyboard())
     else:
-        log_user_action(user_id, username, "AUTH_FAILED", f"Неверный код: {entered_code}")
+        await limiter.register_failed_auth(user_id)
+        await log_user_action(user_id, username, "AUTH_FAILED", "Неверный код: %s", entered_code)
         await message.answer("Неверный код доступа. Попробуйте еще раз:")
 
 # Обработчики кнопок
-@dp.message_handler(lambda message: message.text == "🔍 Поиск")
-async def search_button_handler(message: types.Message, state: FSMContext):
-    if not is_authorized(message.from_user.id):
-        await message.answer("Доступ запрещен! Сначала введите код доступа через /start")
-        return
+@router.text("🔍 Поиск", access="user")
+async def search_button_handler(message: types.Message):
     await SearchStates.waiting_for_query.set()
     await message.answer(
         "🔍 <b>Поиск в базе данных</b>\n\n"
@@ -437,91 +316,76 @@ async def search_button_handler(message: types.Message, state: FSMContext):
         parse_mode='HTML'
     )
 
-@dp.message_handler(state=SearchStates.waiting_for_query)
-async def process_search_query(message: types.Message, state: FSMContext):
+async def process_search_query(message: types.Message, state: FSMContext, role: str):
     user_id = message.from_user.id
     username = message.from_user.username or "Unknown"
+    # Основная клавиатура возвращается вместе с последним сообщением ответа
+    keyboard = get_keyboard(role)
 
     try:
         # Отмена поиска через команду /start
         if message.text == "/start":
-            role = get_user_role(user_id)
-            keyboard = get_admin_keyboard() if role == "admin" else get_main_keyboard()
-            await message.answer("Поиск отменён.", reply_markup=keyboard)
-            await state.finish()
+            sender.send(message.chat.id, "Поиск отменён.", reply_markup=keyboard)
             return
 
         query = message.text.strip()
         if not query:
-            await message.answer("Введите непустой запрос")
+            sender.send(message.chat.id, "Введите непустой запрос", reply_markup=keyboard)
             return
 
-        logger.info(f"Поиск запроса от пользователя {user_id}: {query}")
+        logger.info("Поиск запроса от пользователя %s: %s", user_id, query)
 
         # Выполняем поиск с ограничением
-        persons = search_persons(query, limit=50)  # Ограничиваем результаты
+        persons = await run_db(search_persons, query, limit=50)  # Ограничиваем результаты
         
-        logger.info(f"Найдено результатов: {len(persons) if persons else 0}")
+        logger.info("Найдено результатов: %s", len(persons) if persons else 0)
         
         if persons:
-            log_user_action(user_id, username, "SEARCH_SUCCESS", f"Найдено {len(persons)} результатов по запросу: {query}")
-            
-            # Формируем сообщения с пагинацией (Telegram ограничение 4096 символов)
-            MAX_MESSAGE_LENGTH = 4000  # Оставляем запас
-            result_message = f"🔍 <b>Найдено результатов: {len(persons)}</b>\n\n"
-            
-            current_message = result_message
-            for i, person in enumerate(persons, 1):
-                person_text = f"<b>Результат {i}:</b>\n{format_record(person)}\n\n"
-                
-                # Если сообщение станет слишком длинным, отправляем текущее и начинаем новое
-                if len(current_message) + len(person_text) > MAX_MESSAGE_LENGTH:
-                    await message.answer(current_message, parse_mode='HTML')
-                    current_message = f"<b>Продолжение (результаты {i}-{len(persons)}):</b>\n\n{person_text}"
-                else:
-                    current_message += person_text
+            await log_user_action(user_id, username, "SEARCH_SUCCESS", "Найдено %s результатов по запросу: %s", len(persons), query)
             
-            # Отправляем последнее сообщение
-            await message.answer(current_message, parse_mode='HTML')
+            # Результаты уходят через очередь отправки, обработчик не ждет доставки
+            *results, last = split_search_results(persons)
+            if results:
+                sender.send_many(message.chat.id, results, parse_mode='HTML')
+            sender.send(message.chat.id, last, parse_mode='HTML', reply_markup=keyboard)
         else:
-            log_user_action(user_id, username, "SEARCH_NO_RESULTS", f"Ничего не найдено по запросу: {query}")
-            await message.answer(
+            await log_user_action(user_id, username, "SEARCH_NO_RESULTS", "Ничего не найдено по запросу: %s", query)
+            sender.send(
+                message.chat.id,
                 "🔍 <b>Ничего не найдено</b>\n\n"
                 "<i>Попробуйте изменить поисковый запрос или использовать часть слова</i>",
-                parse_mode='HTML'
+                parse_mode='HTML',
+                reply_markup=keyboard
             )
+    except QueryTimeout:
+        sender.send(message.chat.id, SEARCH_TIMEOUT_TEXT, parse_mode='HTML', reply_markup=keyboard)
     except Exception as e:
-        logger.error(f"Ошибка при обработке поискового запроса: {e}", exc_info=True)
-        await message.answer(
+        logger.error("Ошибка при обработке поискового запроса: %s", e, exc_info=True)
+        sender.send(
+            message.chat.id,
             "❌ <b>Произошла ошибка при поиске.</b>\n\n"
             "Пожалуйста, попробуйте еще раз.",
-            parse_mode='HTML'
+            parse_mode='HTML',
+            reply_markup=keyboard
         )
     finally:
-        # Завершаем состояние и возвращаем основную клавиатуру
+        # Завершаем состояние поиска
         try:
-            role = get_user_role(user_id)
-            keyboard = get_admin_keyboard() if role == "admin" else get_main_keyboard()
             await state.finish()
-            await message.answer(" ", reply_markup=keyboard)
         except Exception as e:
-            logger.error(f"Ошибка при завершении состояния поиска: {e}")
+            logger.error("Ошибка при завершении состояния поиска: %s", e)
 
-@dp.message_handler(lambda message: message.text == "➕ Добавить")
+@router.text("➕ Добавить", access="user")
 async def add_button_handler(message: types.Message, state: FSMContext):
     user_id = message.from_user.id
     username = message.from_user.username or "Unknown"
     
-    if not is_authorized(user_id):
-        await message.answer("Доступ запрещен! Сначала введите код доступа через /start")
-        return
-    
     # Инициализируем временные данные пользователя
-    user_temp_data[user_id] = {}
+    await state.set_data({})
     
     # Запускаем процесс добавления
     await AddPersonStates.waiting_for_fio.set()
-    log_user_action(user_id, username, "ADD_START", "Начало пошагового добавления записи")
+    await log_user_action(user_id, username, "ADD_START", "Начало пошагового добавления записи")
     
     # Создаем клавиатуру с кнопкой отмены
     cancel_keyboard = ReplyKeyboardMarkup(
@@ -539,14 +403,13 @@ async def add_button_handler(message: types.Message, state: FSMContext):
     )
 
 # Обработчик для ввода ФИО
-@dp.message_handler(state=AddPersonStates.waiting_for_fio)
-async def process_fio(message: types.Message, state: FSMContext):
+async def process_fio(message: types.Message, state: FSMContext, role: str):
     user_id = message.from_user.id
     username = message.from_user.username or "Unknown"
     
     # Проверяем, не нажал ли пользователь "Отмена"
     if message.text == "❌ Отмена":
-        await cancel_add_process(message, state, user_id, username)
+        await cancel_add_process(message, state, user_id, username, role)
         return
     
     fio = message.text.strip()
@@ -581,7 +444,7 @@ async def process_fio(message: types.Message, state: FSMContext):
         return
     
     # Сохраняем ФИО во временные данные
-    user_temp_data[user_id]['fio'] = fio
+    await state.update_data(fio=fio)
     
     # Переходим к следующему шагу
     await AddPersonStates.waiting_for_phone.set()
@@ -593,14 +456,13 @@ async def process_fio(message: types.Message, state: FSMContext):
     )
 
 # Обработчик для ввода телефона
-@dp.message_handler(state=AddPersonStates.waiting_for_phone)
-async def process_phone(message: types.Message, state: FSMContext):
+async def process_phone(message: types.Message, state: FSMContext, role: str):
     user_id = message.from_user.id
     username = message.from_user.username or "Unknown"
     
     # Проверяем, не нажал ли пользователь "Отмена"
     if message.text == "❌ Отмена":
-        await cancel_add_process(message, state, user_id, username)
+        await cancel_add_process(message, state, user_id, username, role)
         return
     
     phone = message.text.strip()
@@ -632,23 +494,21 @@ async def process_phone(message: types.Message, state: FSMContext):
     
     # Проверяем, нет ли дубликатов
     try:
-        with get_db_session() as db:
-            existing_person = db.query(Person).filter(Person.phone == normalized_phone).first()
-            if existing_person:
-                await message.answer(
-                    f"❌ <b>Ошибка:</b> Запись с телефоном {normalized_phone} уже существует!\n\n"
-                    "🔄 <i>Попробуйте другой номер:</i>",
-                    parse_mode='HTML'
-                )
-                return
+        if await run_db(phone_exists, normalized_phone):
+            await message.answer(
+                f"❌ <b>Ошибка:</b> Запись с телефоном {normalized_phone} уже существует!\n\n"
+                "🔄 <i>Попробуйте другой номер:</i>",
+                parse_mode='HTML'
+            )
+            return
     except Exception as e:
-        logger.error(f"Ошибка проверки дубликатов: {e}")
+        logger.error("Ошибка проверки дубликатов: %s", e)
     
     # Сохраняем нормализованный телефон
     phone = normalized_phone
     
     # Сохраняем телефон во временные данные
-    user_temp_data[user_id]['phone'] = phone
+    await state.update_data(phone=phone)
     
     # Переходим к следующему шагу
     await AddPersonStates.waiting_for_birth.set()
@@ -660,14 +520,13 @@ async def process_phone(message: types.Message, state: FSMContext):
     )
 
 # Обработчик для ввода даты рождения
-@dp.message_handler(state=AddPersonStates.waiting_for_birth)
-async def process_birth(message: types.Message, state: FSMContext):
+async def process_birth(message: types.Message, state: FSMContext, role: str):
     user_id = message.from_user.id
     username = message.from_user.username or "Unknown"
     
     # Проверяем, не нажал ли пользователь "Отмена"
     if message.text == "❌ Отмена":
-        await cancel_add_process(message, state, user_id, username)
+        await cancel_add_process(message, state, user_id, username, role)
         return
     
     birth = message.text.strip()
@@ -709,7 +568,7 @@ async def process_birth(message: types.Message, state: FSMContext):
         return
     
     # Сохраняем дату рождения во временные данные
-    user_temp_data[user_id]['birth'] = birth
+    await state.update_data(birth=birth)
     
     # Переходим к следующему шагу
     await AddPersonStates.waiting_for_car.set()
@@ -722,14 +581,13 @@ async def process_birth(message: types.Message, state: FSMContext):
     )
 
 # Обработчик для ввода номера автомобиля
-@dp.message_handler(state=AddPersonStates.waiting_for_car)
-async def process_car(message: types.Message, state: FSMContext):
+async def process_car(message: types.Message, state: FSMContext, role: str):
     user_id = message.from_user.id
     username = message.from_user.username or "Unknown"
     
     # Проверяем, не нажал ли пользователь "Отмена"
     if message.text == "❌ Отмена":
-        await cancel_add_process(message, state, user_id, username)
+        await cancel_add_process(message, state, user_id, username, role)
         return
     
     car_number = message.text.strip()
@@ -739,7 +597,7 @@ async def process_car(message: types.Message, state: FSMContext):
         car_number = ""
     
     # Сохраняем номер автомобиля во временные данные
-    user_temp_data[user_id]['car_number'] = car_number
+    await state.update_data(car_number=car_number)
     
     # Переходим к следующему шагу
     await AddPersonStates.waiting_for_address.set()
@@ -752,14 +610,13 @@ async def process_car(message: types.Message, state: FSMContext):
     )
 
 # Обработчик для ввода адреса
-@dp.message_handler(state=AddPersonStates.waiting_for_address)
-async def process_address(message: types.Message, state: FSMContext):
+async def process_address(message: types.Message, state: FSMContext, role: str):
     user_id = message.from_user.id
     username = message.from_user.username or "Unknown"
     
     # Проверяем, не нажал ли пользователь "Отмена"
     if message.text == "❌ Отмена":
-        await cancel_add_process(message, state, user_id, username)
+        await cancel_add_process(message, state, user_id, username, role)
         return
     
     address = message.text.strip()
@@ -769,7 +626,7 @@ async def process_address(message: types.Message, state: FSMContext):
         address = ""
     
     # Сохраняем адрес во временные данные
-    user_temp_data[user_id]['address'] = address
+    await state.update_data(address=address)
     
     # Переходим к следующему шагу
     await AddPersonStates.waiting_for_passport.set()
@@ -782,14 +639,13 @@ async def process_address(message: types.Message, state: FSMContext):
     )
 
 # Обработчик для ввода паспорта
-@dp.message_handler(state=AddPersonStates.waiting_for_passport)
-async def process_passport(message: types.Message, state: FSMContext):
+async def process_passport(message: types.Message, state: FSMContext, role: str):
     user_id = message.from_user.id
     username = message.from_user.username or "Unknown"
     
     # Проверяем, не нажал ли пользователь "Отмена"
     if message.text == "❌ Отмена":
-        await cancel_add_process(message, state, user_id, username)
+        await cancel_add_process(message, state, user_id, username, role)
         return
     
     passport = message.text.strip()
@@ -799,29 +655,27 @@ async def process_passport(message: types.Message, state: FSMContext):
         passport = ""
     
     # Сохраняем паспорт во временные данные
-    user_temp_data[user_id]['passport'] = passport
+    await state.update_data(passport=passport)
     
     # Завершаем процесс добавления
-    await finish_add_process(message, state, user_id, username)
+    await finish_add_process(message, state, user_id, username, role)
 
 # Функция для завершения процесса добавления
-async def finish_add_process(message: types.Message, state: FSMContext, user_id: int, username: str):
+async def finish_add_process(message: types.Message, state: FSMContext, user_id: int, username: str, role: str):
     """Завершает процесс добавления записи"""
     try:
         # Получаем данные пользователя
-        temp_data = user_temp_data.get(user_id, {})
+        temp_data = await state.get_data()
         
         # Проверяем обязательные поля
         if not temp_data.get('fio') or not temp_data.get('phone') or not temp_data.get('birth'):
-            log_user_action(user_id, username, "ADD_ERROR", "Отсутствуют обязательные поля")
+            await log_user_action(user_id, username, "ADD_ERROR", "Отсутствуют обязательные поля")
             await message.answer(
                 "❌ <b>Ошибка:</b> Отсутствуют обязательные данные.\n\n"
                 "Пожалуйста, начните добавление заново.",
                 parse_mode='HTML'
             )
             # Очищаем временные данные и состояние
-            if user_id in user_temp_data:
-                del user_temp_data[user_id]
             await state.finish()
             return
         
@@ -835,35 +689,38 @@ async def finish_add_process(message: types.Message, state: FSMContext, user_id:
             "passport": temp_data.get('passport', '') or None
         }
         
-        logger.info(f"Попытка сохранения записи для пользователя {user_id}: {new_record}")
+        logger.info("Попытка сохранения записи для пользователя %s: %s", user_id, new_record)
         
         # Сохраняем в базу данных
-        saved_person = save_person(new_record)
+        saved_person = await run_db(save_person, new_record)
         if saved_person:
-            log_user_action(user_id, username, "ADD_SUCCESS", f"Добавлена запись: {new_record['fio']}, {new_record['phone']}, {new_record['birth']}")
+            await log_user_action(user_id, username, "ADD_SUCCESS", "Добавлена запись: %s, %s, %s", new_record['fio'], new_record['phone'], new_record['birth'])
             
             # Формируем красивое сообщение с результатом
             result_message = "🎉 <b>Запись успешно добавлена!</b>\n\n"
             result_message += format_record(saved_person)
             
             # Возвращаем основную клавиатуру
-            role = get_user_role(user_id)
-            if role == "admin":
-                keyboard = get_admin_keyboard()
-            else:
-                keyboard = get_main_keyboard()
-            
-            await message.answer(result_message, reply_markup=keyboard, parse_mode='HTML')
+            await message.answer(result_message, reply_markup=get_keyboard(role), parse_mode='HTML')
         else:
-            log_user_action(user_id, username, "ADD_ERROR", "Ошибка при сохранении данных")
+            await log_user_action(user_id, username, "ADD_ERROR", "Ошибка при сохранении данных")
             await message.answer(
                 "❌ <b>Ошибка при сохранении данных.</b>\n\n"
                 "Пожалуйста, попробуйте еще раз или обратитесь к администратору.",
                 parse_mode='HTML'
             )
+    except QueryTimeout:
+        # Прерванная транзакция откатывается: запись не сохранена, ее можно добавить заново
+        await log_user_action(user_id, username, "ADD_ERROR", "Ошибка при сохранении данных")
+        await message.answer(
+            "⏳ <b>Сохранение заняло слишком много времени, запись не добавлена.</b>\n\n"
+            "Пожалуйста, попробуйте еще раз через минуту.",
+            reply_markup=get_keyboard(role),
+            parse_mode='HTML'
+        )
     except Exception as e:
-        logger.error(f"Критическая ошибка при завершении добавления записи: {e}", exc_info=True)
-        log_user_action(user_id, username, "ADD_ERROR", f"Критическая ошибка: {str(e)}")
+        logger.error("Критическая ошибка при завершении добавления записи: %s", e, exc_info=True)
+        await log_user_action(user_id, username, "ADD_ERROR", "Критическая ошибка: %s", str(e))
         await message.answer(
             "❌ <b>Произошла ошибка при сохранении данных.</b>\n\n"
             "Пожалуйста, попробуйте еще раз.",
@@ -871,80 +728,49 @@ async def finish_add_process(message: types.Message, state: FSMContext, user_id:
         )
     finally:
         # Очищаем временные данные и состояние
-        if user_id in user_temp_data:
-            del user_temp_data[user_id]
         try:
             await state.finish()
         except:
             pass
 
 # Функция для отмены процесса добавления
-async def cancel_add_process(message: types.Message, state: FSMContext, user_id: int, username: str):
+async def cancel_add_process(message: types.Message, state: FSMContext, user_id: int, username: str, role: str):
     """Отменяет процесс добавления записи"""
-    log_user_action(user_id, username, "ADD_CANCELLED", "Отмена добавления записи")
-    
-    # Очищаем временные данные
-    if user_id in user_temp_data:
-        del user_temp_data[user_id]
+    await log_user_action(user_id, username, "ADD_CANCELLED", "Отмена добавления записи")
     
     # Возвращаем основную клавиатуру
-    role = get_user_role(user_id)
-    if role == "admin":
-        keyboard = get_admin_keyboard()
-    else:
-        keyboard = get_main_keyboard()
-    
-    await message.answer("❌ <b>Добавление записи отменено.</b>", reply_markup=keyboard, parse_mode='HTML')
+    await message.answer("❌ <b>Добавление записи отменено.</b>", reply_markup=get_keyboard(role), parse_mode='HTML')
     await state.finish()
 
-@dp.message_handler(lambda message: message.text == "📚 Документация")
+@router.text("📚 Документация", access="user")
 async def help_button_handler(message: types.Message):
-    if not is_authorized(message.from_user.id):
-        await message.answer("Доступ запрещен! Сначала введите код доступа через /start")
-        return
     help_text = """📚 Документация по боту:
 Справка: Тут будет информация о боте"""
     await message.answer(help_text)
 
-@dp.message_handler(lambda message: message.text == "📊 Логи")
+@router.text("📊 Логи", access="admin", denied=("LOGS_BUTTON", "просмотра логов"))
 async def logs_button_handler(message: types.Message):
     user_id = message.from_user.id
     username = message.from_user.username or "Unknown"
     
-    if not is_authorized(user_id):
-        log_user_action(user_id, username, "LOGS_BUTTON", "Попытка просмотра логов без авторизации")
-        await message.answer("Доступ запрещен! Сначала введите код доступа через /start")
-        return
+    await log_user_action(user_id, username, "LOGS_BUTTON", "Просмотр логов через кнопку (админ)")
     
-    if not is_admin(user_id):
-        log_user_action(user_id, username, "LOGS_BUTTON", "Попытка просмотра логов без прав администратора")
-        await message.answer("🚫 Доступ запрещен! Эта функция доступна только администраторам.")
+    try:
+        page = await run_db(get_logs_page, limit=LOGS_PAGE_SIZE)  # Только неудачные авторизации
+    except SQLAlchemyError as e:
+        logger.error("Ошибка чтения логов: %s", e, exc_info=True)
+        sender.send(message.chat.id, DB_ERROR_TEXT)
         return
     
-    log_user_action(user_id, username, "LOGS_BUTTON", "Просмотр логов через кнопку (админ)")
-    
-    logs = get_failed_auth_logs(10)  # Только неудачные авторизации
-    
-    if not logs:
-        await message.answer("🔒 Неудачных попыток авторизации не найдено")
+    # Ответы уходят через очередь отправки, обработчик не ждет доставки
+    if not page["logs"]:
+        sender.send(message.chat.id, "🔒 Неудачных попыток авторизации не найдено")
         return
     
-    log_text = "🚨 Неудачные попытки авторизации:\n\n"
-    for log in reversed(logs):  # Показываем в обратном порядке (новые сверху)
-        log_text += f"🕐 {log['timestamp']}\n"
-        log_text += f"👤 {log['username']} (ID: {log['user_id']})\n"
-        log_text += f"❌ {log['action']}\n"
-        if log['details']:
-            log_text += f"📝 {log['details']}\n"
-        log_text += "─" * 30 + "\n"
-    
-    await message.answer(log_text)
+    sender.send(message.chat.id, format_logs_page(page), reply_markup=get_logs_page_keyboard(page))
 
-@dp.message_handler(lambda message: message.text == "📋 Список команд")
+@router.text("📋 Список команд", access="user")
 async def commands_button_handler(message: types.Message):
-    if not is_authorized(message.from_user.id):
-        await message.answer("Доступ запрещен! Сначала введите код доступа через /start")
-        return
     commands_text = """📋 Доступные команды:
 
 🔍 Поиск - найти запись по имени, телефону, номеру авто, адресу или паспорту
@@ -976,17 +802,12 @@ async def commands_button_handler(message: types.Message):
     await message.answer(commands_text)
 
 # Команда /find
-@dp.message_handler(commands=["find"])
+@router.command("find", access="user", denied=("FIND_COMMAND", "поиска"))
 async def find_cmd(message: types.Message):
     user_id = message.from_user.id
     username = message.from_user.username or "Unknown"
     
     try:
-        if not is_authorized(user_id):
-            log_user_action(user_id, username, "FIND_COMMAND", "Попытка поиска без авторизации")
-            await message.answer("Доступ запрещен! Сначала введите код доступа через /start")
-            return
-        
         query = message.get_args().strip()
         if not query:
             # Переводим в состояние ожидания запроса, если аргумент не указан
@@ -997,65 +818,49 @@ async def find_cmd(message: types.Message):
             )
             return
 
-        logger.info(f"Команда /find от пользователя {user_id}: {query}")
+        logger.info("Команда /find от пользователя %s: %s", user_id, query)
 
         # Выполняем поиск с ограничением
-        persons = search_persons(query, limit=50)  # Ограничиваем результаты
+        persons = await run_db(search_persons, query, limit=50)  # Ограничиваем результаты
         
-        logger.info(f"Результат поиска: найдено {len(persons) if persons else 0} записей")
+        logger.info("Результат поиска: найдено %s записей", len(persons) if persons else 0)
         
         if persons:
-            log_user_action(user_id, username, "SEARCH_SUCCESS", f"Найдено {len(persons)} результатов по запросу: {query}")
+            await log_user_action(user_id, username, "SEARCH_SUCCESS", "Найдено %s результатов по запросу: %s", len(persons), query)
             
-            # Формируем сообщения с пагинацией (Telegram ограничение 4096 символов)
-            MAX_MESSAGE_LENGTH = 4000  # Оставляем запас
-            result_message = f"🔍 <b>Найдено результатов: {len(persons)}</b>\n\n"
-            
-            current_message = result_message
-            for i, person in enumerate(persons, 1):
-                person_text = f"<b>Результат {i}:</b>\n{format_record(person)}\n\n"
-                
-                # Если сообщение станет слишком длинным, отправляем текущее и начинаем новое
-                if len(current_message) + len(person_text) > MAX_MESSAGE_LENGTH:
-                    await message.answer(current_message, parse_mode='HTML')
-                    current_message = f"<b>Продолжение (результаты {i}-{len(persons)}):</b>\n\n{person_text}"
-                else:
-                    current_message += person_text
-            
-            # Отправляем последнее сообщение
-            await message.answer(current_message, parse_mode='HTML')
+            # Результаты уходят через очередь отправки, обработчик не ждет доставки
+            sender.send_many(message.chat.id, split_search_results(persons), parse_mode='HTML')
         else:
-            log_user_action(user_id, username, "SEARCH_NO_RESULTS", f"Ничего не найдено по запросу: {query}")
-            await message.answer(
+            await log_user_action(user_id, username, "SEARCH_NO_RESULTS", "Ничего не найдено по запросу: %s", query)
+            sender.send(
+                message.chat.id,
                 "🔍 <b>Ничего не найдено</b>\n\n"
                 "<i>Попробуйте изменить поисковый запрос или использовать часть слова</i>",
                 parse_mode='HTML'
             )
+    except QueryTimeout:
+        sender.send(message.chat.id, SEARCH_TIMEOUT_TEXT, parse_mode='HTML')
     except Exception as e:
-        logger.error(f"Ошибка в команде /find: {e}", exc_info=True)
-        await message.answer(
+        logger.error("Ошибка в команде /find: %s", e, exc_info=True)
+        sender.send(
+            message.chat.id,
             "❌ <b>Произошла ошибка при поиске.</b>\n\n"
             "Пожалуйста, попробуйте еще раз.",
             parse_mode='HTML'
         )
 
 # Команда /add (теперь запускает пошаговый процесс)
-@dp.message_handler(commands=["add"])
+@router.command("add", access="user", denied=("ADD_COMMAND", "добавления"))
 async def add_cmd(message: types.Message, state: FSMContext):
     user_id = message.from_user.id
     username = message.from_user.username or "Unknown"
     
-    if not is_authorized(user_id):
-        log_user_action(user_id, username, "ADD_COMMAND", "Попытка добавления без авторизации")
-        await message.answer("Доступ запрещен! Сначала введите код доступа через /start")
-        return
-    
     # Инициализируем временные данные пользователя
-    user_temp_data[user_id] = {}
+    await state.set_data({})
     
     # Запускаем процесс добавления
     await AddPersonStates.waiting_for_fio.set()
-    log_user_action(user_id, username, "ADD_START", "Начало пошагового добавления записи через команду")
+    await log_user_action(user_id, username, "ADD_START", "Начало пошагового добавления записи через команду")
     
     # Создаем клавиатуру с кнопкой отмены
     cancel_keyboard = ReplyKeyboardMarkup(
@@ -1073,63 +878,259 @@ async def add_cmd(message: types.Message, state: FSMContext):
     )
 
 # Команда /help
-@dp.message_handler(commands=["info"])
+@router.command("info", access="user")
 async def help_cmd(message: types.Message):
-    if not is_authorized(message.from_user.id):
-        await message.answer("Доступ запрещен! Сначала введите код доступа через /start")
-        return
     help_text = """Справка: Тут будет информация о боте"""
     await message.answer(help_text)
 
 # Команда для просмотра логов (только для админов)
-@dp.message_handler(commands=["logs"])
+@router.command("logs", access="admin", denied=("LOGS_COMMAND", "просмотра логов"))
 async def logs_cmd(message: types.Message):
     user_id = message.from_user.id
     username = message.from_user.username or "Unknown"
     
-    if not is_authorized(user_id):
-        log_user_action(user_id, username, "LOGS_COMMAND", "Попытка просмотра логов без авторизации")
-        await message.answer("Доступ запрещен! Сначала введите код доступа через /start")
+    await log_user_action(user_id, username, "LOGS_COMMAND", "Просмотр логов неудачных авторизаций (админ)")
+    
+    try:
+        page = await run_db(get_logs_page, limit=LOGS_PAGE_SIZE)  # Только неудачные авторизации
+    except SQLAlchemyError as e:
+        logger.error("Ошибка чтения логов: %s", e, exc_info=True)
+        sender.send(message.chat.id, DB_ERROR_TEXT)
         return
     
-    if not is_admin(user_id):
-        log_user_action(user_id, username, "LOGS_COMMAND", "Попытка просмотра логов без прав администратора")
-        await message.answer("🚫 Доступ запрещен! Эта команда доступна только администраторам.")
+    # Ответы уходят через очередь отправки, обработчик не ждет доставки
+    if not page["logs"]:
+        sender.send(message.chat.id, "🔒 Неудачных попыток авторизации не найдено")
         return
     
-    log_user_action(user_id, username, "LOGS_COMMAND", "Просмотр логов неудачных авторизаций (админ)")
+    sender.send(message.chat.id, format_logs_page(page), reply_markup=get_logs_page_keyboard(page))
+
+# Листание страниц логов
+async def logs_page_callback(call: types.CallbackQuery, role: str):
+    if role != "admin":
+        await call.answer("🚫 Доступ запрещен!", show_alert=True)
+        return
     
-    logs = get_failed_auth_logs(10)  # Только неудачные авторизации
+    _, direction, value = call.data.split(":", 2)
+    cursor = decode_cursor(value)
+    try:
+        if direction == "older":
+            page = await run_db(get_logs_page, before=cursor, limit=LOGS_PAGE_SIZE)
+        else:
+            page = await run_db(get_logs_page, after=cursor, limit=LOGS_PAGE_SIZE)
+    except SQLAlchemyError as e:
+        logger.error("Ошибка чтения страницы логов: %s", e, exc_info=True)
+        await call.answer(DB_ERROR_TEXT, show_alert=True)
+        return
     
-    if not logs:
-        await message.answer("🔒 Неудачных попыток авторизации не найдено")
+    if not page["logs"]:
+        await call.answer("Больше записей нет")
         return
     
-    log_text = "🚨 Неудачные попытки авторизации:\n\n"
-    for log in reversed(logs):  # Показываем в обратном порядке (новые сверху)
-        log_text += f"🕐 {log['timestamp']}\n"
-        log_text += f"👤 {log['username']} (ID: {log['user_id']})\n"
-        log_text += f"❌ {log['action']}\n"
-        if log['details']:
-            log_text += f"📝 {log['details']}\n"
-        log_text += "─" * 30 + "\n"
+    # Страница меняется в том же сообщении и не проходит через очередь отправки: ответ на нажатие
+    # кнопки нужен сразу. Кнопка перестает показывать загрузку, даже если сообщение не удалось изменить
+    try:
+        await call.message.edit_text(format_logs_page(page), reply_markup=get_logs_page_keyboard(page))
+    except MessageNotModified:
+        pass
+    finally:
+        await call.answer()
+
+# Команда для просмотра сводки по логам (только для админов)
+@router.command("stats", access="admin")
+async def stats_cmd(message: types.Message):
+    user_id = message.from_user.id
+    username = message.from_user.username or "Unknown"
+    
+    await log_user_action(user_id, username, "STATS_COMMAND", "Просмотр сводки по логам (админ)")
+    
+    try:
+        stats = await run_db(get_audit_stats)
+    except SQLAlchemyError as e:
+        logger.error("Ошибка чтения сводки по логам: %s", e, exc_info=True)
+        sender.send(message.chat.id, DB_ERROR_TEXT)
+        return
     
-    await message.answer(log_text)
+    stats_text = "📈 Действия за 7 дней:\n\n"
+    current_day = None
+    for day, action, count in stats["daily"]:
+        if day != current_day:
+            stats_text += f"📅 {day}\n"
+            current_day = day
+        stats_text += f"  • {action}: {count}\n"
+    if not stats["daily"]:
+        stats_text += "Нет данных\n"
+    
+    stats_text += "\n🚨 Неудачные авторизации за 24 часа:\n\n"
+    for failed_user_id, count in stats["failed_by_user"]:
+        stats_text += f"👤 ID {failed_user_id}: {count}\n"
+    if not stats["failed_by_user"]:
+        stats_text += "Нет данных\n"
+    
+    sender.send(message.chat.id, stats_text)
+
+# Команда для отзыва сессии пользователя (только для админов)
+@router.command("revoke", access="admin")
+async def revoke_cmd(message: types.Message):
+    user_id = message.from_user.id
+    username = message.from_user.username or "Unknown"
+    
+    target = message.get_args().strip()
+    if not target.isdigit():
+        await message.answer("Используй: /revoke <ID пользователя>")
+        return
+    
+    if await revoke(int(target)):
+        await log_user_action(user_id, username, "REVOKE_COMMAND", "Отозвана сессия пользователя %s", target)
+        await message.answer(f"✅ Сессия пользователя {target} отозвана")
+    else:
+        await message.answer(f"Активной сессии пользователя {target} не найдено")
 
 # Обработчик любого произвольного текста вне состояний — выводит подсказку, не выполняя поиск
-@dp.message_handler(content_types=["text"], state=None)
-async def unknown_text_handler(message: types.Message):
+@router.default
+async def unknown_text_handler(message: types.Message, role: str):
     user_id = message.from_user.id
     username = message.from_user.username or "Unknown"
 
-    if not is_authorized(user_id):
-        log_user_action(user_id, username, "UNKNOWN_COMMAND", "Сообщение без авторизации")
+    if role == "unauthorized":
+        await log_user_action(user_id, username, "UNKNOWN_COMMAND", "Сообщение без авторизации")
         await message.answer("Я не знаю такую команду. Введите /start для авторизации.")
         return
 
-    log_user_action(user_id, username, "UNKNOWN_COMMAND", f"Неизвестная команда: {message.text}")
+    await log_user_action(user_id, username, "UNKNOWN_COMMAND", "Неизвестная команда: %s", message.text)
     await message.answer("Я не знаю такую команду. Используйте кнопки или команды: /find, /add, /info")
 
+def _not_ready():
+    # /readyz перестает отвечать готовностью: балансировщик не направляет новые запросы
+    metrics_server.ready = False
+
+def register_handlers(dp):
+    """Регистрирует обработчики: команды и кнопки вне диалогов — таблицей router, шаги диалогов и ошибки — в диспетчере"""
+    router.register(dp)
+    dp.register_errors_handler(query_timeout_handler, exception=QueryTimeout)
+    dp.register_message_handler(process_search_query, state=SearchStates.waiting_for_query)
+    dp.register_message_handler(process_fio, state=AddPersonStates.waiting_for_fio)
+    dp.register_message_handler(process_phone, state=AddPersonStates.waiting_for_phone)
+    dp.register_message_handler(process_birth, state=AddPersonStates.waiting_for_birth)
+    dp.register_message_handler(process_car, state=AddPersonStates.waiting_for_car)
+    dp.register_message_handler(process_address, state=AddPersonStates.waiting_for_address)
+    dp.register_message_handler(process_passport, state=AddPersonStates.waiting_for_passport)
+    dp.register_callback_query_handler(logs_page_callback, lambda call: call.data.startswith("logs:"))
+
+def create_app(token=BOT_TOKEN, api_url=BOT_API_URL, fsm_storage=None):
+    """
+    Создает бота, хранилище диалогов, очередь отправки, диспетчер с middleware и обработчиками.
+    Вызывается один раз за процесс (main(), бенчмарк); к БД и Bot API не обращается. Возвращает диспетчер
+    """
+    global bot, storage, dp, sender, limiter
+    bot = Bot(token=token, server=TelegramAPIServer.from_base(api_url) if api_url else TELEGRAM_PRODUCTION)
+    # Состояния диалогов хранятся вне процесса (см. FSM_STORAGE)
+    storage = fsm_storage if fsm_storage is not None else create_storage()
+    dp = Dispatcher(bot, storage=storage)
+    # Очередь исходящих сообщений с учетом ограничений Telegram
+    sender = MessageSender(bot)
+    # Ограничение частоты запросов: лишние обновления отбрасываются до обработчиков
+    limiter = RateLimiter(storage if THROTTLE_STORAGE == "fsm" else None)
+    # Метрики считаются первыми, чтобы учитывать и отброшенные обновления
+    dp.middleware.setup(MetricsMiddleware())
+    dp.middleware.setup(ThrottlingMiddleware(limiter))
+    # Выборочное профилирование обновлений (PROFILE_SAMPLE_RATE), отброшенные обновления не профилируются
+    dp.middleware.setup(ProfilingMiddleware())
+    # Роль отправителя определяется один раз на обновление и передается обработчикам как role
+    dp.middleware.setup(AuthMiddleware())
+    register_handlers(dp)
+    return dp
+
+def check_schema():
+    """Проверка версии схемы БД (недостающие миграции применяются при DB_AUTO_MIGRATE=1)"""
+    try:
+        version = ensure_schema()
+        logger.info("Подключение к базе данных успешно, версия схемы: %s", version)
+    except Exception as e:
+        logger.error("Ошибка подключения к базе данных: %s", e)
+        logger.error("Бот будет работать с ограниченным функционалом")
+
+# Длительность этапов запуска процесса, секунд (также в метрике bot_startup_seconds)
+_startup_times = {}
+
+def _startup_stage(stage, started):
+    """Записывает длительность этапа запуска и возвращает время его окончания"""
+    finished = time.perf_counter()
+    _startup_times[stage] = finished - started
+    STARTUP_SECONDS.set(finished - started, stage)
+    return finished
+
+async def on_startup(dp, handle_updates=True, maintenance=True):
+    """
+    Запускает фоновые задачи и регистрирует их остановку (server/lifecycle.py).
+    handle_updates — задачи процесса, обрабатывающего обновления (запись логов, отправка сообщений);
+    maintenance — обслуживание БД (секции логов, очистка диалогов), которое нужно ровно в одном процессе
+    """
+    started = time.perf_counter()
+    # Ресурсы этапа CLOSE закрываются в обратном порядке: соединения с БД — последними
+    lifecycle.on_shutdown(CLOSE, "соединения с БД", dispose)
+    lifecycle.on_shutdown(CLOSE, "диспетчер", lambda: close_dispatcher(dp))
+    # Лимиты записываются до закрытия хранилища диалогов (закрывается вместе с диспетчером)
+    lifecycle.on_shutdown(CLOSE, "лимиты запросов", limiter.close)
+    await metrics_server.start()
+    lifecycle.on_shutdown(CLOSE, "сервер метрик", metrics_server.stop)
+    await loop_watchdog.start()
+    lifecycle.on_shutdown(CLOSE, "контроль event loop", loop_watchdog.stop)
+    if maintenance:
+        await partition_manager.start()
+        lifecycle.on_shutdown(CLOSE, "обслуживание секций логов", partition_manager.stop)
+        if isinstance(storage, DBStorage):
+            await storage.start()
+    lifecycle.on_shutdown(STOP_RECEIVING, "готовность", _not_ready)
+    if handle_updates:
+        await audit_writer.start()
+        lifecycle.on_shutdown(CLOSE, "исходящие сообщения", sender.stop)
+        # Выполняется до закрытия соединений с БД: дописывает то, что не успела остановка очереди
+        lifecycle.on_shutdown(CLOSE, "запись логов", audit_writer.close)
+        # Логи дописываются первыми и со своим минимальным сроком: медленная отправка
+        # (RetryAfter) не отнимает у них время, а сообщения досылаются после
+        lifecycle.on_shutdown(DRAIN_QUEUES, "запись логов", audit_writer.stop, min_timeout=AUDIT_DRAIN_TIMEOUT)
+        lifecycle.on_shutdown(DRAIN_QUEUES, "исходящие сообщения", sender.join)
+    metrics_server.ready = True
+    _startup_stage("startup", started)
+    logger.info(
+        "Бот готов: импорт %.2f с, проверка схемы %.2f с, создание приложения %.2f с, запуск задач %.2f с",
+        *(_startup_times.get(stage, 0) for stage in ("import", "schema", "app", "startup"))
+    )
+
+# Время импорта самого модуля и его зависимостей: до main() и любых обращений к БД
+_startup_stage("import", _IMPORT_STARTED)
+
+def main():
+    """Точка входа (python bot.py, Procfile worker): логирование, схема БД, приложение и режим работы"""
+    setup_logging()
+    supervisor = BOT_WORKERS > 1 and not BOT_WORKER_ID
+    if supervisor:
+        # Супервизор только получает обновления и обслуживает БД: его пул не входит в долю рабочих процессов
+        from server.workers import SUPERVISOR_DB_POOL_SIZE, db_pool_share
+        # Соединений на все процессы не хватает — ошибка до запуска, а не ожидание пула под нагрузкой
+        db_pool_share(BOT_WORKERS)
+        init_engine(pool_size=SUPERVISOR_DB_POOL_SIZE, max_overflow=0)
+    started = time.perf_counter()
+    check_schema()
+    started = _startup_stage("schema", started)
+    dp = create_app()
+    _startup_stage("app", started)
+    if BOT_WORKER_ID:
+        # Рабочий процесс, запущенный супервизором
+        from server.workers import run_worker
+        # Обслуживание БД выполняет супервизор
+        run_worker(dp, on_startup=functools.partial(on_startup, maintenance=False))
+    elif supervisor:
+        from server.workers import start_supervisor
+        start_supervisor(dp, on_startup=functools.partial(on_startup, handle_updates=False))
+    elif BOT_MODE == "webhook":
+        from server.webhook import start_webhook
+        start_webhook(dp, on_startup=on_startup)
+    else:
+        from server.polling import start_polling
+        start_polling(dp, on_startup=on_startup)
+
 # Запуск
 if __name__ == "__main__":
-    executor.start_polling(dp, skip_updates=True)
+    main()
@@ -0,0 +1,135 @@
+import os
+from dotenv import load_dotenv
+
+# Загружаем токен из .env
+load_dotenv()
+BOT_TOKEN = os.getenv("BOT_TOKEN")
+# Адрес Bot API: пусто — api.telegram.org, иначе локальный сервер (например, python -m bench.mock_api)
+BOT_API_URL = os.getenv("BOT_API_URL")
+DATABASE_URL = os.getenv("DATABASE_URL")
+
+# Настройки пула соединений с БД
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))  # Размер пула соединений
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))  # Максимальное количество дополнительных соединений
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "3600"))  # Время жизни соединения в секундах (1 час)
+
+# Количество потоков для запросов к БД (больше, чем соединений в пуле, не имеет смысла)
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", str(DB_POOL_SIZE + DB_MAX_OVERFLOW)))
+
+# Предельное время запросов к БД из обработчиков, секунд (0 — без ограничения). Запрос, не уложившийся
+# в срок или ставший ненужным (пользователь отправил новую команду), прерывается, а соединение возвращается в пул
+DB_STATEMENT_TIMEOUT = float(os.getenv("DB_STATEMENT_TIMEOUT", "5"))
+DB_SEARCH_TIMEOUT = float(os.getenv("DB_SEARCH_TIMEOUT", "10"))  # Поиск записей
+
+# Настройки пакетной записи логов действий пользователей
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", "10000"))  # Максимум событий в очереди
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "500"))  # Максимум строк в одной вставке
+AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", "1.0"))  # Максимальная задержка записи, секунд
+
+# Хранилище состояний диалогов (FSM):
+#   db       — таблица fsm_storage в основной БД (по умолчанию)
+#   memory   — в памяти процесса (только для разработки)
+#   redis:// — Redis-совместимое хранилище, например redis://localhost:6379/0
+FSM_STORAGE = os.getenv("FSM_STORAGE", "db")
+FSM_TTL = int(os.getenv("FSM_TTL", "86400"))  # Через сколько секунд простоя диалог сбрасывается
+FSM_CLEANUP_INTERVAL = int(os.getenv("FSM_CLEANUP_INTERVAL", "600"))  # Период очистки устаревших диалогов, секунд
+
+# Сессии авторизации
+AUTH_SESSION_TTL = int(os.getenv("AUTH_SESSION_TTL", str(30 * 24 * 3600)))  # Срок действия сессии, секунд
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))  # Максимум пользователей в кэше процесса
+AUTH_CACHE_TTL = int(os.getenv("AUTH_CACHE_TTL", "10"))  # Через сколько секунд кэш перечитывает сессию из БД (срок /revoke в других процессах)
+
+# Режим работы: polling (по умолчанию) или webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+
+# Настройки webhook-режима
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "")  # Публичный адрес, например https://bot.example.com
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")  # Секрет для заголовка X-Telegram-Bot-Api-Secret-Token
+WEBAPP_HOST = os.getenv("WEBAPP_HOST", "0.0.0.0")
+WEBAPP_PORT = int(os.getenv("PORT", os.getenv("WEBAPP_PORT", "8080")))
+
+# Параллельная обработка обновлений
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", "32"))  # Максимум одновременно обрабатываемых обновлений
+UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", "1000"))  # Максимум ожидающих обновлений, сверх — отказ
+# Срок дообработки обновлений и очередей при остановке, секунд: должен быть меньше, чем оркестратор ждет до SIGKILL
+SHUTDOWN_TIMEOUT = float(os.getenv("SHUTDOWN_TIMEOUT", "25"))
+# Сколько дописывать очередь логов при остановке, даже если SHUTDOWN_TIMEOUT уже истек, секунд
+AUDIT_DRAIN_TIMEOUT = float(os.getenv("AUDIT_DRAIN_TIMEOUT", "5"))
+
+# Ограничение частоты запросов (token bucket): скорость пополнения в секунду и запас
+THROTTLE_RATE = float(os.getenv("THROTTLE_RATE", "1"))  # Запросов в секунду от одного пользователя
+THROTTLE_BURST = int(os.getenv("THROTTLE_BURST", "5"))  # Сколько запросов подряд можно сделать без ожидания
+THROTTLE_GLOBAL_RATE = float(os.getenv("THROTTLE_GLOBAL_RATE", "30"))  # Запросов в секунду на весь процесс
+THROTTLE_GLOBAL_BURST = int(os.getenv("THROTTLE_GLOBAL_BURST", "60"))
+AUTH_FAIL_RATE = float(os.getenv("AUTH_FAIL_RATE", str(1 / 60)))  # Неверных кодов в секунду (по умолчанию 1 в минуту)
+AUTH_FAIL_BURST = int(os.getenv("AUTH_FAIL_BURST", "5"))  # Неверных кодов подряд до блокировки
+THROTTLE_MAX_USERS = int(os.getenv("THROTTLE_MAX_USERS", "10000"))  # Максимум пользователей в памяти
+THROTTLE_STORAGE = os.getenv("THROTTLE_STORAGE", "memory")  # memory или fsm (общее хранилище диалогов)
+THROTTLE_SYNC_INTERVAL = float(os.getenv("THROTTLE_SYNC_INTERVAL", "1"))  # Как часто записывать лимиты в хранилище FSM, секунд
+
+# Отправка сообщений с учетом ограничений Telegram
+SEND_CHAT_RATE = float(os.getenv("SEND_CHAT_RATE", "1"))  # Сообщений в секунду в один чат
+SEND_CHAT_BURST = int(os.getenv("SEND_CHAT_BURST", "3"))  # Сообщений подряд в один чат без ожидания
+SEND_GLOBAL_RATE = float(os.getenv("SEND_GLOBAL_RATE", "25"))  # Сообщений в секунду всего
+SEND_GLOBAL_BURST = int(os.getenv("SEND_GLOBAL_BURST", "30"))
+SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", "5"))  # Повторов после RetryAfter
+
+# Секционирование и архивирование логов (user_logs)
+AUDIT_PARTITIONING = os.getenv("AUDIT_PARTITIONING", "1") == "1"  # Месячные секции (только PostgreSQL)
+AUDIT_PARTITIONS_AHEAD = int(os.getenv("AUDIT_PARTITIONS_AHEAD", "2"))  # Сколько будущих месяцев создавать заранее
+AUDIT_RETENTION_MONTHS = int(os.getenv("AUDIT_RETENTION_MONTHS", "6"))  # Сколько месяцев логов хранить в БД
+AUDIT_ARCHIVE_DIR = os.getenv("AUDIT_ARCHIVE_DIR", "archive")  # Куда выгружать старые логи (.jsonl.gz)
+AUDIT_MAINTENANCE_INTERVAL = int(os.getenv("AUDIT_MAINTENANCE_INTERVAL", str(6 * 3600)))  # Период обслуживания, секунд
+LOG_VIEW_DAYS = int(os.getenv("LOG_VIEW_DAYS", "90"))  # За сколько дней показывать логи администраторам
+
+# Миграции схемы БД: применять недостающие автоматически при запуске
+DB_AUTO_MIGRATE = os.getenv("DB_AUTO_MIGRATE", "1") == "1"
+
+# Метрики Prometheus и проверки состояния (/metrics, /healthz, /readyz); METRICS_PORT=0 — отключить
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9090"))
+
+# Логирование: запись в консоль и файл выполняется в фоновом потоке через очередь
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")  # Уровни отдельных компонентов, например "aiogram=WARNING,database=DEBUG"
+LOG_FILE = os.getenv("LOG_FILE", "bot.log")  # Пусто — только консоль
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # json — строка JSON на запись, text — как в консоли
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))  # Ротация по размеру файла, 0 — отключить
+LOG_ROTATE_INTERVAL = int(os.getenv("LOG_ROTATE_INTERVAL", "86400"))  # Ротация по времени, секунд, 0 — отключить
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "14"))  # Сколько архивных файлов хранить, не меньше 1 при ротации
+LOG_COMPRESS = os.getenv("LOG_COMPRESS", "1") == "1"  # Сжимать архивные файлы gzip
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))  # Максимум записей в очереди, сверх — отбрасываются
+
+# Контроль задержки event loop: период замера и порог, после которого в лог пишется стек блокирующего кода
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.5"))  # секунд, 0 — отключить
+LOOP_LAG_THRESHOLD = float(os.getenv("LOOP_LAG_THRESHOLD", "0.25"))  # секунд
+
+# Выборочное профилирование обновлений (cProfile), профили сохраняются в PROFILE_DIR
+PROFILE_SAMPLE_RATE = int(os.getenv("PROFILE_SAMPLE_RATE", "0"))  # Профилировать каждое N-е обновление, 0 — отключить
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "0"))  # Сохранять только профили обновлений дольше, мс
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+# Реплика только для чтения: просмотр логов, статистика и поиск. Пусто — все запросы в DATABASE_URL
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
+DB_REPLICA_MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", "5"))  # Допустимое отставание реплики, секунд
+DB_REPLICA_CHECK_INTERVAL = float(os.getenv("DB_REPLICA_CHECK_INTERVAL", "5"))  # Период проверки реплики, секунд
+DB_REPLICA_TIMEOUT = int(os.getenv("DB_REPLICA_TIMEOUT", "2"))  # Срок подключения к реплике и проверки отставания, секунд
+
+# Идемпотентная обработка: update_id отмечается в таблице processed_updates, повторная доставка пропускается
+UPDATE_DEDUP = os.getenv("UPDATE_DEDUP", "1") == "1"
+UPDATE_DEDUP_TTL = int(os.getenv("UPDATE_DEDUP_TTL", "172800"))  # Сколько хранить отметки, секунд (Telegram хранит обновления 24 ч)
+POLLING_TIMEOUT = int(os.getenv("POLLING_TIMEOUT", "20"))  # Long polling getUpdates, секунд
+POLLING_LIMIT = int(os.getenv("POLLING_LIMIT", "100"))  # Обновлений за один getUpdates
+
+# Несколько рабочих процессов: супервизор получает обновления и распределяет их по процессам
+# консистентным хешированием chat id (порядок в чате сохраняется). 1 — один процесс без супервизора.
+# Лимиты DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_EXECUTOR_WORKERS, SEND_GLOBAL_* и THROTTLE_GLOBAL_* — общие на все процессы
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", "1"))
+WORKER_RESTART_DELAY = float(os.getenv("WORKER_RESTART_DELAY", "1"))  # Пауза перед перезапуском упавшего процесса, секунд
+# Сколько ждать завершения процесса при остановке, секунд. По умолчанию — его собственная остановка
+# (SHUTDOWN_TIMEOUT и минимальный срок записи логов) с запасом на прерывание обработки и закрытие ресурсов
+WORKER_STOP_TIMEOUT = float(os.getenv("WORKER_STOP_TIMEOUT", str(SHUTDOWN_TIMEOUT + AUDIT_DRAIN_TIMEOUT + 10)))
+# Задаются супервизором рабочему процессу: номер процесса (с 1) и дескриптор сокета связи с супервизором
+BOT_WORKER_ID = int(os.getenv("BOT_WORKER_ID", "0"))
+BOT_WORKER_FD = int(os.getenv("BOT_WORKER_FD", "-1"))
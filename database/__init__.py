@@ -0,0 +1,45 @@
+from database.models import (
+    Base, Person, UserLog, AuditAction, AuditTemplate, AuditImport,
+    FSMRecord, AuthSession, UserActionHourly, ActionDaily, ProcessedUpdate,
+)
+from database.database import (
+    SessionLocal,
+    init_engine,
+    get_engine,
+    replica_router,
+    read_only,
+    run_db,
+    dispose,
+    get_db_session,
+    load_database,
+    save_person,
+    phone_exists,
+    normalize_phone,
+    normalize_query,
+    search_persons,
+    add_user_log,
+    add_user_logs,
+    get_user_logs,
+    get_failed_auth_logs,
+    get_logs_page,
+    get_audit_stats,
+    create_auth_session,
+    get_auth_role,
+    revoke_auth_session,
+    claim_updates,
+    release_updates,
+    delete_processed_updates,
+)
+from database.timeouts import QueryTimeout, statement_timeout
+from database.actions import audit_catalog, parse_details, render_details
+from database.audit import AuditWriter, audit_writer
+from database.partitions import PartitionManager, partition_manager, maintain_partitions
+from database.migrations import migrate, ensure_schema, get_schema_version
+
+def __getattr__(name):
+    # Хранилище диалогов зависит от aiogram и импортируется при первом обращении:
+    # миграциям и утилитам БД библиотека бота не нужна
+    if name in ("DBStorage", "create_storage"):
+        from database import fsm_storage
+        return getattr(fsm_storage, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,213 @@
+import json
+import logging
+import re
+import threading
+from sqlalchemy import select, insert, func
+from sqlalchemy.exc import IntegrityError
+
+from database.models import AuditAction, AuditTemplate
+
+logger = logging.getLogger(__name__)
+
+# Коды действий журнала (user_logs.action). Коды не меняются, новые действия добавляются в конец
+ACTIONS = {
+    "START_COMMAND": 1,
+    "AUTH_SUCCESS": 2,
+    "AUTH_FAILED": 3,
+    "SEARCH_SUCCESS": 4,
+    "SEARCH_NO_RESULTS": 5,
+    "ADD_START": 6,
+    "ADD_SUCCESS": 7,
+    "ADD_ERROR": 8,
+    "ADD_CANCELLED": 9,
+    "ADD_COMMAND": 10,
+    "FIND_COMMAND": 11,
+    "LOGS_BUTTON": 12,
+    "LOGS_COMMAND": 13,
+    "STATS_COMMAND": 14,
+    "REVOKE_COMMAND": 15,
+    "UNKNOWN_COMMAND": 16,
+    # Действия старых версий бота (user_logs.json)
+    "TEXT_SEARCH": 17,
+    "TEXT_SEARCH_SUCCESS": 18,
+    "TEXT_SEARCH_NO_RESULTS": 19,
+}
+# Коды действий, которых нет в ACTIONS, выдаются при первой записи начиная с этого
+DYNAMIC_ACTION_START = 1000
+
+# Шаблоны деталей (user_logs.template): в строке хранятся только код шаблона и аргументы (user_logs.args).
+# Коды не меняются; %s — аргумент, не больше MAX_ARGS на шаблон
+TEMPLATES = {
+    1: "Вход администратора",
+    2: "Вход обычного пользователя",
+    3: "Попытка входа без авторизации",
+    4: "Успешная авторизация пользователя с кодом: %s",
+    5: "Успешная авторизация администратора с кодом: %s",
+    6: "Неверный код: %s",
+    7: "Найдено %s результатов по запросу: %s",
+    8: "Ничего не найдено по запросу: %s",
+    9: "Начало пошагового добавления записи",
+    10: "Начало пошагового добавления записи через команду",
+    11: "Добавлена запись: %s, %s, %s",
+    12: "Отсутствуют обязательные поля",
+    13: "Ошибка при сохранении данных",
+    14: "Критическая ошибка: %s",
+    15: "Отмена добавления записи",
+    16: "Попытка %s без авторизации",
+    17: "Попытка %s без прав администратора",
+    18: "Просмотр логов через кнопку (админ)",
+    19: "Просмотр логов неудачных авторизаций (админ)",
+    20: "Просмотр сводки по логам (админ)",
+    21: "Отозвана сессия пользователя %s",
+    22: "Сообщение без авторизации",
+    23: "Неизвестная команда: %s",
+    # Тексты старых версий бота (user_logs.json)
+    24: "Успешная авторизация с кодом: %s",
+    25: "Пустой запрос",
+    26: "Просмотр логов",
+    27: "Просмотр логов неудачных авторизаций",
+    28: "Успешный вход в бот",
+}
+# Представление user_logs_view в SQLite подставляет не больше стольких аргументов
+MAX_ARGS = 3
+
+_TEMPLATE_CODES = {template: code for code, template in TEMPLATES.items()}
+
+def _compile(template):
+    parts = [re.escape(part) for part in template.split("%s")]
+    return re.compile("^" + "(.*?)".join(parts[:-1]) + ("(.*)" if len(parts) > 1 else "") + parts[-1] + "$", re.S)
+
+# Разбор готового текста шаблонами с аргументами: сначала с большим числом аргументов
+# (шаблоны без аргументов проверяются точным совпадением по _TEMPLATE_CODES)
+_PATTERNS = [
+    (code, _compile(template))
+    for code, template in sorted(TEMPLATES.items(), key=lambda item: -item[1].count("%s"))
+    if "%s" in template
+]
+
+def render_details(template, args):
+    """Текст деталей по коду шаблона и аргументам; без шаблона текст хранится первым аргументом"""
+    if isinstance(args, str):
+        args = json.loads(args)
+    if template is None:
+        return args[0] if args else ""
+    text = TEMPLATES.get(template)
+    if text is None:
+        return " ".join(str(arg) for arg in args or ())
+    return text % tuple(args or ())
+
+def parse_details(text):
+    """
+    Готовый текст деталей -> (код шаблона, аргументы). Текст, не совпавший ни с одним
+    шаблоном без потерь, сохраняется как есть: (None, [text])
+    """
+    if not text:
+        return None, None
+    code = _TEMPLATE_CODES.get(text)
+    if code is not None:
+        return code, None
+    for code, pattern in _PATTERNS:
+        match = pattern.match(text)
+        if match:
+            args = list(match.groups())
+            if TEMPLATES[code] % tuple(args) == text:
+                return code, args
+    return None, [text]
+
+def encode_details(template, args):
+    """Шаблон и аргументы вызова -> (код шаблона, аргументы для user_logs)"""
+    code = _TEMPLATE_CODES.get(template)
+    if code is not None:
+        return code, list(args) or None
+    return parse_details(template % tuple(args) if args else template)
+
+def sync_catalog(conn):
+    """Добавляет в audit_actions и audit_templates коды, объявленные в ACTIONS и TEMPLATES"""
+    known_actions = set(conn.execute(select(AuditAction.id)).scalars())
+    rows = [{"id": code, "name": name} for name, code in ACTIONS.items() if code not in known_actions]
+    if rows:
+        conn.execute(insert(AuditAction), rows)
+    known_templates = set(conn.execute(select(AuditTemplate.id)).scalars())
+    rows = [{"id": code, "text": text} for code, text in TEMPLATES.items() if code not in known_templates]
+    if rows:
+        conn.execute(insert(AuditTemplate), rows)
+
+class AuditCatalog:
+    """
+    Соответствие имен действий и их кодов. Известные коду действия берутся из ACTIONS
+    без обращения к БД; прочие (например, из старых логов) читаются из audit_actions
+    и при первой записи получают код от DYNAMIC_ACTION_START.
+    Методы вызываются в потоке БД с открытой сессией или соединением db.
+    """
+
+    def __init__(self):
+        self._codes = dict(ACTIONS)
+        self._names = {code: name for name, code in ACTIONS.items()}
+        self._lock = threading.Lock()
+        self._synced = False
+
+    def sync(self, db):
+        """Один раз за процесс добавляет в справочники коды, появившиеся в новой версии бота"""
+        if self._synced:
+            return
+        with self._lock:
+            if not self._synced:
+                sync_catalog(db)
+                self._synced = True
+
+    def code(self, db, name, create=True):
+        """Код действия; None, если действие неизвестно и create=False"""
+        code = self._codes.get(name)
+        if code is None:
+            code = self._lookup(db, name, create)
+        return code
+
+    def name(self, db, code):
+        name = self._names.get(code)
+        if name is None:
+            with self._lock:
+                self._load(db)
+            name = self._names.get(code, str(code))
+        return name
+
+    def encode(self, db, row):
+        """Строка журнала с именем действия и текстом (или шаблоном и args) -> строка user_logs"""
+        if "args" in row:
+            template, args = encode_details(row["details"] or "", row["args"])
+        else:
+            template, args = parse_details(row.get("details"))
+        return {
+            "timestamp": row["timestamp"],
+            "user_id": row["user_id"],
+            "username": row["username"],
+            "action": self.code(db, row["action"]),
+            "template": template,
+            "args": args,
+        }
+
+    def _load(self, db):
+        for code, name in db.execute(select(AuditAction.id, AuditAction.name)):
+            self._codes[name] = code
+            self._names[code] = name
+
+    def _lookup(self, db, name, create, attempts=3):
+        with self._lock:
+            for _ in range(attempts):
+                self._load(db)
+                code = self._codes.get(name)
+                if code is not None or not create:
+                    return code
+                code = max(db.execute(select(func.max(AuditAction.id))).scalar() or 0, DYNAMIC_ACTION_START - 1) + 1
+                try:
+                    with db.begin_nested():
+                        db.execute(insert(AuditAction).values(id=code, name=name))
+                except IntegrityError:
+                    # Код или имя одновременно заняты другим процессом: читаем заново
+                    continue
+                logger.info("Новое действие журнала %s, код %s", name, code)
+                self._codes[name] = code
+                self._names[code] = name
+                return code
+        raise RuntimeError(f"Не удалось выдать код действию журнала {name}")
+
+audit_catalog = AuditCatalog()
@@ -0,0 +1,161 @@
+import asyncio
+import logging
+from datetime import datetime
+
+from config import AUDIT_QUEUE_SIZE, AUDIT_BATCH_SIZE, AUDIT_FLUSH_INTERVAL
+from database.database import run_db, add_user_logs
+from utils.metrics import Gauge
+
+logger = logging.getLogger(__name__)
+
+# Маркер остановки фоновой задачи
+_STOP = object()
+
+class AuditWriter:
+    """Буферизует действия пользователей и записывает их в user_logs пачками"""
+
+    def __init__(self, max_queue=AUDIT_QUEUE_SIZE, batch_size=AUDIT_BATCH_SIZE,
+                 flush_interval=AUDIT_FLUSH_INTERVAL, retries=3):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retries = retries
+        self._queue = asyncio.Queue(maxsize=max_queue)
+        self._task = None
+        self._closed = False
+        self._writing = None  # Задача записи текущей пачки: отмена остановки ее не прерывает
+        self._unwritten = []  # События прерванной остановки: их дописывает close()
+
+    @property
+    def depth(self):
+        """Количество событий, ожидающих записи"""
+        return self._queue.qsize()
+
+    async def start(self):
+        """Запускает фоновую задачу записи"""
+        if self._task is None:
+            self._closed = False
+            self._task = asyncio.create_task(self._run(), name="audit-writer")
+
+    async def log(self, user_id, username, action, details="", *args):
+        """
+        Ставит событие в очередь. details — шаблон из database/actions.py, args — его аргументы.
+        Если очередь заполнена — ждет, пока освободится место
+        """
+        row = {
+            "timestamp": datetime.utcnow(),
+            "user_id": user_id,
+            "username": username,
+            "action": action,
+            "details": details,
+            "args": args,
+        }
+        if self._closed or self._task is None:
+            # Фоновая задача не запущена — пишем сразу, чтобы не потерять событие
+            await self._flush([row])
+            return
+        await self._queue.put(row)
+
+    async def stop(self):
+        """
+        Останавливает прием событий и дожидается записи всей очереди.
+        Если ожидание прервано (срок остановки), события, не переданные на запись, дописывает close()
+        """
+        if self._task is None:
+            return
+        self._closed = True
+        try:
+            await self._queue.put(_STOP)
+            await self._task
+        except asyncio.CancelledError:
+            self._task.cancel()
+            raise
+        finally:
+            if self._task.done():
+                self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        batch = []
+        try:
+            while True:
+                item = await self._queue.get()
+                if item is _STOP:
+                    return
+                batch = [item]
+                stopping = False
+                deadline = loop.time() + self.flush_interval
+                # Собираем пачку, пока не наберется batch_size или не выйдет время
+                while len(batch) < self.batch_size:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                    if item is _STOP:
+                        stopping = True
+                        break
+                    batch.append(item)
+                flushing, batch = batch, []
+                await self._flush(flushing)
+                if stopping:
+                    return
+        except asyncio.CancelledError:
+            self._unwritten += batch + self._drain()
+            if self._unwritten:
+                logger.warning("Запись логов прервана, событий ожидает записи при закрытии: %s", len(self._unwritten))
+            raise
+
+    async def close(self):
+        """
+        Последняя запись при закрытии ресурсов (до закрытия пула соединений): дописывает события,
+        которые не успела записать stop(), одной попыткой. Незаписанные события выводятся в лог
+        """
+        self._closed = True
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._writing is not None:
+            await asyncio.gather(self._writing, return_exceptions=True)
+        rows = self._unwritten + self._drain()
+        self._unwritten = []
+        if rows:
+            await self._write(rows, retries=1)
+
+    def _drain(self):
+        """Забирает из очереди все ожидающие события"""
+        rows = []
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not _STOP:
+                rows.append(item)
+        return rows
+
+    @staticmethod
+    def _lost(rows, reason):
+        if rows:
+            logger.error("%s, не записано событий: %s", reason.capitalize(), len(rows))
+        for row in rows:
+            logger.error("Событие не записано в БД: %s", row)
+
+    async def _flush(self, batch):
+        # Пачка, переданная на запись, дописывается, даже если ожидающая задача отменена
+        self._writing = asyncio.ensure_future(self._write(batch))
+        await asyncio.shield(self._writing)
+
+    async def _write(self, batch, retries=None):
+        retries = retries or self.retries
+        for attempt in range(1, retries + 1):
+            try:
+                await run_db(add_user_logs, batch)
+                return
+            except Exception as e:
+                logger.error("Ошибка записи пачки логов (%s шт., попытка %s): %s", len(batch), attempt, e)
+                if attempt < retries:
+                    await asyncio.sleep(attempt)
+        self._lost(batch, "ошибка записи логов")
+
+audit_writer = AuditWriter()
+Gauge("bot_audit_queue_depth", "События аудита, ожидающие записи", function=lambda: audit_writer.depth)
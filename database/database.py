@@ -0,0 +1,578 @@
+import asyncio
+import contextvars
+import functools
+import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, event, insert, delete, func, or_, and_, text, make_url
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
+
+from config import (
+    DATABASE_URL,
+    DATABASE_REPLICA_URL,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_RECYCLE,
+    DB_EXECUTOR_WORKERS,
+    DB_STATEMENT_TIMEOUT,
+    DB_SEARCH_TIMEOUT,
+    DB_REPLICA_MAX_LAG,
+    DB_REPLICA_CHECK_INTERVAL,
+    DB_REPLICA_TIMEOUT,
+    LOG_VIEW_DAYS,
+)
+from database.actions import audit_catalog, render_details
+from database.models import Person, UserLog, AuthSession, UserActionHourly, ActionDaily, ProcessedUpdate
+from database.replica import ReplicaRouter
+from database.rollups import update_rollups
+from database.timeouts import (
+    QueryTimeout, DbCall, statement_timeout, call_expired, current_handler, install, set_statement_timeout
+)
+from utils.metrics import (
+    Gauge,
+    DB_CALL_SECONDS,
+    DB_EXECUTOR_WAIT_SECONDS,
+    DB_POOL_CHECKOUT_SECONDS,
+    DB_READS_TOTAL,
+    DB_TIMEOUTS_TOTAL,
+    DB_CANCELLED_TOTAL,
+)
+
+logger = logging.getLogger(__name__)
+
+class TimedQueuePool(QueuePool):
+    """QueuePool, замеряющий ожидание свободного соединения (включая открытие нового)"""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_CHECKOUT_SECONDS.observe(time.perf_counter() - started)
+
+def _create_engine(url, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, connect_timeout=None):
+    """
+    Движок с пулом соединений и прерыванием запросов с истекшим сроком (database/timeouts.py).
+    connect_timeout — срок подключения, секунд (PostgreSQL)
+    """
+    connect_args = {}
+    if connect_timeout and make_url(url).get_backend_name() == "postgresql":
+        connect_args["connect_timeout"] = connect_timeout
+    engine = create_engine(
+        url,
+        poolclass=TimedQueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=True,  # Проверка соединений перед использованием
+        connect_args=connect_args,
+    )
+    install(engine)
+    return engine
+
+# Движки создаются при первом обращении к БД (get_engine) или явно через init_engine():
+# импорт модуля не требует DATABASE_URL и не открывает соединений.
+# Основная БД: все записи и чтения, которым нужны только что записанные данные
+engine = None
+# Реплика для функций, помеченных @read_only (если задана DATABASE_REPLICA_URL)
+replica_engine = None
+_engine_lock = threading.Lock()
+
+# expire_on_commit=False: объекты остаются доступными после закрытия сессии
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False)
+ReplicaSessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False)
+for _sessionmaker in (SessionLocal, ReplicaSessionLocal):
+    event.listen(_sessionmaker, "after_begin", set_statement_timeout)
+replica_router = ReplicaRouter(None, DB_REPLICA_MAX_LAG, DB_REPLICA_CHECK_INTERVAL, DB_REPLICA_TIMEOUT)
+
+# Сессии текущего вызова открываются на реплике (устанавливается @read_only)
+_use_replica = contextvars.ContextVar("use_replica", default=False)
+
+# Пул потоков для синхронных запросов к БД. Обработчики не выполняют запросы
+# в event loop напрямую, а ждут результат из пула через run_db()
+db_executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix="db")
+
+# Загрузка пула соединений и очереди потоков — для подбора DB_POOL_SIZE / DB_MAX_OVERFLOW
+Gauge("bot_db_pool_size", "Размер пула соединений", function=lambda: get_engine().pool.size())
+Gauge("bot_db_pool_checked_out", "Соединения, выданные из пула", function=lambda: get_engine().pool.checkedout())
+Gauge("bot_db_pool_overflow", "Соединения сверх pool_size", function=lambda: max(get_engine().pool.overflow(), 0))
+Gauge("bot_db_pool_max_overflow", "Предел соединений сверх pool_size", function=lambda: get_engine().pool._max_overflow)
+Gauge("bot_db_executor_queue_depth", "Запросы к БД, ожидающие свободного потока", function=lambda: db_executor._work_queue.qsize())
+
+def init_engine(url=None, replica_url=None, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW):
+    """
+    Создает движки основной БД и реплики (по умолчанию DATABASE_URL и DATABASE_REPLICA_URL),
+    если они еще не созданы. Соединения открываются только при первом запросе
+    """
+    global engine, replica_engine
+    with _engine_lock:
+        if engine is not None:
+            return engine
+        url = url or DATABASE_URL
+        if not url:
+            raise RuntimeError("Не задан DATABASE_URL")
+        replica_url = replica_url or DATABASE_REPLICA_URL
+        # Недоступная реплика не задерживает чтение дольше DB_REPLICA_TIMEOUT: дальше — основная БД
+        replica = _create_engine(replica_url, pool_size, max_overflow, DB_REPLICA_TIMEOUT) if replica_url else None
+        primary = _create_engine(url, pool_size, max_overflow)
+        SessionLocal.configure(bind=primary)
+        ReplicaSessionLocal.configure(bind=replica)
+        replica_router.engine = replica
+        if replica is not None:
+            Gauge("bot_db_replica_lag_seconds", "Отставание реплики при последней проверке", function=lambda: replica_router.lag)
+            Gauge("bot_db_replica_checked_out", "Соединения реплики, выданные из пула", function=lambda: replica.pool.checkedout())
+        # Движок публикуется последним: get_engine() без блокировки видит уже настроенные сессии
+        replica_engine = replica
+        engine = primary
+        return engine
+
+def get_engine():
+    """Движок основной БД; создается при первом обращении"""
+    return engine if engine is not None else init_engine()
+
+async def run_db(func, *args, **kwargs):
+    """
+    Выполняет синхронную функцию работы с БД в пуле потоков, не блокируя event loop.
+    Запрос функции с @statement_timeout прерывается по истечении ее срока (QueryTimeout)
+    или при отмене ожидающей задачи, и соединение сразу возвращается в пул.
+    Функцию с @read_only прерывает и новая команда чата (Interruptible обработки обновления)
+    """
+    loop = asyncio.get_running_loop()
+    # Контекст вызывающей задачи доступен в потоке (как в asyncio.to_thread)
+    context = contextvars.copy_context()
+    name = getattr(func, "__name__", "unknown")
+    timeout = getattr(func, "statement_timeout", None)
+    call = DbCall(name, timeout) if timeout is not None else None
+    submitted = time.perf_counter()
+
+    def run():
+        started = time.perf_counter()
+        DB_EXECUTOR_WAIT_SECONDS.observe(started - submitted)
+        try:
+            if call is None:
+                return context.run(func, *args, **kwargs)
+            return context.run(call.run, func, args, kwargs)
+        finally:
+            DB_CALL_SECONDS.observe(time.perf_counter() - started, name)
+
+    future = loop.run_in_executor(db_executor, run)
+    if call is None:
+        return await future
+    # Новая команда чата прерывает только чтение: записи завершаются, даже если ответ уже не нужен
+    handler = current_handler.get() if getattr(func, "read_only", False) else None
+    try:
+        with handler.reading() if handler is not None else nullcontext():
+            return await asyncio.wait_for(future, call.timeout)
+    except (asyncio.TimeoutError, QueryTimeout):
+        _interrupt(loop, call)
+        DB_TIMEOUTS_TOTAL.inc(name)
+        logger.warning("Запрос к БД %s прерван: не уложился в %s с", name, call.timeout)
+        raise QueryTimeout(name, call.timeout) from None
+    except asyncio.CancelledError:
+        _interrupt(loop, call)
+        DB_CANCELLED_TOTAL.inc(name)
+        raise
+
+def _interrupt(loop, call):
+    if call.cancel():
+        # Отмена запроса PostgreSQL открывает отдельное соединение: не в event loop и не в пуле потоков БД
+        loop.run_in_executor(None, call.interrupt)
+
+def dispose():
+    """
+    Закрывает пул потоков и соединения с БД при остановке. Вызывается после дообработки:
+    новые run_db() уже не принимаются, соединения, занятые незавершенными запросами,
+    закроются при возврате в пул
+    """
+    db_executor.shutdown(wait=False, cancel_futures=True)
+    if engine is not None:
+        engine.dispose()
+    if replica_engine is not None:
+        replica_engine.dispose()
+    logger.info("Соединения с БД закрыты")
+
+def ping():
+    """Проверяет доступность БД"""
+    with get_engine().connect() as conn:
+        conn.execute(text("SELECT 1"))
+
+def read_only(func):
+    """
+    Выполняет функцию чтения на реплике, если она доступна и не отстает,
+    иначе на основной БД. При ошибке соединения с репликой вызов повторяется на основной БД.
+    Функция должна только читать: записи на реплике невозможны.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not replica_router.available():
+            DB_READS_TOTAL.inc("primary")
+            return func(*args, **kwargs)
+        token = _use_replica.set(True)
+        try:
+            result = func(*args, **kwargs)
+            DB_READS_TOTAL.inc("replica")
+            return result
+        except OperationalError as e:
+            if call_expired():
+                # Запрос прерван по сроку, а не из-за недоступности реплики
+                raise
+            replica_router.mark_down(e)
+        finally:
+            _use_replica.reset(token)
+        DB_READS_TOTAL.inc("primary")
+        return func(*args, **kwargs)
+    # Чтение можно прервать новой командой чата (run_db)
+    wrapper.read_only = True
+    return wrapper
+
+def _new_session():
+    get_engine()
+    return ReplicaSessionLocal() if _use_replica.get() else SessionLocal()
+
+def _replica_failed(error):
+    """Ошибка соединения с репликой: функция чтения должна пробросить ее в @read_only для повтора"""
+    return _use_replica.get() and isinstance(error, OperationalError)
+
+# Функции для работы с базой данных
+@contextmanager
+def get_db_session():
+    """Контекстный менеджер для работы с сессией БД (внутри @read_only — с репликой)"""
+    db = _new_session()
+    try:
+        yield db
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        if not call_expired():
+            logger.error("Ошибка в сессии БД: %s", e)
+        raise
+    finally:
+        db.close()
+
+@read_only
+def load_database():
+    """Загружает все записи из базы данных"""
+    try:
+        with get_db_session() as db:
+            persons = db.query(Person).all()
+            return persons
+    except Exception as e:
+        if _replica_failed(e):
+            raise
+        logger.error("Ошибка загрузки базы данных: %s", e)
+        return []
+
+@statement_timeout(DB_STATEMENT_TIMEOUT)
+def save_person(person_data):
+    """Сохраняет новую запись в базу данных"""
+    try:
+        with get_db_session() as db:
+            person = Person(**person_data)
+            db.add(person)
+            db.flush()  # Получаем ID без коммита
+            db.refresh(person)
+            logger.info("Запись успешно сохранена с ID: %s", person.id)
+            return person
+    except Exception as e:
+        if call_expired():
+            raise
+        logger.error("Ошибка сохранения записи: %s", e, exc_info=True)
+        return None
+
+@statement_timeout(DB_STATEMENT_TIMEOUT)
+def phone_exists(phone):
+    """Проверяет, есть ли запись с таким телефоном"""
+    with get_db_session() as db:
+        return db.query(Person.id).filter(Person.phone == phone).first() is not None
+
+def normalize_phone(phone):
+    """Нормализует телефон к формату 11 цифр"""
+    # Удаляем все нецифровые символы
+    digits = re.sub(r'\D', '', phone)
+    # Если начинается с 8, заменяем на 7
+    if len(digits) == 11 and digits.startswith('8'):
+        digits = '7' + digits[1:]
+    # Если начинается с +7 или просто 7, но меньше 11 цифр, добавляем недостающие
+    if len(digits) == 10:
+        digits = '7' + digits
+    return digits
+
+def normalize_query(query):
+    """Нормализует поисковый запрос"""
+    # Удаляем лишние пробелы, приводим к нижнему регистру
+    return ' '.join(query.strip().lower().split())
+
+@statement_timeout(DB_SEARCH_TIMEOUT)
+@read_only
+def search_persons(query, limit=100):
+    """Улучшенный поиск записей по запросу с нормализацией"""
+    try:
+        query = query.strip()
+        if not query:
+            return []
+        
+        # Проверяем, является ли запрос телефоном (много цифр)
+        digits_only = re.sub(r'\D', '', query)
+        
+        db = _new_session()
+        try:
+            # Всегда ищем по всем полям, но для цифровых запросов также нормализуем
+            persons_query = db.query(Person)
+            
+            # Для цифровых запросов (>=7 цифр) - ищем по телефону и паспорту
+            if len(digits_only) >= 7:
+                normalized_phone = normalize_phone(query)
+                logger.info("Поиск по телефону: оригинал='%s', цифр=%s, нормализованный='%s'", query, len(digits_only), normalized_phone)
+                
+                # Ищем по нормализованному телефону, оригинальному запросу и цифрам
+                persons = persons_query.filter(
+                    Person.phone.contains(digits_only) |
+                    Person.phone.contains(normalized_phone) |
+                    Person.phone.contains(query) |
+                    Person.passport.contains(digits_only) |
+                    Person.passport.contains(query)
+                ).limit(limit).all()
+            else:
+                # Текстовый поиск по всем полям с регистронезависимым поиском
+                normalized_query = normalize_query(query)
+                logger.info("Текстовый поиск: оригинал='%s', нормализованный='%s'", query, normalized_query)
+                
+                persons = persons_query.filter(
+                    Person.fio.ilike(f'%{normalized_query}%') |
+                    Person.phone.contains(normalized_query) |
+                    Person.phone.contains(query) |
+                    Person.car_number.ilike(f'%{normalized_query}%') |
+                    Person.address.ilike(f'%{normalized_query}%') |
+                    Person.passport.contains(normalized_query) |
+                    Person.passport.contains(query)
+                ).limit(limit).all()
+            
+            logger.info("Найдено записей: %s", len(persons))
+            return persons
+        finally:
+            db.close()
+    except Exception as e:
+        if _replica_failed(e) or call_expired():
+            raise
+        logger.error("Ошибка поиска: %s", e, exc_info=True)
+        return []
+
+def add_user_log(user_id, username, action, details="", *args):
+    """Записывает действие пользователя в таблицу логов; details — шаблон из database/actions.py с аргументами args"""
+    add_user_logs([{
+        "timestamp": datetime.utcnow(),
+        "user_id": user_id,
+        "username": username,
+        "action": action,
+        "details": details,
+        "args": args
+    }])
+
+def add_user_logs(rows):
+    """
+    Записывает пачку действий пользователей одной многострочной вставкой и обновляет агрегаты.
+    Строки содержат имя действия и детали: шаблон с аргументами (ключ args) или готовый текст;
+    в таблицу они записываются кодами (database/actions.py)
+    """
+    if not rows:
+        return
+    with get_db_session() as db:
+        audit_catalog.sync(db)
+        rows = [audit_catalog.encode(db, row) for row in rows]
+        db.execute(insert(UserLog), rows)
+        update_rollups(db, rows)
+
+@statement_timeout(DB_STATEMENT_TIMEOUT)
+@read_only
+def get_user_logs(limit=10):
+    """Получает последние логи пользователей"""
+    try:
+        with get_db_session() as db:
+            logs = db.query(UserLog).order_by(UserLog.timestamp.desc()).limit(limit).all()
+            return [{
+                "timestamp": log.timestamp.strftime("%Y-%m-%d %H:%M:%S"),
+                "user_id": log.user_id,
+                "username": log.username,
+                "action": audit_catalog.name(db, log.action),
+                "details": render_details(log.template, log.args)
+            } for log in logs]
+    except Exception as e:
+        if _replica_failed(e):
+            raise
+        logger.error("Ошибка чтения логов: %s", e)
+        return []
+
+@statement_timeout(DB_STATEMENT_TIMEOUT)
+@read_only
+def get_failed_auth_logs(limit=10):
+    """Получает только неудачные попытки авторизации"""
+    try:
+        with get_db_session() as db:
+            logs = db.query(UserLog).filter(
+                UserLog.action == audit_catalog.code(db, 'AUTH_FAILED')
+            ).order_by(UserLog.timestamp.desc()).limit(limit).all()
+            return [{
+                "timestamp": log.timestamp.strftime("%Y-%m-%d %H:%M:%S"),
+                "user_id": log.user_id,
+                "username": log.username,
+                "action": audit_catalog.name(db, log.action),
+                "details": render_details(log.template, log.args)
+            } for log in logs]
+    except Exception as e:
+        if _replica_failed(e):
+            raise
+        logger.error("Ошибка чтения логов: %s", e)
+        return []
+
+def _log_to_dict(db, log):
+    return {
+        "id": log.id,
+        "cursor": (log.timestamp, log.id),
+        "timestamp": log.timestamp.strftime("%Y-%m-%d %H:%M:%S"),
+        "user_id": log.user_id,
+        "username": log.username,
+        "action": audit_catalog.name(db, log.action),
+        "details": render_details(log.template, log.args)
+    }
+
+@statement_timeout(DB_STATEMENT_TIMEOUT)
+@read_only
+def get_logs_page(action='AUTH_FAILED', before=None, after=None, limit=10, days=LOG_VIEW_DAYS):
+    """
+    Страница логов с keyset-пагинацией по (timestamp, id), новые записи первыми.
+
+    before — курсор (timestamp, id), страница старее него; after — новее него.
+    Ограничение по days позволяет PostgreSQL читать только свежие секции.
+    Возвращает записи и признаки наличия более старых и более новых страниц.
+    """
+    with get_db_session() as db:
+        code = audit_catalog.code(db, action, create=False)
+        if code is None:
+            return {"logs": [], "has_older": False, "has_newer": False}
+        query = db.query(UserLog).filter(
+            UserLog.action == code,
+            UserLog.timestamp >= datetime.utcnow() - timedelta(days=days)
+        )
+        if after is not None:
+            timestamp, log_id = after
+            query = query.filter(or_(
+                UserLog.timestamp > timestamp,
+                and_(UserLog.timestamp == timestamp, UserLog.id > log_id)
+            )).order_by(UserLog.timestamp.asc(), UserLog.id.asc())
+        else:
+            if before is not None:
+                timestamp, log_id = before
+                query = query.filter(or_(
+                    UserLog.timestamp < timestamp,
+                    and_(UserLog.timestamp == timestamp, UserLog.id < log_id)
+                ))
+            query = query.order_by(UserLog.timestamp.desc(), UserLog.id.desc())
+        logs = query.limit(limit + 1).all()
+        has_more = len(logs) > limit
+        logs = logs[:limit]
+        if after is not None:
+            logs.reverse()
+        return {
+            "logs": [_log_to_dict(db, log) for log in logs],
+            "has_older": has_more if after is None else True,
+            "has_newer": has_more if after is not None else before is not None
+        }
+
+@statement_timeout(DB_STATEMENT_TIMEOUT)
+@read_only
+def get_audit_stats(days=7, hours=24, top=10):
+    """Сводка по агрегатам: действия по дням и пользователи с неудачными авторизациями"""
+    now = datetime.utcnow()
+    with get_db_session() as db:
+        daily = db.query(ActionDaily.day, ActionDaily.action, ActionDaily.count).filter(
+            ActionDaily.day > (now - timedelta(days=days)).date()
+        ).order_by(ActionDaily.day.desc(), ActionDaily.count.desc()).all()
+        failed = db.query(UserActionHourly.user_id, func.sum(UserActionHourly.count)).filter(
+            UserActionHourly.action == audit_catalog.code(db, 'AUTH_FAILED'),
+            UserActionHourly.hour >= now - timedelta(hours=hours)
+        ).group_by(UserActionHourly.user_id).order_by(func.sum(UserActionHourly.count).desc()).limit(top).all()
+        return {
+            "daily": [
+                (day.strftime("%Y-%m-%d"), audit_catalog.name(db, action), count) for day, action, count in daily
+            ],
+            "failed_by_user": [(user_id, int(count)) for user_id, count in failed]
+        }
+
+def create_auth_session(user_id, username, role, ttl):
+    """Создает или продлевает сессию авторизации пользователя. Возвращает срок ее действия"""
+    now = datetime.utcnow()
+    expires_at = now + timedelta(seconds=ttl)
+    with get_db_session() as db:
+        db.merge(AuthSession(
+            user_id=user_id,
+            username=username,
+            role=role,
+            created_at=now,
+            expires_at=expires_at,
+            revoked_at=None
+        ))
+    return expires_at
+
+def get_auth_role(user_id):
+    """Возвращает роль и срок действия действующей сессии: (role, expires_at), или None"""
+    with get_db_session() as db:
+        session = db.get(AuthSession, user_id)
+        if session is None or session.revoked_at is not None or session.expires_at < datetime.utcnow():
+            return None
+        return session.role, session.expires_at
+
+def revoke_auth_session(user_id):
+    """Отзывает сессию пользователя. Возвращает True, если сессия была активна"""
+    with get_db_session() as db:
+        updated = db.query(AuthSession).filter(
+            AuthSession.user_id == user_id,
+            AuthSession.revoked_at.is_(None)
+        ).update({AuthSession.revoked_at: datetime.utcnow()}, synchronize_session=False)
+        return updated > 0
+
+def claim_updates(update_ids):
+    """
+    Отмечает обновления как взятые в обработку одной вставкой.
+    Возвращает множество update_id, которых еще не было в processed_updates
+    """
+    if not update_ids:
+        return set()
+    now = datetime.utcnow()
+    rows = [{"update_id": update_id, "processed_at": now} for update_id in update_ids]
+    with get_db_session() as db:
+        dialect = db.get_bind().dialect.name
+        if dialect in ("postgresql", "sqlite"):
+            module = postgresql if dialect == "postgresql" else sqlite
+            statement = module.insert(ProcessedUpdate).values(rows).on_conflict_do_nothing(
+                index_elements=["update_id"]
+            ).returning(ProcessedUpdate.update_id)
+            return set(db.execute(statement).scalars())
+        claimed = set()
+        for row in rows:
+            try:
+                with db.begin_nested():
+                    db.execute(insert(ProcessedUpdate), [row])
+            except IntegrityError:
+                continue
+            claimed.add(row["update_id"])
+        return claimed
+
+def release_updates(update_ids):
+    """Снимает отметки обновлений, обработка которых не завершилась: повторная доставка будет обработана"""
+    with get_db_session() as db:
+        db.execute(delete(ProcessedUpdate).where(ProcessedUpdate.update_id.in_(update_ids)))
+
+def delete_processed_updates(ttl):
+    """Удаляет отметки старше ttl секунд. Возвращает количество удаленных"""
+    with get_db_session() as db:
+        result = db.execute(delete(ProcessedUpdate).where(
+            ProcessedUpdate.processed_at < datetime.utcnow() - timedelta(seconds=ttl)
+        ))
+        return result.rowcount
@@ -0,0 +1,211 @@
+import asyncio
+import copy
+import logging
+import typing
+from datetime import datetime, timedelta
+from aiogram.contrib.fsm_storage.memory import MemoryStorage
+from aiogram.dispatcher.storage import BaseStorage
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
+
+from config import FSM_STORAGE, FSM_TTL, FSM_CLEANUP_INTERVAL
+from database.database import run_db, get_db_session
+from database.models import FSMRecord
+
+logger = logging.getLogger(__name__)
+
+def _empty():
+    return {"state": None, "data": {}, "bucket": {}}
+
+def _is_expired(record, ttl):
+    return bool(ttl) and record.updated_at < datetime.utcnow() - timedelta(seconds=ttl)
+
+def _load(chat, user, ttl):
+    """Читает состояние диалога; устаревший диалог считается пустым"""
+    with get_db_session() as db:
+        record = db.get(FSMRecord, (chat, user))
+        if record is None or _is_expired(record, ttl):
+            return _empty()
+        return {"state": record.state, "data": record.data or {}, "bucket": record.bucket or {}}
+
+def _modify(chat, user, ttl, change):
+    """Изменяет состояние диалога в одной транзакции с блокировкой строки"""
+    for attempt in range(2):
+        try:
+            with get_db_session() as db:
+                record = db.get(FSMRecord, (chat, user), with_for_update=True)
+                if record is None or _is_expired(record, ttl):
+                    current = _empty()
+                else:
+                    # Копируем, чтобы SQLAlchemy увидел изменение JSON-полей
+                    current = {
+                        "state": record.state,
+                        "data": copy.deepcopy(record.data or {}),
+                        "bucket": copy.deepcopy(record.bucket or {}),
+                    }
+                change(current)
+                # Пустые диалоги не храним, чтобы таблица не росла
+                if current == _empty():
+                    if record is not None:
+                        db.delete(record)
+                    return
+                if record is None:
+                    record = FSMRecord(chat_id=chat, user_id=user)
+                    db.add(record)
+                record.state = current["state"]
+                record.data = current["data"]
+                record.bucket = current["bucket"]
+                record.updated_at = datetime.utcnow()
+                return
+        except (IntegrityError, StaleDataError):
+            # Строку одновременно создал или удалил другой обработчик (SQLite не блокирует
+            # строки через FOR UPDATE) — повторяем с актуальным состоянием
+            if attempt:
+                raise
+
+def _delete_expired(ttl):
+    """Удаляет диалоги, которые не менялись дольше ttl секунд"""
+    with get_db_session() as db:
+        border = datetime.utcnow() - timedelta(seconds=ttl)
+        return db.query(FSMRecord).filter(FSMRecord.updated_at < border).delete(synchronize_session=False)
+
+class DBStorage(BaseStorage):
+    """
+    Хранилище FSM в таблице fsm_storage.
+
+    Состояния и промежуточные данные диалогов переживают перезапуск и общие
+    для всех процессов бота. Диалоги без активности дольше ttl секунд
+    считаются сброшенными и периодически удаляются.
+    """
+
+    def __init__(self, ttl=FSM_TTL, cleanup_interval=FSM_CLEANUP_INTERVAL):
+        self.ttl = ttl
+        self.cleanup_interval = cleanup_interval
+        self._cleanup_task = None
+
+    async def start(self):
+        """Запускает периодическую очистку устаревших диалогов"""
+        if self._cleanup_task is None and self.ttl:
+            self._cleanup_task = asyncio.create_task(self._cleanup_loop(), name="fsm-cleanup")
+
+    async def _cleanup_loop(self):
+        while True:
+            try:
+                removed = await run_db(_delete_expired, self.ttl)
+                if removed:
+                    logger.info("Удалено устаревших диалогов: %s", removed)
+            except Exception as e:
+                logger.error("Ошибка очистки диалогов: %s", e)
+            await asyncio.sleep(self.cleanup_interval)
+
+    async def close(self):
+        if self._cleanup_task is not None:
+            self._cleanup_task.cancel()
+
+    async def wait_closed(self):
+        if self._cleanup_task is not None:
+            try:
+                await self._cleanup_task
+            except asyncio.CancelledError:
+                pass
+            self._cleanup_task = None
+
+    async def _get(self, chat, user):
+        chat, user = self.check_address(chat=chat, user=user)
+        return await run_db(_load, int(chat), int(user), self.ttl)
+
+    async def _change(self, chat, user, change):
+        chat, user = self.check_address(chat=chat, user=user)
+        await run_db(_modify, int(chat), int(user), self.ttl, change)
+
+    async def get_state(self, *,
+                        chat: typing.Union[str, int, None] = None,
+                        user: typing.Union[str, int, None] = None,
+                        default: typing.Optional[str] = None) -> typing.Optional[str]:
+        record = await self._get(chat, user)
+        return record["state"] or self.resolve_state(default)
+
+    async def get_data(self, *,
+                       chat: typing.Union[str, int, None] = None,
+                       user: typing.Union[str, int, None] = None,
+                       default: typing.Optional[dict] = None) -> typing.Dict:
+        record = await self._get(chat, user)
+        return record["data"] or copy.deepcopy(default or {})
+
+    async def set_state(self, *,
+                        chat: typing.Union[str, int, None] = None,
+                        user: typing.Union[str, int, None] = None,
+                        state: typing.AnyStr = None):
+        state = self.resolve_state(state)
+        await self._change(chat, user, lambda current: current.update(state=state))
+
+    async def set_data(self, *,
+                       chat: typing.Union[str, int, None] = None,
+                       user: typing.Union[str, int, None] = None,
+                       data: typing.Dict = None):
+        data = copy.deepcopy(data or {})
+        await self._change(chat, user, lambda current: current.update(data=data))
+
+    async def update_data(self, *,
+                          chat: typing.Union[str, int, None] = None,
+                          user: typing.Union[str, int, None] = None,
+                          data: typing.Dict = None, **kwargs):
+        update = dict(data or {}, **kwargs)
+        await self._change(chat, user, lambda current: current["data"].update(update))
+
+    async def reset_state(self, *,
+                          chat: typing.Union[str, int, None] = None,
+                          user: typing.Union[str, int, None] = None,
+                          with_data: typing.Optional[bool] = True):
+        def change(current):
+            current["state"] = None
+            if with_data:
+                current["data"] = {}
+        await self._change(chat, user, change)
+
+    def has_bucket(self):
+        return True
+
+    async def get_bucket(self, *,
+                         chat: typing.Union[str, int, None] = None,
+                         user: typing.Union[str, int, None] = None,
+                         default: typing.Optional[dict] = None) -> typing.Dict:
+        record = await self._get(chat, user)
+        return record["bucket"] or copy.deepcopy(default or {})
+
+    async def set_bucket(self, *,
+                         chat: typing.Union[str, int, None] = None,
+                         user: typing.Union[str, int, None] = None,
+                         bucket: typing.Dict = None):
+        bucket = copy.deepcopy(bucket or {})
+        await self._change(chat, user, lambda current: current.update(bucket=bucket))
+
+    async def update_bucket(self, *,
+                            chat: typing.Union[str, int, None] = None,
+                            user: typing.Union[str, int, None] = None,
+                            bucket: typing.Dict = None, **kwargs):
+        update = dict(bucket or {}, **kwargs)
+        await self._change(chat, user, lambda current: current["bucket"].update(update))
+
+def create_storage(url=FSM_STORAGE):
+    """Создает хранилище FSM по настройке FSM_STORAGE"""
+    if url == "memory":
+        return MemoryStorage()
+    if url.startswith(("redis://", "rediss://")):
+        # Требует пакет aioredis; TTL применяется на стороне Redis
+        from urllib.parse import urlparse
+        from aiogram.contrib.fsm_storage.redis import RedisStorage2
+        parsed = urlparse(url)
+        return RedisStorage2(
+            host=parsed.hostname or "localhost",
+            port=parsed.port or 6379,
+            db=int(parsed.path.lstrip("/") or 0),
+            password=parsed.password,
+            ssl=parsed.scheme == "rediss",
+            state_ttl=FSM_TTL,
+            data_ttl=FSM_TTL,
+            bucket_ttl=FSM_TTL,
+        )
+    if url == "db":
+        return DBStorage()
+    raise ValueError(f"Неизвестное хранилище FSM: {url}")
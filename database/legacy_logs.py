@@ -0,0 +1,255 @@
+import argparse
+import codecs
+import csv
+import io
+import json
+import logging
+import os
+import re
+from collections import Counter
+from datetime import datetime
+from sqlalchemy import select, insert
+
+from config import AUDIT_RETENTION_MONTHS, AUDIT_ARCHIVE_DIR
+from database.actions import audit_catalog, render_details
+from database.database import get_db_session
+from database.models import UserLog, AuditImport
+from database.partitions import retention_cutoff, write_archive
+from database.rollups import update_rollups
+
+logger = logging.getLogger(__name__)
+
+# Записей в одной транзакции (вставка, агрегаты и отметка о прогрессе)
+BATCH_SIZE = 5000
+# Размер блока чтения файла, байт
+CHUNK_SIZE = 1 << 16
+# Разделители между элементами массива верхнего уровня (ASCII: символ = байт)
+SEPARATORS = " \t\r\n[,"
+# Элемент, не разобранный и за столько байт, считается поврежденным
+MAX_RECORD_SIZE = 1 << 20
+# Граница элементов массива: поврежденный фрагмент пропускается до начала следующего элемента
+RECORD_BOUNDARY = re.compile(r"\}\s*,\s*(?=\{)")
+# Хвост буфера, который сохраняется при поиске границы (граница может попасть на стык блоков)
+BOUNDARY_TAIL = 256
+
+COPY_SQL = "COPY user_logs (timestamp, user_id, username, action, template, args) FROM STDIN WITH (FORMAT csv)"
+
+def iter_records(file, position=0, chunk_size=CHUNK_SIZE, max_record_size=MAX_RECORD_SIZE):
+    """
+    Потоково разбирает JSON-массив из бинарного файла, не загружая его целиком.
+    Возвращает пары (элемент, смещение в байтах сразу после него): с этого смещения
+    разбор можно продолжить в следующий раз. Поврежденный фрагмент (элемент, не разобранный
+    до конца файла или за max_record_size байт) пропускается до следующего элемента
+    и возвращается как (None, смещение после фрагмента)
+    """
+    decoder = json.JSONDecoder()
+    reader = codecs.getincrementaldecoder("utf-8")()
+    file.seek(position)
+    buffer = ""
+    eof = False
+    damaged = None  # Смещение начала поврежденного фрагмента, пока ищется его конец
+    while True:
+        if damaged is None:
+            stripped = buffer.lstrip(SEPARATORS)
+            position += len(buffer) - len(stripped)
+            buffer = stripped
+            if buffer.startswith("]"):
+                return
+            if buffer:
+                try:
+                    record, end = decoder.raw_decode(buffer)
+                except json.JSONDecodeError:
+                    # Элемент прочитан не полностью или поврежден
+                    if eof or len(buffer.encode("utf-8")) > max_record_size:
+                        damaged = position
+                else:
+                    position += len(buffer[:end].encode("utf-8"))
+                    buffer = buffer[end:]
+                    yield record, position
+                    continue
+            elif eof:
+                return
+        if damaged is not None:
+            match = RECORD_BOUNDARY.search(buffer)
+            if match is not None or eof:
+                skipped = buffer[:match.end()] if match is not None else buffer
+                position += len(skipped.encode("utf-8"))
+                buffer = buffer[len(skipped):]
+                logger.warning("Поврежденный фрагмент журнала пропущен: байты %s-%s", damaged, position)
+                damaged = None
+                yield None, position
+                continue
+            # Граница еще не прочитана: буфер не растет, пока она ищется
+            skipped = buffer[:-BOUNDARY_TAIL]
+            position += len(skipped.encode("utf-8"))
+            buffer = buffer[len(skipped):]
+        chunk = file.read(chunk_size)
+        eof = not chunk
+        buffer += reader.decode(chunk, final=eof)
+
+def _legacy_row(record):
+    """Элемент старого журнала -> строка для add_user_logs или None, если он некорректен"""
+    try:
+        return {
+            "timestamp": datetime.fromisoformat(record["timestamp"]),
+            "user_id": int(record["user_id"]),
+            "username": record.get("username"),
+            "action": str(record["action"]),
+            "details": record.get("details") or "",
+        }
+    except (AttributeError, KeyError, TypeError, ValueError) as e:
+        logger.warning("Некорректная запись старого журнала пропущена (%s): %s", e, record)
+        return None
+
+def _drop_existing(db, rows):
+    """Убирает из пачки записи, которые уже есть в user_logs (повторный импорт, частичная загрузка)"""
+    existing = Counter(
+        (timestamp, user_id, action, render_details(template, args))
+        for timestamp, user_id, action, template, args in db.execute(
+            select(UserLog.timestamp, UserLog.user_id, UserLog.action, UserLog.template, UserLog.args).where(
+                UserLog.timestamp.between(min(row["timestamp"] for row in rows), max(row["timestamp"] for row in rows)),
+                UserLog.user_id.in_({row["user_id"] for row in rows})
+            )
+        )
+    )
+    fresh = []
+    for row in rows:
+        key = (row["timestamp"], row["user_id"], row["action"], render_details(row["template"], row["args"]))
+        # Одинаковые записи в самом журнале возможны: пропускается столько, сколько уже есть в таблице
+        if existing[key]:
+            existing[key] -= 1
+            continue
+        fresh.append(row)
+    return fresh
+
+def _copy_rows(db, rows):
+    """Вставка через COPY (PostgreSQL) в транзакции сессии"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        args = json.dumps(row["args"], ensure_ascii=False) if row["args"] is not None else None
+        writer.writerow([
+            row["timestamp"].isoformat(sep=" "), row["user_id"], row["username"], row["action"], row["template"], args
+        ])
+    buffer.seek(0)
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(COPY_SQL, buffer)
+    finally:
+        cursor.close()
+
+def _archive_batch(source, records, start, end, archive_dir):
+    """
+    Записи старше срока хранения выгружаются сразу в архив: в user_logs для их месяцев
+    уже нет секций (PostgreSQL) или они были бы выгружены при следующем обслуживании.
+    Имя файла определяется частью журнала, поэтому после сбоя пачка не выгружается дважды
+    """
+    name = os.path.splitext(os.path.basename(source))[0]
+    path = os.path.join(archive_dir, f"user_logs_import_{name}_{start}-{end}.jsonl.gz")
+    try:
+        write_archive(({"id": None, **record} for record in records), path)
+    except FileExistsError:
+        logger.info("Записи %s (байты %s-%s) уже выгружены в %s", source, start, end, path)
+
+def _write_batch(source, records, invalid, position, stats, cutoff, archive_dir, completed=False):
+    """
+    Записывает пачку и отметку о прогрессе одной транзакцией: после сбоя импорт продолжится с position.
+    invalid — число пропущенных некорректных записей в этой части файла. Записи старше cutoff
+    не попадают в user_logs и агрегаты, а выгружаются в архив до фиксации отметки
+    """
+    archived = [record for record in records if record["timestamp"] < cutoff]
+    if archived:
+        _archive_batch(source, archived, stats["position"], position, archive_dir)
+        records = [record for record in records if record["timestamp"] >= cutoff]
+    imported = 0
+    with get_db_session() as db:
+        if records:
+            audit_catalog.sync(db)
+            rows = _drop_existing(db, [audit_catalog.encode(db, record) for record in records])
+            if rows:
+                if db.get_bind().dialect.name == "postgresql":
+                    _copy_rows(db, rows)
+                else:
+                    db.execute(insert(UserLog), rows)
+                update_rollups(db, rows)
+            imported = len(rows)
+        skipped = len(records) - imported + invalid
+        now = datetime.utcnow()
+        db.merge(AuditImport(
+            source=source,
+            position=position,
+            imported=stats["imported"] + imported,
+            skipped=stats["skipped"] + skipped,
+            archived=stats["archived"] + len(archived),
+            updated_at=now,
+            completed_at=now if completed else None,
+        ))
+    stats["imported"] += imported
+    stats["skipped"] += skipped
+    stats["archived"] += len(archived)
+    stats["position"] = position
+
+def import_legacy_logs(path, batch_size=BATCH_SIZE, restart=False,
+                       retention=AUDIT_RETENTION_MONTHS, archive_dir=AUDIT_ARCHIVE_DIR):
+    """
+    Импортирует старый журнал (JSON-массив записей user_logs.json) в user_logs.
+    Продолжает с отметки прошлого запуска, если restart=False; записи, которые уже есть
+    в таблице, пропускаются, а записи старше срока хранения (retention месяцев) выгружаются
+    сразу в архив archive_dir. Возвращает {"imported", "skipped", "archived", "position"}
+    """
+    source = os.path.abspath(path)
+    size = os.path.getsize(path)
+    cutoff = retention_cutoff(retention)
+    stats = {"imported": 0, "skipped": 0, "archived": 0, "position": 0}
+    with get_db_session() as db:
+        state = db.get(AuditImport, source)
+        if state is not None and not restart:
+            saved = {"imported": state.imported, "skipped": state.skipped, "archived": state.archived, "position": state.position}
+            if state.completed_at is not None:
+                logger.info("Журнал %s уже импортирован %s (повторить: --restart)", path, state.completed_at)
+                return saved
+            if state.position <= size:
+                stats = saved
+            else:
+                logger.warning("Журнал %s изменился после прошлого импорта, импорт начат заново", path)
+    if stats["position"]:
+        logger.info("Импорт %s продолжается с байта %s", path, stats["position"])
+    invalid = 0
+    batch = []
+    parsed = 0
+    position = stats["position"]
+    with open(path, "rb") as file:
+        for record, position in iter_records(file, stats["position"]):
+            parsed += 1
+            # Поврежденный фрагмент уже записан в лог iter_records
+            row = _legacy_row(record) if record is not None else None
+            if row is None:
+                invalid += 1
+            else:
+                batch.append(row)
+            if parsed >= batch_size:
+                _write_batch(source, batch, invalid, position, stats, cutoff, archive_dir)
+                logger.info(
+                    "Импорт %s: %.1f%%, добавлено %s, в архив %s, пропущено %s",
+                    path, position * 100 / size if size else 100, stats["imported"], stats["archived"], stats["skipped"]
+                )
+                batch, parsed, invalid = [], 0, 0
+    _write_batch(source, batch, invalid, position, stats, cutoff, archive_dir, completed=True)
+    logger.info(
+        "Импорт %s завершен: добавлено %s, в архив %s, пропущено %s",
+        path, stats["imported"], stats["archived"], stats["skipped"]
+    )
+    return stats
+
+# Импорт старого журнала: python -m database.legacy_logs [user_logs.json]
+if __name__ == "__main__":
+    from database.migrations import ensure_schema
+
+    parser = argparse.ArgumentParser(prog="python -m database.legacy_logs", description="Импорт старого журнала в user_logs")
+    parser.add_argument("path", nargs="?", default="user_logs.json", help="JSON-файл журнала")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Записей в одной транзакции")
+    parser.add_argument("--restart", action="store_true", help="Начать с начала файла, а не с отметки прошлого запуска")
+    arguments = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    ensure_schema()
+    import_legacy_logs(arguments.path, arguments.batch_size, arguments.restart)
@@ -0,0 +1,96 @@
+import importlib
+import logging
+import pkgutil
+from datetime import datetime
+from sqlalchemy import MetaData, Table, Column, Integer, String, DateTime, inspect, insert, select, func, text
+
+from config import DB_AUTO_MIGRATE
+from database.database import get_engine
+
+logger = logging.getLogger(__name__)
+
+# Ключ advisory-блокировки: миграции выполняет только один процесс
+MIGRATION_LOCK_KEY = 827302
+
+metadata = MetaData()
+schema_version = Table(
+    "schema_version", metadata,
+    Column("version", Integer, primary_key=True),
+    Column("description", String, nullable=True),
+    Column("applied_at", DateTime, nullable=False, default=datetime.utcnow),
+)
+
+def load_migrations():
+    """
+    Загружает миграции из модулей vNNNN_*.py по возрастанию версии.
+
+    Модуль миграции задает VERSION, функцию upgrade(conn) и, для долгих
+    операций вроде CREATE INDEX CONCURRENTLY, TRANSACTIONAL = False — тогда
+    миграция выполняется вне транзакции и должна быть идемпотентной.
+    """
+    modules = [
+        importlib.import_module(f"{__name__}.{info.name}")
+        for info in pkgutil.iter_modules(__path__)
+        if info.name.startswith("v")
+    ]
+    return sorted(modules, key=lambda module: module.VERSION)
+
+def latest_version():
+    """Версия последней миграции по именам модулей vNNNN_*.py, без их импорта"""
+    return max(int(info.name[1:5]) for info in pkgutil.iter_modules(__path__) if info.name.startswith("v"))
+
+def get_schema_version():
+    """Возвращает текущую версию схемы (0, если миграции еще не применялись)"""
+    with get_engine().connect() as conn:
+        if not inspect(conn).has_table("schema_version"):
+            return 0
+        return conn.execute(select(func.max(schema_version.c.version))).scalar() or 0
+
+def _apply(migration, conn):
+    migration.upgrade(conn)
+    conn.execute(insert(schema_version).values(
+        version=migration.VERSION,
+        description=(migration.__doc__ or "").strip(),
+        applied_at=datetime.utcnow()
+    ))
+
+def migrate(target=None):
+    """Применяет недостающие миграции по порядку. Возвращает итоговую версию схемы"""
+    engine = get_engine()
+    is_postgres = engine.dialect.name == "postgresql"
+    with engine.connect() as lock_conn:
+        if is_postgres:
+            lock_conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+            lock_conn.commit()
+        try:
+            metadata.create_all(engine, checkfirst=True)
+            current = get_schema_version()
+            for migration in load_migrations():
+                if migration.VERSION <= current or (target is not None and migration.VERSION > target):
+                    continue
+                logger.info("Применение миграции %s: %s", migration.VERSION, (migration.__doc__ or '').strip())
+                if getattr(migration, "TRANSACTIONAL", True):
+                    with engine.begin() as conn:
+                        _apply(migration, conn)
+                else:
+                    with engine.connect() as conn:
+                        conn.execution_options(isolation_level="AUTOCOMMIT")
+                        _apply(migration, conn)
+                current = migration.VERSION
+        finally:
+            if is_postgres:
+                lock_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK_KEY})
+                lock_conn.commit()
+    logger.info("Версия схемы БД: %s", current)
+    return current
+
+def ensure_schema():
+    """Проверка версии схемы при запуске; применяет миграции, только если схема устарела"""
+    current = get_schema_version()
+    # Модули миграций импортируются, только если их нужно применить
+    latest = latest_version()
+    if current >= latest:
+        return current
+    if not DB_AUTO_MIGRATE:
+        raise RuntimeError(f"Схема БД устарела ({current} < {latest}), выполните: python -m database.migrations")
+    return migrate()
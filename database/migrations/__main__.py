@@ -0,0 +1,9 @@
+import logging
+import sys
+
+from database.migrations import migrate
+
+# Применение миграций: python -m database.migrations [версия]
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    migrate(int(sys.argv[1]) if len(sys.argv) > 1 else None)
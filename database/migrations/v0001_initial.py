@@ -0,0 +1,32 @@
+"""Исходная схема: записи и логи действий пользователей"""
+from sqlalchemy import MetaData, Table, Column, Integer, String, DateTime, Text, Index
+
+VERSION = 1
+
+# Снимок схемы на момент миграции (не зависит от текущих моделей)
+metadata = MetaData()
+Table(
+    "persons", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("fio", String, nullable=False, index=True),
+    Column("phone", String, nullable=False, index=True, unique=True),
+    Column("birth", String, nullable=False),
+    Column("car_number", String, nullable=True, index=True),
+    Column("address", Text, nullable=True),
+    Column("passport", String, nullable=True, index=True),
+    Index("idx_person_search", "fio", "phone"),
+)
+Table(
+    "user_logs", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("timestamp", DateTime, index=True),
+    Column("user_id", Integer, nullable=False, index=True),
+    Column("username", String, nullable=True),
+    Column("action", String, nullable=False, index=True),
+    Column("details", Text, nullable=True),
+    Index("idx_log_user_action", "user_id", "action", "timestamp"),
+)
+
+def upgrade(conn):
+    # checkfirst: базы, созданные до появления миграций, уже содержат эти таблицы
+    metadata.create_all(conn, checkfirst=True)
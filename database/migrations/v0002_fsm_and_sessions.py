@@ -0,0 +1,27 @@
+"""Таблицы состояний диалогов и сессий авторизации"""
+from sqlalchemy import MetaData, Table, Column, BigInteger, String, DateTime, JSON
+
+VERSION = 2
+
+metadata = MetaData()
+Table(
+    "fsm_storage", metadata,
+    Column("chat_id", BigInteger, primary_key=True),
+    Column("user_id", BigInteger, primary_key=True),
+    Column("state", String, nullable=True),
+    Column("data", JSON, nullable=False),
+    Column("bucket", JSON, nullable=False),
+    Column("updated_at", DateTime, nullable=False, index=True),
+)
+Table(
+    "auth_sessions", metadata,
+    Column("user_id", BigInteger, primary_key=True),
+    Column("username", String, nullable=True),
+    Column("role", String, nullable=False),
+    Column("created_at", DateTime, nullable=False),
+    Column("expires_at", DateTime, nullable=False),
+    Column("revoked_at", DateTime, nullable=True),
+)
+
+def upgrade(conn):
+    metadata.create_all(conn, checkfirst=True)
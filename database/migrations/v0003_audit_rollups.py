@@ -0,0 +1,22 @@
+"""Агрегаты логов по часам и по дням"""
+from sqlalchemy import MetaData, Table, Column, Integer, BigInteger, String, Date, DateTime
+
+VERSION = 3
+
+metadata = MetaData()
+Table(
+    "user_actions_hourly", metadata,
+    Column("hour", DateTime, primary_key=True),
+    Column("user_id", BigInteger, primary_key=True),
+    Column("action", String, primary_key=True),
+    Column("count", Integer, nullable=False),
+)
+Table(
+    "actions_daily", metadata,
+    Column("day", Date, primary_key=True),
+    Column("action", String, primary_key=True),
+    Column("count", Integer, nullable=False),
+)
+
+def upgrade(conn):
+    metadata.create_all(conn, checkfirst=True)
@@ -0,0 +1,18 @@
+"""Индекс для пагинации логов по действию, удаление избыточных индексов user_logs"""
+from sqlalchemy import text
+
+from database.partitions import is_partitioned
+
+VERSION = 4
+# Индексы строятся без блокировки записи (CONCURRENTLY), а это невозможно внутри транзакции
+TRANSACTIONAL = False
+
+def upgrade(conn):
+    online = ""
+    # Для секционированной таблицы CONCURRENTLY не поддерживается
+    if conn.dialect.name == "postgresql" and not is_partitioned(conn):
+        online = "CONCURRENTLY "
+    conn.execute(text(f"CREATE INDEX {online}IF NOT EXISTS idx_log_action_time ON user_logs (action, timestamp, id)"))
+    # Покрываются первичным ключом и составными индексами
+    for name in ("ix_user_logs_id", "ix_user_logs_user_id", "ix_user_logs_action"):
+        conn.execute(text(f"DROP INDEX {online}IF EXISTS {name}"))
@@ -0,0 +1,12 @@
+"""Секционирование user_logs по месяцам (только PostgreSQL)"""
+from config import AUDIT_PARTITIONING
+from database.partitions import is_partitioned, convert_to_partitioned, create_partitions
+
+VERSION = 5
+
+def upgrade(conn):
+    if conn.dialect.name != "postgresql" or not AUDIT_PARTITIONING:
+        return
+    if not is_partitioned(conn):
+        convert_to_partitioned(conn)
+    create_partitions(conn)
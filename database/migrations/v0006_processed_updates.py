@@ -0,0 +1,14 @@
+"""Журнал обработанных обновлений для идемпотентной обработки"""
+from sqlalchemy import MetaData, Table, Column, BigInteger, DateTime
+
+VERSION = 6
+
+metadata = MetaData()
+Table(
+    "processed_updates", metadata,
+    Column("update_id", BigInteger, primary_key=True),
+    Column("processed_at", DateTime, nullable=False, index=True),
+)
+
+def upgrade(conn):
+    metadata.create_all(conn, checkfirst=True)
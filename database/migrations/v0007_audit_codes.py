@@ -0,0 +1,361 @@
+"""Коды действий и шаблоны деталей в user_logs и агрегатах, представление user_logs_view"""
+import json
+import logging
+import time
+from contextlib import contextmanager
+from sqlalchemy import MetaData, Table, Column, SmallInteger, String, Text, text, select, insert, inspect
+from sqlalchemy.exc import OperationalError
+
+from database.actions import ACTIONS, TEMPLATES, DYNAMIC_ACTION_START, MAX_ARGS, parse_details
+from database.partitions import is_partitioned, list_partitions
+
+logger = logging.getLogger(__name__)
+
+VERSION = 7
+# Миграция не держит блокировку user_logs все время работы: коды заполняются пачками, каждая
+# фиксируется сразу, индексы строятся CONCURRENTLY, а старые столбцы удаляются короткой транзакцией
+# после заполнения. Каждый шаг проверяет, сделан ли он, поэтому прерванная миграция продолжается
+TRANSACTIONAL = False
+# Записи заполняются пачками по столько строк
+BATCH_SIZE = 5000
+# Короткая транзакция переключения ждет блокировку таблицы не дольше LOCK_TIMEOUT
+# и при занятой таблице повторяется до SWITCH_ATTEMPTS раз
+LOCK_TIMEOUT = "5s"
+SWITCH_ATTEMPTS = 10
+# PostgreSQL: lock_not_available
+LOCK_NOT_AVAILABLE = "55P03"
+
+metadata = MetaData()
+audit_actions = Table(
+    "audit_actions", metadata,
+    Column("id", SmallInteger, primary_key=True, autoincrement=False),
+    Column("name", String, nullable=False, unique=True),
+)
+audit_templates = Table(
+    "audit_templates", metadata,
+    Column("id", SmallInteger, primary_key=True, autoincrement=False),
+    Column("text", Text, nullable=False),
+)
+
+# Первичные ключи агрегатов (без action)
+ROLLUPS = {
+    "user_actions_hourly": ("hour", "user_id"),
+    "actions_daily": ("day",),
+}
+# Индексы user_logs с кодом действия; {action} — имя столбца кода
+LOG_INDEXES = {
+    "idx_log_user_action": "user_id, {action}, timestamp",
+    "idx_log_action_time": "{action}, timestamp, id",
+}
+
+@contextmanager
+def _transaction(conn):
+    """Явная транзакция на соединении миграции (оно работает в режиме AUTOCOMMIT)"""
+    conn.exec_driver_sql("BEGIN IMMEDIATE" if conn.dialect.name == "sqlite" else "BEGIN")
+    try:
+        if conn.dialect.name == "postgresql":
+            conn.exec_driver_sql(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'")
+        yield
+    except BaseException:
+        conn.exec_driver_sql("ROLLBACK")
+        raise
+    conn.exec_driver_sql("COMMIT")
+
+def _switch(conn, change):
+    """Выполняет change(conn) короткой транзакцией; если таблица занята дольше LOCK_TIMEOUT, повторяет позже"""
+    for attempt in range(1, SWITCH_ATTEMPTS + 1):
+        try:
+            with _transaction(conn):
+                change(conn)
+            return
+        except OperationalError as e:
+            if getattr(e.orig, "pgcode", None) != LOCK_NOT_AVAILABLE or attempt == SWITCH_ATTEMPTS:
+                raise
+            logger.warning("Таблица занята, переключение %s повторяется (попытка %s)", change.__name__, attempt)
+            time.sleep(attempt)
+
+def _columns(conn, table):
+    return {column["name"]: column for column in inspect(conn).get_columns(table)}
+
+def _add_columns(conn, table, columns):
+    """Добавляет недостающие столбцы {имя: тип} (без значения по умолчанию — без перезаписи таблицы)"""
+    existing = _columns(conn, table)
+    for name, type_ in columns.items():
+        if name not in existing:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {type_}"))
+
+def _seed_catalog(conn):
+    """Заполняет справочники недостающими кодами из database/actions.py"""
+    metadata.create_all(conn, checkfirst=True)
+    known = set(conn.execute(select(audit_templates.c.id)).scalars())
+    templates = [{"id": code, "text": text} for code, text in TEMPLATES.items() if code not in known]
+    if templates:
+        conn.execute(insert(audit_templates), templates)
+    known = set(conn.execute(select(audit_actions.c.name)).scalars())
+    actions = [{"id": code, "name": name} for name, code in ACTIONS.items() if name not in known]
+    if actions:
+        conn.execute(insert(audit_actions), actions)
+
+def _action_codes(conn, names):
+    """Коды действий по именам; имена, которых нет в справочнике, получают новые коды"""
+    codes = dict(conn.execute(select(audit_actions.c.name, audit_actions.c.id)).all())
+    missing = sorted(set(names) - set(codes))
+    if missing:
+        code = max(max(codes.values(), default=0), DYNAMIC_ACTION_START - 1)
+        rows = []
+        for name in missing:
+            code += 1
+            codes[name] = code
+            rows.append({"id": code, "name": name})
+        conn.execute(insert(audit_actions), rows)
+    return codes
+
+def _recode_logs_batch(conn, last):
+    """
+    Заполняет action_code, template и args одной пачки записей user_logs с id > last.
+    Возвращает id последней записи пачки или None, если незаполненных записей больше нет
+    """
+    rows = conn.execute(text(
+        "SELECT id, timestamp, action, details FROM user_logs "
+        "WHERE id > :last AND action_code IS NULL ORDER BY id LIMIT :limit"
+    ), {"last": last, "limit": BATCH_SIZE}).all()
+    if not rows:
+        return None
+    codes = _action_codes(conn, {row.action for row in rows})
+    updates = {True: [], False: []}
+    for log_id, timestamp, action, details in rows:
+        template, args = parse_details(details)
+        updates[timestamp is not None].append({
+            "id": log_id,
+            "timestamp": timestamp,
+            "action": codes[action],
+            "template": template,
+            "args": json.dumps(args, ensure_ascii=False) if args is not None else None,
+        })
+    statement = "UPDATE user_logs SET action_code = :action, template = :template, args = :args WHERE id = :id AND "
+    # По timestamp PostgreSQL обновляет только нужную секцию
+    if updates[True]:
+        conn.execute(text(statement + "timestamp = :timestamp"), updates[True])
+    if updates[False]:
+        conn.execute(text(statement + "timestamp IS NULL"), updates[False])
+    return rows[-1][0]
+
+def _first_log_id(conn):
+    return (conn.execute(text("SELECT min(id) FROM user_logs")).scalar() or 0) - 1
+
+def _recode_logs(conn):
+    """Заполняет коды всех записей user_logs; каждая пачка — отдельная транзакция"""
+    last = _first_log_id(conn)
+    count = 0
+    while True:
+        with _transaction(conn):
+            last = _recode_logs_batch(conn, last)
+        if last is None:
+            break
+        count += 1
+    logger.info("user_logs: коды записаны, пачек: %s", count)
+
+def _recode_rollup(conn, table, key):
+    """Заполняет action_code агрегата пачками по первичному ключу (key..., action); пачка — отдельная транзакция"""
+    columns = (*key, "action")
+    row_key = f"({', '.join(f't.{column}' for column in columns)})"
+    lower = f"({', '.join(f':l{index}' for index in range(len(columns)))})"
+    upper = f"({', '.join(f':u{index}' for index in range(len(columns)))})"
+    last = None
+    while True:
+        params = {f"l{index}": value for index, value in enumerate(last or ())}
+        after = f"AND {row_key} > {lower} " if last is not None else ""
+        rows = conn.execute(text(
+            f"SELECT {', '.join(columns)} FROM {table} t WHERE t.action_code IS NULL {after}"
+            f"ORDER BY {', '.join(columns)} LIMIT :limit"
+        ), {**params, "limit": BATCH_SIZE}).all()
+        if not rows:
+            return
+        params.update({f"u{index}": value for index, value in enumerate(rows[-1])})
+        with _transaction(conn):
+            _action_codes(conn, {row.action for row in rows})
+            conn.execute(text(
+                f"UPDATE {table} t SET action_code = a.id FROM audit_actions a "
+                f"WHERE a.name = t.action AND t.action_code IS NULL {after}AND {row_key} <= {upper}"
+            ), params)
+        last = tuple(rows[-1])
+
+def _recode_pending(conn, table):
+    """Коды строк агрегата, добавленных прежней версией бота после заполнения (в транзакции переключения)"""
+    names = conn.execute(text(f"SELECT DISTINCT action FROM {table} WHERE action_code IS NULL")).scalars()
+    _action_codes(conn, names)
+    conn.execute(text(
+        f"UPDATE {table} t SET action_code = a.id FROM audit_actions a "
+        f"WHERE a.name = t.action AND t.action_code IS NULL"
+    ))
+
+def _index_valid(conn, name):
+    """True/False — индекс есть и действителен/нет (остался от прерванного CONCURRENTLY), None — индекса нет"""
+    return conn.execute(text("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)"), {"name": name}).scalar()
+
+def _create_index(conn, name, table, columns, where=None, unique=False):
+    """
+    Строит индекс без блокировки записи (CREATE INDEX CONCURRENTLY). Для секционированной
+    user_logs индекс создается ON ONLY родителя, индексы секций строятся CONCURRENTLY и
+    присоединяются к нему (ATTACH PARTITION); после последней секции индекс становится действительным
+    """
+    kind = "UNIQUE INDEX" if unique else "INDEX"
+    condition = f" WHERE {where}" if where else ""
+    if table == "user_logs" and is_partitioned(conn):
+        conn.execute(text(f"CREATE {kind} IF NOT EXISTS {name} ON ONLY user_logs ({columns}){condition}"))
+        for partition, _, _ in list_partitions(conn):
+            child = f"{partition}_{name}"
+            _create_index(conn, child, partition, columns, where, unique)
+            conn.execute(text(f"ALTER INDEX {name} ATTACH PARTITION {child}"))
+        return
+    if _index_valid(conn, name) is False:
+        conn.execute(text(f"DROP INDEX CONCURRENTLY {name}"))
+    conn.execute(text(f"CREATE {kind} CONCURRENTLY IF NOT EXISTS {name} ON {table} ({columns}){condition}"))
+
+def _constraint_exists(conn, table, name):
+    return conn.execute(text(
+        "SELECT 1 FROM pg_constraint WHERE conrelid = to_regclass(:table) AND conname = :name"
+    ), {"table": table, "name": name}).scalar() is not None
+
+def _set_not_null(conn, table, column):
+    """
+    SET NOT NULL без проверки всей таблицы под блокировкой: сначала добавляется ограничение
+    CHECK NOT VALID и проверяется (VALIDATE не блокирует запись), тогда SET NOT NULL его использует
+    """
+    if not _columns(conn, table)[column]["nullable"]:
+        return
+    name = f"{table}_{column}_not_null"
+    if not _constraint_exists(conn, table, name):
+        def add_check(conn):
+            conn.execute(text(f"ALTER TABLE {table} ADD CONSTRAINT {name} CHECK ({column} IS NOT NULL) NOT VALID"))
+        _switch(conn, add_check)
+    conn.execute(text(f"ALTER TABLE {table} VALIDATE CONSTRAINT {name}"))
+
+    def set_not_null(conn):
+        conn.execute(text(f"ALTER TABLE {table} ALTER COLUMN {column} SET NOT NULL"))
+        conn.execute(text(f"ALTER TABLE {table} DROP CONSTRAINT {name}"))
+    _switch(conn, set_not_null)
+
+def _upgrade_logs_postgresql(conn):
+    if "details" in _columns(conn, "user_logs"):
+        _add_columns(conn, "user_logs", {"action_code": "SMALLINT", "template": "SMALLINT", "args": "JSON"})
+        _recode_logs(conn)
+        for name, columns in LOG_INDEXES.items():
+            _create_index(conn, f"{name}_code", "user_logs", columns.format(action="action_code"))
+        # После заполнения индекс почти пуст: по нему переключение находит записи,
+        # добавленные прежней версией бота, не читая всю таблицу
+        _create_index(conn, "idx_log_action_pending", "user_logs", "id", where="action_code IS NULL")
+
+        def switch_logs(conn):
+            # Запись ждет переключения, чтение продолжается
+            conn.execute(text("LOCK TABLE user_logs IN EXCLUSIVE MODE"))
+            last = _first_log_id(conn)
+            while last is not None:
+                last = _recode_logs_batch(conn, last)
+            statements = [
+                "DROP INDEX idx_log_action_pending",
+                # Вместе со столбцом удаляются старые индексы по имени действия
+                "ALTER TABLE user_logs DROP COLUMN action",
+                "ALTER TABLE user_logs DROP COLUMN details",
+                "ALTER TABLE user_logs RENAME COLUMN action_code TO action",
+            ]
+            statements += [f"ALTER INDEX {name}_code RENAME TO {name}" for name in LOG_INDEXES]
+            for statement in statements:
+                conn.execute(text(statement))
+        _switch(conn, switch_logs)
+    _set_not_null(conn, "user_logs", "action")
+
+def _upgrade_rollup_postgresql(conn, table, key):
+    if isinstance(_columns(conn, table)["action"]["type"], String):
+        _add_columns(conn, table, {"action_code": "SMALLINT"})
+        _recode_rollup(conn, table, key)
+        _create_index(conn, f"{table}_code_key", table, ", ".join((*key, "action_code")), unique=True)
+        _create_index(conn, f"{table}_action_pending", table, ", ".join(key), where="action_code IS NULL")
+
+        def switch_rollup(conn):
+            conn.execute(text(f"LOCK TABLE {table} IN EXCLUSIVE MODE"))
+            _recode_pending(conn, table)
+            conn.execute(text(f"DROP INDEX {table}_action_pending"))
+            # Вместе со столбцом удаляется старый первичный ключ; до нового первичного ключа
+            # upsert агрегатов (ON CONFLICT) использует уникальный индекс {table}_code_key
+            conn.execute(text(f"ALTER TABLE {table} DROP COLUMN action"))
+            conn.execute(text(f"ALTER TABLE {table} RENAME COLUMN action_code TO action"))
+        _switch(conn, switch_rollup)
+    _set_not_null(conn, table, "action")
+    if not inspect(conn).get_pk_constraint(table)["constrained_columns"]:
+        def add_primary_key(conn):
+            conn.execute(text(f"ALTER TABLE {table} ADD CONSTRAINT {table}_pkey PRIMARY KEY USING INDEX {table}_code_key"))
+        _switch(conn, add_primary_key)
+
+def _rebuild(conn, table, columns, select_columns, source):
+    """Пересоздает таблицу (SQLite не меняет тип и ограничения столбцов) с кодом действия вместо имени"""
+    conn.execute(text(f"CREATE TABLE {table}_new ({columns})"))
+    conn.execute(text(f"INSERT INTO {table}_new SELECT {select_columns} FROM {source}"))
+    conn.execute(text(f"DROP TABLE {table}"))
+    conn.execute(text(f"ALTER TABLE {table}_new RENAME TO {table}"))
+
+def _rebuild_sqlite(conn):
+    """Пересоздание таблиц SQLite одной транзакцией: прерванная миграция ничего не меняет"""
+    if "details" in _columns(conn, "user_logs"):
+        last = _first_log_id(conn)
+        while last is not None:
+            last = _recode_logs_batch(conn, last)
+        _rebuild(
+            conn, "user_logs",
+            "id INTEGER NOT NULL PRIMARY KEY, timestamp DATETIME NOT NULL, user_id INTEGER NOT NULL, "
+            "username VARCHAR, action SMALLINT NOT NULL, template SMALLINT, args JSON",
+            "id, coalesce(timestamp, '1970-01-01 00:00:00.000000'), user_id, username, action_code, template, args",
+            "user_logs",
+        )
+        conn.execute(text("CREATE INDEX ix_user_logs_timestamp ON user_logs (timestamp)"))
+        for name, columns in LOG_INDEXES.items():
+            conn.execute(text(f"CREATE INDEX {name} ON user_logs ({columns.format(action='action')})"))
+    rollups = {
+        "user_actions_hourly": (
+            "hour DATETIME NOT NULL, user_id BIGINT NOT NULL, action SMALLINT NOT NULL, count INTEGER NOT NULL, "
+            "PRIMARY KEY (hour, user_id, action)",
+            "t.hour, t.user_id, a.id, t.count",
+        ),
+        "actions_daily": (
+            "day DATE NOT NULL, action SMALLINT NOT NULL, count INTEGER NOT NULL, PRIMARY KEY (day, action)",
+            "t.day, a.id, t.count",
+        ),
+    }
+    for table, (columns, select_columns) in rollups.items():
+        if not isinstance(_columns(conn, table)["action"]["type"], String):
+            continue
+        _action_codes(conn, conn.execute(text(f"SELECT DISTINCT action FROM {table}")).scalars())
+        _rebuild(conn, table, columns, select_columns, f"{table} t JOIN audit_actions a ON a.name = t.action")
+
+def _create_view(conn):
+    """Представление с читаемыми именем действия и текстом деталей, как в прежней user_logs"""
+    if conn.dialect.name == "postgresql":
+        details = (
+            "format(t.text, VARIADIC ARRAY(SELECT json_array_elements_text(coalesce(l.args, '[]'::json))))"
+        )
+        first = "l.args->>0"
+        create = "CREATE OR REPLACE VIEW"
+    else:
+        args = ", ".join(f"json_extract(l.args, '$[{index}]')" for index in range(MAX_ARGS))
+        details = f"printf(t.text, {args})"
+        first = "json_extract(l.args, '$[0]')"
+        create = "CREATE VIEW IF NOT EXISTS"
+    conn.execute(text(f"""{create} user_logs_view AS
+        SELECT l.id, l.timestamp, l.user_id, l.username, a.name AS action,
+            CASE WHEN l.template IS NULL THEN coalesce({first}, '') ELSE {details} END AS details
+        FROM user_logs l
+        JOIN audit_actions a ON a.id = l.action
+        LEFT JOIN audit_templates t ON t.id = l.template"""))
+
+def upgrade(conn):
+    _seed_catalog(conn)
+    if conn.dialect.name == "postgresql":
+        _upgrade_logs_postgresql(conn)
+        for table, key in ROLLUPS.items():
+            _upgrade_rollup_postgresql(conn, table, key)
+    else:
+        if "details" in _columns(conn, "user_logs"):
+            _add_columns(conn, "user_logs", {"action_code": "SMALLINT", "template": "SMALLINT", "args": "JSON"})
+            _recode_logs(conn)
+        _switch(conn, _rebuild_sqlite)
+    _create_view(conn)
@@ -0,0 +1,18 @@
+"""Отметки импорта старых логов из JSON-файлов"""
+from sqlalchemy import MetaData, Table, Column, Integer, BigInteger, String, DateTime
+
+VERSION = 8
+
+metadata = MetaData()
+Table(
+    "audit_imports", metadata,
+    Column("source", String, primary_key=True),
+    Column("position", BigInteger, nullable=False),
+    Column("imported", Integer, nullable=False),
+    Column("skipped", Integer, nullable=False),
+    Column("updated_at", DateTime, nullable=False),
+    Column("completed_at", DateTime, nullable=True),
+)
+
+def upgrade(conn):
+    metadata.create_all(conn, checkfirst=True)
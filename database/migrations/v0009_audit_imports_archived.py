@@ -0,0 +1,7 @@
+"""Число записей старого журнала, выгруженных при импорте сразу в архив"""
+from sqlalchemy import text
+
+VERSION = 9
+
+def upgrade(conn):
+    conn.execute(text("ALTER TABLE audit_imports ADD COLUMN archived INTEGER NOT NULL DEFAULT 0"))
@@ -0,0 +1,109 @@
+from datetime import datetime
+from sqlalchemy import Column, Integer, SmallInteger, BigInteger, String, Date, DateTime, Text, Index, JSON
+from sqlalchemy.ext.declarative import declarative_base
+
+Base = declarative_base()
+
+# Модели данных
+class Person(Base):
+    __tablename__ = "persons"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    fio = Column(String, nullable=False, index=True)  # Индекс для быстрого поиска
+    phone = Column(String, nullable=False, index=True, unique=True)  # Индекс и уникальность
+    birth = Column(String, nullable=False)
+    car_number = Column(String, nullable=True, index=True)  # Индекс для поиска
+    address = Column(Text, nullable=True)
+    passport = Column(String, nullable=True, index=True)  # Индекс для поиска
+    
+    # Составной индекс для поиска
+    __table_args__ = (
+        Index('idx_person_search', 'fio', 'phone'),
+    )
+
+class UserLog(Base):
+    __tablename__ = "user_logs"
+    
+    # В PostgreSQL таблица секционирована по месяцам (см. database/partitions.py).
+    # Отдельные индексы на id, user_id и action не нужны: их покрывают
+    # первичный ключ и составные индексы ниже.
+    # Действие и детали хранятся кодами (см. database/actions.py), читаемый текст — в user_logs_view
+    id = Column(Integer, primary_key=True)
+    timestamp = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)  # Индекс для сортировки
+    user_id = Column(Integer, nullable=False)
+    username = Column(String, nullable=True)
+    action = Column(SmallInteger, nullable=False)  # Код из audit_actions
+    template = Column(SmallInteger, nullable=True)  # Код шаблона деталей из audit_templates
+    args = Column(JSON, nullable=True)  # Аргументы шаблона; без шаблона — [текст деталей]
+    
+    # Составной индекс для частых запросов
+    __table_args__ = (
+        Index('idx_log_user_action', 'user_id', 'action', 'timestamp'),
+        Index('idx_log_action_time', 'action', 'timestamp', 'id'),  # Keyset-пагинация по действию
+    )
+
+# Справочники кодов журнала
+class AuditAction(Base):
+    __tablename__ = "audit_actions"
+    
+    id = Column(SmallInteger, primary_key=True, autoincrement=False)
+    name = Column(String, nullable=False, unique=True)
+
+class AuditTemplate(Base):
+    __tablename__ = "audit_templates"
+    
+    id = Column(SmallInteger, primary_key=True, autoincrement=False)
+    text = Column(Text, nullable=False)  # Шаблон с подстановками %s
+
+# Агрегаты по логам, обновляются при каждой записи пачки логов
+class UserActionHourly(Base):
+    __tablename__ = "user_actions_hourly"
+    
+    hour = Column(DateTime, primary_key=True)  # Начало часа (UTC)
+    user_id = Column(BigInteger, primary_key=True)
+    action = Column(SmallInteger, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+class ActionDaily(Base):
+    __tablename__ = "actions_daily"
+    
+    day = Column(Date, primary_key=True)
+    action = Column(SmallInteger, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+class FSMRecord(Base):
+    __tablename__ = "fsm_storage"
+    
+    chat_id = Column(BigInteger, primary_key=True)
+    user_id = Column(BigInteger, primary_key=True)
+    state = Column(String, nullable=True)
+    data = Column(JSON, nullable=False, default=dict)  # Промежуточные данные диалога
+    bucket = Column(JSON, nullable=False, default=dict)  # Служебные данные (лимиты и т.п.)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)  # Индекс для очистки по TTL
+
+class AuthSession(Base):
+    __tablename__ = "auth_sessions"
+    
+    user_id = Column(BigInteger, primary_key=True)
+    username = Column(String, nullable=True)
+    role = Column(String, nullable=False)  # user или admin
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+    revoked_at = Column(DateTime, nullable=True)
+
+class ProcessedUpdate(Base):
+    __tablename__ = "processed_updates"
+    
+    update_id = Column(BigInteger, primary_key=True)  # Отметка ставится до обработки: повторная доставка пропускается
+    processed_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)  # Индекс для очистки по TTL
+
+class AuditImport(Base):
+    __tablename__ = "audit_imports"
+    
+    source = Column(String, primary_key=True)  # Путь к импортируемому файлу
+    position = Column(BigInteger, nullable=False, default=0)  # Байт файла, с которого продолжается импорт
+    imported = Column(Integer, nullable=False, default=0)
+    skipped = Column(Integer, nullable=False, default=0)  # Уже были в user_logs или некорректны
+    archived = Column(Integer, nullable=False, default=0)  # Старше срока хранения: выгружены сразу в архив
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    completed_at = Column(DateTime, nullable=True)
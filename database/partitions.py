@@ -0,0 +1,259 @@
+import asyncio
+import gzip
+import itertools
+import json
+import logging
+import os
+import re
+import tempfile
+from datetime import datetime
+from sqlalchemy import text
+
+from config import (
+    AUDIT_PARTITIONS_AHEAD, AUDIT_RETENTION_MONTHS,
+    AUDIT_ARCHIVE_DIR, AUDIT_MAINTENANCE_INTERVAL,
+)
+from database.actions import audit_catalog, render_details
+from database.database import get_engine, run_db
+
+logger = logging.getLogger(__name__)
+
+# Ключ advisory-блокировки: обслуживание секций выполняет только один процесс
+PARTITION_LOCK_KEY = 827301
+
+LOG_COLUMNS = "id, timestamp, user_id, username, action, template, args"
+
+def _month_start(value):
+    return datetime(value.year, value.month, 1)
+
+def _add_months(value, months):
+    years, month = divmod(value.month - 1 + months, 12)
+    return datetime(value.year + years, month + 1, 1)
+
+def _parse_bound(expr, keyword):
+    match = re.search(keyword + r" \('([^']+)'\)", expr)
+    return datetime.fromisoformat(match.group(1)) if match else None
+
+def is_partitioned(conn):
+    """Проверяет, секционирована ли таблица user_logs"""
+    return conn.execute(text(
+        "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('user_logs')"
+    )).scalar() is not None
+
+def list_partitions(conn):
+    """Возвращает секции user_logs: [(имя, начало или None, конец)] по возрастанию"""
+    rows = conn.execute(text(
+        "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = 'user_logs'::regclass"
+    )).all()
+    partitions = [(name, _parse_bound(expr, "FROM"), _parse_bound(expr, "TO")) for name, expr in rows]
+    return sorted(partitions, key=lambda item: item[2] or datetime.max)
+
+def convert_to_partitioned(conn):
+    """
+    Превращает обычную таблицу user_logs в секционированную по месяцам.
+
+    Существующая таблица становится секцией user_logs_legacy для всех записей
+    до начала следующего месяца, новые записи попадают в месячные секции.
+    Лишние индексы старой таблицы удаляются, остальные переиспользуются.
+    """
+    conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": PARTITION_LOCK_KEY})
+    if is_partitioned(conn):
+        return
+    sequence = conn.execute(text("SELECT pg_get_serial_sequence('user_logs', 'id')")).scalar()
+    boundary = _add_months(_month_start(datetime.utcnow()), 1)
+    latest = conn.execute(text("SELECT max(timestamp) FROM user_logs")).scalar()
+    if latest is not None and latest >= boundary:
+        boundary = _add_months(_month_start(latest), 1)
+    statements = [
+        "ALTER TABLE user_logs RENAME TO user_logs_legacy",
+        # Первичный ключ секции должен совпадать с ключом (id, timestamp) родительской таблицы
+        "ALTER TABLE user_logs_legacy DROP CONSTRAINT user_logs_pkey",
+        "DROP INDEX IF EXISTS ix_user_logs_id",
+        "DROP INDEX IF EXISTS ix_user_logs_user_id",
+        "DROP INDEX IF EXISTS ix_user_logs_action",
+        "ALTER INDEX IF EXISTS ix_user_logs_timestamp RENAME TO ix_user_logs_legacy_timestamp",
+        "ALTER INDEX IF EXISTS idx_log_user_action RENAME TO idx_log_legacy_user_action",
+        "ALTER INDEX IF EXISTS idx_log_action_time RENAME TO idx_log_legacy_action_time",
+        # Последовательность не должна удалиться вместе со старой секцией при архивировании
+        f"ALTER SEQUENCE {sequence} OWNED BY NONE",
+        "UPDATE user_logs_legacy SET timestamp = '1970-01-01' WHERE timestamp IS NULL",
+        "ALTER TABLE user_logs_legacy ALTER COLUMN timestamp SET NOT NULL",
+        f"""CREATE TABLE user_logs (
+            id INTEGER NOT NULL DEFAULT nextval('{sequence}'),
+            timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            user_id INTEGER NOT NULL,
+            username VARCHAR,
+            action VARCHAR NOT NULL,
+            details TEXT,
+            PRIMARY KEY (id, timestamp)
+        ) PARTITION BY RANGE (timestamp)""",
+        "CREATE INDEX ix_user_logs_timestamp ON user_logs (timestamp)",
+        "CREATE INDEX idx_log_user_action ON user_logs (user_id, action, timestamp)",
+        "CREATE INDEX idx_log_action_time ON user_logs (action, timestamp, id)",
+        f"ALTER TABLE user_logs ATTACH PARTITION user_logs_legacy "
+        f"FOR VALUES FROM (MINVALUE) TO ('{boundary.isoformat()}')",
+    ]
+    for statement in statements:
+        conn.execute(text(statement))
+    logger.info("Таблица user_logs секционирована, старые записи — в user_logs_legacy (до %s)", boundary.date())
+
+def create_partitions(conn, ahead=AUDIT_PARTITIONS_AHEAD):
+    """Создает месячные секции от последней существующей до текущего месяца + ahead"""
+    partitions = list_partitions(conn)
+    start = _month_start(datetime.utcnow())
+    if partitions and partitions[-1][2] is not None:
+        start = max(start, partitions[-1][2])
+    end = _add_months(_month_start(datetime.utcnow()), ahead + 1)
+    while start < end:
+        finish = _add_months(start, 1)
+        name = f"user_logs_{start:%Y%m}"
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF user_logs "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{finish.isoformat()}')"
+        ))
+        logger.info("Создана секция логов %s", name)
+        start = finish
+
+def retention_cutoff(retention=AUDIT_RETENTION_MONTHS):
+    """Начало самого старого месяца, логи которого хранятся в БД; более старые выгружаются в архив"""
+    return _add_months(_month_start(datetime.utcnow()), -retention)
+
+def _archive_path(archive_dir, name, run):
+    """Имя архива уникально для запуска: архив того же месяца от прошлого запуска не затрагивается"""
+    return os.path.join(archive_dir, f"{name}_{run:%Y%m%dT%H%M%S%f}.jsonl.gz")
+
+def write_archive(records, path):
+    """
+    Записывает записи журнала (словари с читаемыми действием и деталями) в сжатый JSONL-файл.
+    Возвращает число записей; если записей нет, файл не создается.
+    Существующий файл не перезаписывается (FileExistsError)
+    """
+    records = iter(records)
+    first = next(records, None)
+    if first is None:
+        return 0
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    # Временный файл свой у каждого запуска
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + ".", suffix=".tmp")
+    count = 0
+    try:
+        with os.fdopen(fd, "wb") as raw, gzip.open(raw, "wt", encoding="utf-8") as archive:
+            for record in itertools.chain([first], records):
+                if isinstance(record["timestamp"], datetime):
+                    record = dict(record, timestamp=record["timestamp"].isoformat())
+                archive.write(json.dumps(record, ensure_ascii=False) + "\n")
+                count += 1
+        # Файл появляется под итоговым именем только целиком; в отличие от os.replace,
+        # os.link не заменяет уже существующий архив
+        os.link(temp_path, path)
+    finally:
+        os.remove(temp_path)
+    return count
+
+def export_rows(conn, query, params, path):
+    """
+    Потоково выгружает строки логов в архив (write_archive). Возвращает число строк.
+    Коды действия и шаблона в архиве заменяются читаемыми именем действия и текстом деталей
+    """
+    def records():
+        for row in conn.execute(text(query).execution_options(stream_results=True), params).yield_per(1000):
+            record = dict(row._mapping)
+            record["action"] = audit_catalog.name(conn, record["action"])
+            record["details"] = render_details(record.pop("template"), record.pop("args"))
+            yield record
+    return write_archive(records(), path)
+
+def archive_partitions(conn, retention=AUDIT_RETENTION_MONTHS, archive_dir=AUDIT_ARCHIVE_DIR):
+    """Выгружает в архив и удаляет секции, целиком старше срока хранения"""
+    cutoff = retention_cutoff(retention)
+    run = datetime.utcnow()
+    for name, start, end in list_partitions(conn):
+        if end is None or end > cutoff:
+            continue
+        path = _archive_path(archive_dir, name, run)
+        count = export_rows(conn, f"SELECT {LOG_COLUMNS} FROM {name} ORDER BY timestamp, id", {}, path)
+        conn.execute(text(f"ALTER TABLE user_logs DETACH PARTITION {name}"))
+        conn.execute(text(f"DROP TABLE {name}"))
+        if count:
+            logger.info("Секция %s (%s записей) выгружена в %s и удалена", name, count, path)
+        else:
+            logger.info("Пустая секция %s удалена", name)
+
+def archive_old_rows(conn, retention=AUDIT_RETENTION_MONTHS, archive_dir=AUDIT_ARCHIVE_DIR):
+    """Архивирование без секций: выгружает и удаляет записи старше срока хранения по месяцам"""
+    cutoff = retention_cutoff(retention)
+    oldest = conn.execute(text("SELECT min(timestamp) FROM user_logs")).scalar()
+    if oldest is None:
+        return
+    if isinstance(oldest, str):
+        oldest = datetime.fromisoformat(oldest)
+    run = datetime.utcnow()
+    start = _month_start(oldest)
+    while start < cutoff:
+        finish = _add_months(start, 1)
+        params = {"start": start, "finish": finish}
+        path = _archive_path(archive_dir, f"user_logs_{start:%Y%m}", run)
+        count = export_rows(
+            conn,
+            f"SELECT {LOG_COLUMNS} FROM user_logs "
+            "WHERE timestamp >= :start AND timestamp < :finish ORDER BY timestamp, id",
+            params, path
+        )
+        # Пустой месяц пропускается: файл не создается
+        if count:
+            conn.execute(text("DELETE FROM user_logs WHERE timestamp >= :start AND timestamp < :finish"), params)
+            logger.info("Логи за %s (%s записей) выгружены в %s", start.strftime("%Y-%m"), count, path)
+        start = finish
+
+def lock_maintenance(conn):
+    """Блокировка обслуживания логов до конца транзакции: архивирует только один процесс"""
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": PARTITION_LOCK_KEY})
+    elif conn.dialect.name == "sqlite":
+        # Блокировка записи в БД до фиксации; второй архиватор ждет ее и видит уже удаленные строки
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+    else:
+        conn.execute(text("SELECT version FROM schema_version FOR UPDATE"))
+
+def maintain_partitions(retention=AUDIT_RETENTION_MONTHS, archive_dir=AUDIT_ARCHIVE_DIR):
+    """Создает будущие секции и архивирует старые данные"""
+    with get_engine().begin() as conn:
+        lock_maintenance(conn)
+        # Секционирование включает миграция схемы (v0005)
+        if conn.dialect.name == "postgresql" and is_partitioned(conn):
+            create_partitions(conn)
+            archive_partitions(conn, retention, archive_dir)
+        else:
+            archive_old_rows(conn, retention, archive_dir)
+
+class PartitionManager:
+    """Периодически обслуживает секции user_logs в фоне"""
+
+    def __init__(self, interval=AUDIT_MAINTENANCE_INTERVAL):
+        self.interval = interval
+        self._task = None
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="audit-partitions")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await run_db(maintain_partitions)
+            except Exception as e:
+                logger.error("Ошибка обслуживания секций логов: %s", e, exc_info=True)
+            await asyncio.sleep(self.interval)
+
+partition_manager = PartitionManager()
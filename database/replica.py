@@ -0,0 +1,89 @@
+import logging
+import threading
+import time
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# Отставание реплики PostgreSQL в секундах; 0 — если это не реплика или она применила все полученные изменения
+PG_REPLICATION_LAG = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+def measure_lag(engine, timeout=None):
+    """
+    Отставание реплики, секунд. Для других СУБД только проверяет соединение и возвращает 0.
+    timeout — срок запроса проверки, секунд (PostgreSQL)
+    """
+    with engine.connect() as conn:
+        if engine.dialect.name == "postgresql":
+            if timeout:
+                # Только для транзакции проверки: соединение возвращается в пул без ограничения
+                conn.execute(text(f"SET LOCAL statement_timeout = {int(timeout * 1000)}"))
+            return float(conn.execute(PG_REPLICATION_LAG).scalar() or 0)
+        conn.execute(text("SELECT 1"))
+        return 0.0
+
+class ReplicaRouter:
+    """
+    Решает, можно ли читать с реплики. Состояние обновляется не чаще раза
+    в check_interval секунд: первый запрос после срока запускает проверку в отдельном
+    потоке и не ждет соединения с репликой. Пока проверка идет, чтение идет в основную БД;
+    реплика используется, пока она отвечает и отстает не больше чем на max_lag секунд.
+    После ошибки запроса к реплике чтение идет в основную БД до следующей проверки.
+    """
+
+    def __init__(self, engine, max_lag, check_interval, timeout=None):
+        self.engine = engine
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.timeout = timeout
+        self.lag = None
+        self._healthy = False
+        self._checking = False
+        self._next_check = 0.0
+        self._lock = threading.Lock()  # Занята, пока идет проверка
+
+    def available(self):
+        if self.engine is None:
+            return False
+        if time.monotonic() >= self._next_check and self._lock.acquire(blocking=False):
+            self._checking = True
+            threading.Thread(target=self._check, name="replica-check", daemon=True).start()
+        return self._healthy and not self._checking
+
+    def mark_down(self, error):
+        """Переключает чтение на основную БД до следующей проверки"""
+        if self._healthy:
+            logger.warning("Реплика недоступна, чтение переключено на основную БД: %s", error)
+        self._healthy = False
+        self._next_check = time.monotonic() + self.check_interval
+
+    def _check(self):
+        try:
+            self._refresh()
+        finally:
+            self._checking = False
+            self._lock.release()
+
+    def _refresh(self):
+        try:
+            self.lag = measure_lag(self.engine, self.timeout)
+        except Exception as e:
+            self.lag = None
+            healthy = False
+            reason = f"ошибка проверки: {e}"
+        else:
+            healthy = self.lag <= self.max_lag
+            reason = f"отставание {self.lag:.1f} с"
+        if healthy != self._healthy:
+            if healthy:
+                logger.info("Чтение переключено на реплику (%s)", reason)
+            else:
+                logger.warning("Чтение переключено на основную БД (%s)", reason)
+        self._healthy = healthy
+        self._next_check = time.monotonic() + self.check_interval
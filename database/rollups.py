@@ -0,0 +1,39 @@
+from collections import Counter
+from sqlalchemy import update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from database.models import UserActionHourly, ActionDaily
+
+def _increment(db, model, counts):
+    """Увеличивает счетчики агрегата; counts: {первичный ключ (кортеж): прирост}"""
+    if not counts:
+        return
+    keys = [column.name for column in model.__table__.primary_key.columns]
+    rows = [dict(zip(keys, key), count=value) for key, value in counts.items()]
+    dialect = db.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        # Атомарный upsert одной командой
+        module = postgresql if dialect == "postgresql" else sqlite
+        statement = module.insert(model).values(rows)
+        statement = statement.on_conflict_do_update(
+            index_elements=keys,
+            set_={"count": model.count + statement.excluded.count}
+        )
+        db.execute(statement)
+        return
+    for row in rows:
+        condition = [getattr(model, key) == row[key] for key in keys]
+        result = db.execute(update(model).where(*condition).values(count=model.count + row["count"]))
+        if not result.rowcount:
+            db.add(model(**row))
+
+def update_rollups(db, rows):
+    """Учитывает пачку логов в почасовых и дневных агрегатах (в текущей транзакции)"""
+    hourly = Counter()
+    daily = Counter()
+    for row in rows:
+        timestamp = row["timestamp"]
+        hourly[(timestamp.replace(minute=0, second=0, microsecond=0), row["user_id"], row["action"])] += 1
+        daily[(timestamp.date(), row["action"])] += 1
+    _increment(db, UserActionHourly, hourly)
+    _increment(db, ActionDaily, daily)
@@ -0,0 +1,172 @@
+import contextlib
+import contextvars
+import logging
+import threading
+import time
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# SQLite проверяет срок и отмену через каждые столько инструкций виртуальной машины
+SQLITE_PROGRESS_STEPS = 1000
+
+class QueryTimeout(Exception):
+    """Запрос к БД не уложился в срок функции (@statement_timeout) и был прерван"""
+
+    def __init__(self, function, timeout):
+        super().__init__(f"Запрос к БД {function} не уложился в {timeout} с")
+        self.function = function
+        self.timeout = timeout
+
+def statement_timeout(seconds):
+    """
+    Помечает функцию работы с БД как запрос обработчика: при вызове через run_db() она
+    прерывается через seconds секунд (0 — без срока) или при отмене обработки обновления.
+    Новая команда чата прерывает только функции чтения (@read_only)
+    """
+    def decorator(func):
+        func.statement_timeout = seconds
+        return func
+    return decorator
+
+class DbCall:
+    """
+    Вызов функции с @statement_timeout через run_db(): срок и отмена.
+    Соединения, выданные пулом потоку вызова, запоминаются, чтобы прервать их запросы:
+    SQLite проверяет срок сама (обработчик прогресса), PostgreSQL получает statement_timeout
+    в начале транзакции, а при отмене — запрос отмены от interrupt().
+    """
+
+    def __init__(self, function, timeout):
+        self.function = function
+        self.timeout = timeout or None
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self.cancelled = False
+        self.interrupted = False  # Запрос завершился ошибкой из-за срока или отмены
+        self._connections = set()
+        self._lock = threading.Lock()
+
+    def expired(self):
+        return self.cancelled or (self.deadline is not None and time.monotonic() >= self.deadline)
+
+    def remaining(self):
+        return None if self.deadline is None else max(self.deadline - time.monotonic(), 0)
+
+    def run(self, func, args, kwargs):
+        """Выполняет func в потоке БД. Вызов, запрос которого был прерван, завершается QueryTimeout"""
+        current_call.set(self)
+        if self.expired():
+            # Срок истек, пока вызов ждал свободного потока
+            raise QueryTimeout(self.function, self.timeout)
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            if self.interrupted:
+                raise QueryTimeout(self.function, self.timeout) from e
+            raise
+        if self.interrupted:
+            # Функция перехватила ошибку прерванного запроса и вернула значение по умолчанию
+            raise QueryTimeout(self.function, self.timeout)
+        return result
+
+    def cancel(self):
+        """Отмечает вызов отмененным. Возвращает True, если нужен interrupt() (запросы на сервере PostgreSQL)"""
+        self.cancelled = True
+        with self._lock:
+            return any(hasattr(connection, "cancel") for connection in self._connections)
+
+    def interrupt(self):
+        """Отменяет выполняющиеся запросы на сервере. Блокирует поток: отмена идет отдельным соединением"""
+        with self._lock:
+            for connection in self._connections:
+                try:
+                    connection.cancel()
+                except Exception as e:
+                    logger.warning("Не удалось отменить запрос %s: %s", self.function, e)
+
+    def attach(self, dbapi_connection):
+        with self._lock:
+            self._connections.add(dbapi_connection)
+
+    def detach(self, dbapi_connection):
+        with self._lock:
+            self._connections.discard(dbapi_connection)
+
+# Вызов run_db(), выполняющийся в текущем потоке БД
+current_call = contextvars.ContextVar("db_call", default=None)
+
+class Interruptible:
+    """
+    Обработка обновления, которую новая команда того же чата может прервать.
+    Прерывается только ожидание чтения из БД (@read_only с @statement_timeout: поиск, просмотр логов):
+    записи (сохранение записи, состояние диалога, авторизация) всегда завершаются.
+    Запрос, пришедший вне чтения, прерывает следующее чтение этой обработки
+    """
+
+    def __init__(self):
+        self.task = None  # Задача обработки (задает UpdatePool)
+        self.requested = False
+        self._reading = 0
+
+    def interrupt(self):
+        """Запрашивает прерывание: сразу, если обработка ждет чтения, иначе — при следующем чтении"""
+        self.requested = True
+        if self._reading:
+            self.task.cancel()
+
+    @contextlib.contextmanager
+    def reading(self):
+        """Ожидание чтения из БД, которое можно прервать (вызывается в задаче обработки)"""
+        self._reading += 1
+        try:
+            if self.requested:
+                self.task.cancel()
+            yield
+        finally:
+            self._reading -= 1
+
+# Обработка обновления, выполняющаяся в текущей задаче (устанавливает UpdatePool)
+current_handler = contextvars.ContextVar("interruptible", default=None)
+
+def call_expired():
+    """Текущий запрос прерван по сроку или отмене (ошибка соединения здесь ни при чем)"""
+    call = current_call.get()
+    return call is not None and call.expired()
+
+def install(engine):
+    """Подключает к движку прерывание запросов вызовов с @statement_timeout"""
+    event.listen(engine, "checkout", _on_checkout)
+    event.listen(engine, "checkin", _on_checkin)
+    event.listen(engine, "handle_error", _on_error)
+    if engine.dialect.name == "sqlite":
+        event.listen(engine, "connect", _on_sqlite_connect)
+
+def set_statement_timeout(session, transaction, connection):
+    """after_begin сессии: оставшееся время вызова становится statement_timeout транзакции PostgreSQL"""
+    call = current_call.get()
+    if call is None or call.deadline is None or connection.dialect.name != "postgresql":
+        return
+    connection.exec_driver_sql(f"SET LOCAL statement_timeout = {max(int(call.remaining() * 1000), 1)}")
+
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    call = current_call.get()
+    if call is not None:
+        call.attach(dbapi_connection)
+        connection_record.info["db_call"] = call
+
+def _on_checkin(dbapi_connection, connection_record):
+    call = connection_record.info.pop("db_call", None)
+    if call is not None:
+        call.detach(dbapi_connection)
+
+def _on_error(context):
+    call = current_call.get()
+    if call is not None and call.expired():
+        call.interrupted = True
+
+def _on_sqlite_connect(dbapi_connection, connection_record):
+    dbapi_connection.set_progress_handler(_sqlite_progress, SQLITE_PROGRESS_STEPS)
+
+def _sqlite_progress():
+    # Ненулевой результат прерывает запрос: sqlite3.OperationalError("interrupted")
+    return call_expired()
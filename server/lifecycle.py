@@ -0,0 +1,80 @@
+import asyncio
+import inspect
+import logging
+
+from config import SHUTDOWN_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+# Этапы остановки, выполняются по порядку
+STOP_RECEIVING = 0  # Прекращение приема новых обновлений
+DRAIN_UPDATES = 1  # Дообработка принятых обновлений
+DRAIN_QUEUES = 2  # Внутренние очереди: отправка сообщений, запись логов
+CLOSE = 3  # Закрытие ресурсов: выполняется всегда, даже если срок истек
+
+STAGE_NAMES = {
+    STOP_RECEIVING: "прекращение приема",
+    DRAIN_UPDATES: "дообработка обновлений",
+    DRAIN_QUEUES: "очереди",
+    CLOSE: "закрытие ресурсов",
+}
+
+class Lifecycle:
+    """
+    Порядок остановки бота (SIGTERM при деплое, Ctrl+C).
+
+    Компоненты регистрируют шаги остановки на своем этапе. Шаги выполняются
+    по этапам, внутри этапа — в порядке регистрации, а на этапе CLOSE — в обратном:
+    ресурс, открытый первым (пул соединений с БД), закрывается последним.
+    На этапы до CLOSE отводится общий срок timeout (SHUTDOWN_TIMEOUT): шаг,
+    не успевший к сроку, прерывается, как и все следующие шаги этих этапов.
+    Шаг с min_timeout получает не меньше min_timeout секунд, даже если общий срок истек.
+    Шаги этапа CLOSE выполняются всегда, поэтому процесс не оставляет открытых соединений.
+    """
+
+    def __init__(self, timeout=SHUTDOWN_TIMEOUT):
+        self.timeout = timeout
+        self.stopping = False
+        self._steps = []
+
+    def on_shutdown(self, stage, name, callback, min_timeout=0):
+        """Регистрирует шаг остановки: callback() — функция или корутина без аргументов"""
+        if stage not in STAGE_NAMES:
+            raise ValueError(f"Неизвестный этап остановки: {stage}")
+        self._steps.append((stage, name, callback, min_timeout))
+
+    async def shutdown(self):
+        """Выполняет зарегистрированные шаги остановки (один раз)"""
+        if self.stopping:
+            return
+        self.stopping = True
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        deadline = started + self.timeout
+        logger.info("Остановка: прием обновлений прекращается, на дообработку %s с", self.timeout)
+        steps = sorted((step for step in self._steps if step[0] != CLOSE), key=lambda step: step[0])
+        steps += [step for step in reversed(self._steps) if step[0] == CLOSE]
+        for stage, name, callback, min_timeout in steps:
+            timeout = None if stage == CLOSE else max(deadline - loop.time(), min_timeout)
+            try:
+                result = callback()
+                if inspect.isawaitable(result):
+                    await asyncio.wait_for(result, timeout)
+            except asyncio.TimeoutError:
+                logger.error(
+                    "Остановка (%s): «%s» не завершено за SHUTDOWN_TIMEOUT=%s с и прервано",
+                    STAGE_NAMES[stage], name, self.timeout
+                )
+            except Exception as e:
+                logger.error("Остановка (%s): ошибка «%s»: %s", STAGE_NAMES[stage], name, e, exc_info=True)
+        self._steps.clear()
+        logger.info("Остановка завершена за %.1f с", loop.time() - started)
+
+async def close_dispatcher(dispatcher):
+    """Закрывает хранилище диалогов и HTTP-сессию Bot API"""
+    await dispatcher.storage.close()
+    await dispatcher.storage.wait_closed()
+    session = await dispatcher.bot.get_session()
+    await session.close()
+
+lifecycle = Lifecycle()
@@ -0,0 +1,73 @@
+import asyncio
+import logging
+from aiohttp import web
+
+from config import METRICS_HOST, METRICS_PORT
+from database import run_db
+from database.database import ping
+from utils.metrics import render
+
+logger = logging.getLogger(__name__)
+
+# Сколько ждать ответа БД при проверке готовности, секунд
+READY_DB_TIMEOUT = 2.0
+
+class MetricsServer:
+    """
+    HTTP-сервер метрик и проверок состояния:
+      /metrics — метрики в текстовом формате Prometheus
+      /healthz — процесс жив (event loop отвечает)
+      /readyz  — бот запущен, не останавливается, БД отвечает и пройдены проверки checks
+    """
+
+    def __init__(self, host=METRICS_HOST, port=METRICS_PORT):
+        self.host = host
+        self.port = port
+        self.ready = False
+        # Дополнительные проверки готовности: функции без аргументов, возвращающие текст проблемы или None
+        self.checks = []
+        self._runner = None
+
+    def create_app(self):
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle_metrics)
+        app.router.add_get("/healthz", self.handle_health)
+        app.router.add_get("/readyz", self.handle_ready)
+        return app
+
+    async def handle_metrics(self, request):
+        return web.Response(text=render(), content_type="text/plain", charset="utf-8",
+                            headers={"X-Content-Type-Options": "nosniff"})
+
+    async def handle_health(self, request):
+        return web.Response(text="ok")
+
+    async def handle_ready(self, request):
+        if not self.ready:
+            return web.Response(status=503, text="not ready")
+        for check in self.checks:
+            problem = check()
+            if problem:
+                return web.Response(status=503, text=problem)
+        try:
+            await asyncio.wait_for(run_db(ping), READY_DB_TIMEOUT)
+        except Exception as e:
+            logger.warning("Проверка готовности: БД недоступна: %s", e)
+            return web.Response(status=503, text="database unavailable")
+        return web.Response(text="ok")
+
+    async def start(self):
+        if not self.port or self._runner is not None:
+            return
+        self._runner = web.AppRunner(self.create_app(), access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info("Метрики доступны на http://%s:%s/metrics", self.host, self.port)
+
+    async def stop(self):
+        self.ready = False
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+metrics_server = MetricsServer()
@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import signal
+import aiohttp
+
+from config import POLLING_TIMEOUT, POLLING_LIMIT
+from server.lifecycle import lifecycle, STOP_RECEIVING, DRAIN_UPDATES, DRAIN_QUEUES
+from server.updates import UpdatePool, ABORT_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+# Пауза перед повтором после ошибки getUpdates или записи отметок, секунд
+ERROR_SLEEP = 5
+
+class UpdatePoller:
+    """
+    Long polling без пропуска накопившихся обновлений.
+
+    Обновления, пришедшие, пока бот был остановлен, забираются при запуске
+    и обрабатываются через UpdatePool: параллельно, но не больше UPDATE_CONCURRENCY,
+    поэтому всплеск после деплоя не занимает весь пул соединений с БД.
+    Следующий getUpdates (подтверждающий предыдущую пачку) запрашивается только после того,
+    как пачка отмечена в processed_updates и принята в очередь: пока очередь заполнена,
+    необработанные обновления остаются у Telegram.
+    """
+
+    def __init__(self, dispatcher, pool, timeout=POLLING_TIMEOUT, limit=POLLING_LIMIT):
+        self.dispatcher = dispatcher
+        self.pool = pool
+        self.timeout = timeout
+        self.limit = limit
+        self._task = None
+        self._stopping = False
+        # Задачу можно прервать только во время ожидания getUpdates или паузы после ошибки:
+        # отмеченная, но не принятая в очередь пачка была бы потеряна
+        self._interruptible = False
+
+    async def run(self):
+        self._task = asyncio.current_task()
+        bot = self.dispatcher.bot
+        # Переключаемся с webhook на polling, не сбрасывая накопившиеся обновления
+        await bot.delete_webhook(drop_pending_updates=False)
+        request_timeout = aiohttp.ClientTimeout(total=self.timeout + 10)
+        offset = None
+        drained = False
+        logger.info("Запуск long polling")
+        while not self._stopping:
+            try:
+                with bot.request_timeout(request_timeout):
+                    # Первый запрос без ожидания: сразу забираем накопившиеся обновления
+                    updates = await self._interruptible_call(bot.get_updates(
+                        offset=offset, limit=self.limit, timeout=self.timeout if drained else 0
+                    ))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Ошибка получения обновлений: %s", e)
+                await self._interruptible_call(asyncio.sleep(ERROR_SLEEP))
+                continue
+            if not updates:
+                if not drained:
+                    drained = True
+                    logger.info("Накопившиеся обновления приняты в обработку")
+                continue
+            try:
+                fresh = await self.pool.claim(updates)
+            except Exception as e:
+                # offset не сдвигаем: пачка будет получена повторно
+                logger.error("Не удалось отметить обновления, повтор через %s с: %s", ERROR_SLEEP, e)
+                await self._interruptible_call(asyncio.sleep(ERROR_SLEEP))
+                continue
+            for update in fresh:
+                await self.pool.put(update)
+            offset = updates[-1].update_id + 1
+
+    async def _interruptible_call(self, coro):
+        self._interruptible = True
+        try:
+            return await coro
+        finally:
+            self._interruptible = False
+
+    async def stop(self):
+        """Прекращает получение обновлений; принятые в очередь дообрабатывает pool"""
+        self._stopping = True
+        if self._task is not None and not self._task.done():
+            if self._interruptible:
+                self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+def start_polling(dispatcher, on_startup=None, on_shutdown=None, pool=None):
+    """Запускает бота в режиме long polling; pool — очередь обработки (по умолчанию UpdatePool)"""
+    poller = UpdatePoller(dispatcher, pool if pool is not None else UpdatePool(dispatcher))
+    lifecycle.on_shutdown(STOP_RECEIVING, "long polling", poller.stop)
+    lifecycle.on_shutdown(DRAIN_UPDATES, "принятые обновления", poller.pool.join)
+    lifecycle.on_shutdown(DRAIN_UPDATES, "прерывание необработанных", poller.pool.abort, min_timeout=ABORT_TIMEOUT)
+    if on_shutdown is not None:
+        lifecycle.on_shutdown(DRAIN_QUEUES, "on_shutdown", lambda: on_shutdown(dispatcher))
+
+    async def startup():
+        user = await dispatcher.bot.me
+        logger.info("Бот: %s [@%s]", user.full_name, user.username)
+        if on_startup is not None:
+            await on_startup(dispatcher)
+
+    loop = asyncio.get_event_loop()
+    # SIGINT/SIGTERM (деплой) останавливают loop между шагами задач, а не прерывают обработчик посередине
+    _set_signal_handlers(loop, loop.stop)
+    try:
+        loop.run_until_complete(startup())
+        loop.create_task(poller.run())
+        loop.run_forever()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        # Повторный сигнал не прерывает остановку: ее ограничивает SHUTDOWN_TIMEOUT
+        _set_signal_handlers(loop, lambda: logger.warning("Остановка уже выполняется"))
+        loop.run_until_complete(lifecycle.shutdown())
+        logger.info("Бот остановлен")
+
+def _set_signal_handlers(loop, callback):
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, callback)
+        except NotImplementedError:
+            # Windows: остается KeyboardInterrupt
+            pass
@@ -0,0 +1,325 @@
+import asyncio
+import logging
+from collections import deque
+from aiogram import Bot, Dispatcher
+
+from config import UPDATE_CONCURRENCY, UPDATE_QUEUE_SIZE, UPDATE_DEDUP, UPDATE_DEDUP_TTL
+from database import run_db, claim_updates, release_updates, delete_processed_updates
+from database.timeouts import Interruptible, current_handler
+from utils.metrics import Gauge, UPDATES_DUPLICATE_TOTAL, UPDATES_CANCELLED_TOTAL
+from utils.throttling import find_throttling
+
+logger = logging.getLogger(__name__)
+
+# Период удаления старых отметок processed_updates, секунд
+DEDUP_CLEANUP_INTERVAL = 3600
+# Срок прерывания необработанных обновлений и снятия их отметок при остановке, секунд
+ABORT_TIMEOUT = 5
+
+# Очередь процесса (последний созданный UpdatePool): метрика регистрируется один раз
+active_pool = None
+
+Gauge("bot_update_queue_depth", "Принятые обновления, ожидающие обработки",
+      function=lambda: active_pool.pending if active_pool is not None else 0)
+
+def get_chat_id(update):
+    """Определяет чат, к которому относится обновление (для сохранения порядка)"""
+    for name in ("message", "edited_message", "channel_post", "edited_channel_post"):
+        message = getattr(update, name, None)
+        if message is not None and message.chat is not None:
+            return message.chat.id
+    callback_query = update.callback_query
+    if callback_query is not None:
+        if callback_query.message is not None:
+            return callback_query.message.chat.id
+        return callback_query.from_user.id
+    for name in ("inline_query", "chosen_inline_result", "shipping_query", "pre_checkout_query",
+                 "my_chat_member", "chat_member", "chat_join_request"):
+        event = getattr(update, name, None)
+        if event is not None and getattr(event, "from_user", None) is not None:
+            return event.from_user.id
+    return None
+
+def is_command(update):
+    """Сообщение с командой (/start, /find ...): пользователь перешел к новому действию"""
+    message = update.message
+    return message is not None and bool(message.text) and message.text.startswith("/")
+
+class UpdatePool:
+    """
+    Обрабатывает обновления параллельно с ограничением.
+
+    Обновления одного чата выполняются строго по очереди, разные чаты —
+    одновременно, но не больше concurrency штук. Если ожидающих обновлений
+    больше max_pending, новые отклоняются (submit возвращает False) или
+    ждут свободного места (put).
+
+    Команда, пришедшая, пока обрабатывается предыдущее обновление того же чата,
+    прерывает его чтение из БД (поиск, просмотр логов: @read_only с @statement_timeout),
+    и команда не ждет ответа, который пользователю уже не нужен. Записи (сохранение,
+    состояние диалога, авторизация) не прерываются: обработка дожидается их завершения.
+
+    claim сначала проверяет лимиты частоты (ThrottlingMiddleware диспетчера) в памяти:
+    обновления сверх лимита отбрасываются, не обращаясь к БД.
+    При deduplicate перед приемом обновления отмечаются в processed_updates (claim),
+    и повторно доставленные после перезапуска или ошибки webhook пропускаются.
+    Отметки, запрошенные одновременно (запросы webhook), записываются одной вставкой:
+    пока идет запись, новые обновления копятся для следующей. Если обработка завершилась
+    ошибкой или прервана остановкой (abort), отметка снимается, и повторная доставка
+    будет обработана. Отметка остается только у обновления, при обработке которого процесс убит.
+    on_start(update) вызывается перед обработкой каждого обновления, on_done(update, handled) — после;
+    handled=False — обработка не завершена, обновление нужно получить повторно.
+    """
+
+    def __init__(self, dispatcher, concurrency=UPDATE_CONCURRENCY, max_pending=UPDATE_QUEUE_SIZE,
+                 deduplicate=UPDATE_DEDUP, dedup_ttl=UPDATE_DEDUP_TTL, on_start=None, on_done=None):
+        self.dispatcher = dispatcher
+        self.max_pending = max_pending
+        self.deduplicate = deduplicate
+        self.dedup_ttl = dedup_ttl
+        self.on_start = on_start
+        self.on_done = on_done
+        self.throttling = find_throttling(dispatcher)
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._chats = {}  # chat_id -> очередь обновлений этого чата
+        self._running = {}  # chat_id -> Interruptible текущей обработки обновления чата
+        self._tasks = set()
+        self._pending = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._space = asyncio.Event()
+        self._space.set()
+        self._next_cleanup = 0.0
+        self._claims = []  # [(update_id, future)] — ожидают следующей вставки в processed_updates
+        self._claiming = False
+        self._releases = []  # update_id необработанных обновлений: их отметки будут сняты
+        self._releasing = None
+        self._waiters = {}  # update_id -> future результата обработки (process)
+        global active_pool
+        active_pool = self
+
+    @property
+    def pending(self):
+        """Количество принятых, но еще не обработанных обновлений"""
+        return self._pending
+
+    @property
+    def full(self):
+        """Очередь заполнена, новые обновления не принимаются"""
+        return self._pending >= self.max_pending
+
+    def submit(self, update):
+        """Ставит обновление в очередь. Возвращает False, если очередь переполнена"""
+        if self.full:
+            return False
+        self._pending += 1
+        self._idle.clear()
+        chat_id = get_chat_id(update)
+        if chat_id is None:
+            # Без чата порядок не важен — обрабатываем отдельно
+            self._spawn(self._run_single(update))
+            return True
+        queue = self._chats.get(chat_id)
+        if queue is not None:
+            queue.append(update)
+            if is_command(update):
+                self._supersede(chat_id)
+            return True
+        self._chats[chat_id] = deque([update])
+        self._spawn(self._run_chat(chat_id))
+        return True
+
+    async def put(self, update):
+        """Ставит обновление в очередь, дожидаясь свободного места"""
+        while not self.submit(update):
+            self._space.clear()
+            await self._space.wait()
+
+    async def process(self, update):
+        """
+        Ставит обновление в очередь и дожидается окончания его обработки.
+        Возвращает False, если обработка не завершена (ошибка или остановка): обновление нужно получить повторно
+        """
+        future = self._waiters[update.update_id] = asyncio.get_running_loop().create_future()
+        try:
+            await self.put(update)
+            return await future
+        finally:
+            self._waiters.pop(update.update_id, None)
+
+    async def claim(self, updates):
+        """
+        Отмечает обновления в processed_updates и возвращает те, что еще не обрабатывались
+        и не отклонены лимитами частоты. Ошибка БД пробрасывается: такие обновления нужно
+        получить повторно, а не обработать без отметки
+        """
+        if self.throttling is not None:
+            updates = [update for update in updates if await self.throttling.admit(update)]
+        if not self.deduplicate or not updates:
+            return list(updates)
+        loop = asyncio.get_running_loop()
+        futures = []
+        for update in updates:
+            future = loop.create_future()
+            self._claims.append((update.update_id, future))
+            futures.append(future)
+        if not self._claiming:
+            self._claiming = True
+            self._spawn(self._write_claims())
+        fresh = [update for update, claimed in zip(updates, await asyncio.gather(*futures)) if claimed]
+        duplicates = len(updates) - len(fresh)
+        if duplicates:
+            UPDATES_DUPLICATE_TOTAL.inc(amount=duplicates)
+            logger.info("Пропущено повторно доставленных обновлений: %s", duplicates)
+        if loop.time() >= self._next_cleanup:
+            self._next_cleanup = loop.time() + DEDUP_CLEANUP_INTERVAL
+            self._spawn(self._cleanup())
+        return fresh
+
+    async def join(self):
+        """Ждет обработки всех принятых обновлений"""
+        await self._idle.wait()
+
+    async def abort(self):
+        """
+        Прерывает обработку, не завершенную к сроку остановки, и снимает отметки ее обновлений:
+        Telegram доставит их повторно (webhook — после ответа с ошибкой, polling — неподтвержденная пачка)
+        """
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._releasing is not None:
+            await asyncio.gather(self._releasing, return_exceptions=True)
+
+    def _supersede(self, chat_id):
+        """Прерывает чтение из БД при обработке текущего обновления чата"""
+        handler = self._running.get(chat_id)
+        if handler is not None and not handler.task.done():
+            handler.interrupt()
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _write_claims(self):
+        """Записывает накопившиеся отметки одной вставкой, пока они есть"""
+        try:
+            while self._claims:
+                claims, self._claims = self._claims, []
+                try:
+                    claimed = await run_db(claim_updates, list({update_id for update_id, _ in claims}))
+                except Exception as e:
+                    for _, future in claims:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                for update_id, future in claims:
+                    # Повтор, доставленный вместе с оригиналом, достается только первому
+                    fresh = update_id in claimed
+                    claimed.discard(update_id)
+                    if not future.done():
+                        future.set_result(fresh)
+        finally:
+            self._claiming = False
+
+    async def _write_releases(self):
+        """Снимает отметки необработанных обновлений одним запросом, пока они есть"""
+        try:
+            while self._releases:
+                update_ids, self._releases = self._releases, []
+                try:
+                    await run_db(release_updates, update_ids)
+                    logger.warning("Сняты отметки необработанных обновлений: %s", update_ids)
+                except Exception as e:
+                    logger.error("Не удалось снять отметки обновлений %s, повторная доставка будет пропущена: %s",
+                                 update_ids, e)
+        finally:
+            self._releasing = None
+
+    async def _cleanup(self):
+        try:
+            removed = await run_db(delete_processed_updates, self.dedup_ttl)
+            if removed:
+                logger.info("Удалено старых отметок обновлений: %s", removed)
+        except Exception as e:
+            logger.error("Ошибка очистки processed_updates: %s", e)
+
+    async def _run_single(self, update):
+        handled = False
+        try:
+            handled = await self._process(update)
+        finally:
+            self._done(update, handled)
+
+    async def _run_chat(self, chat_id):
+        queue = self._chats[chat_id]
+        try:
+            while queue:
+                update = queue.popleft()
+                handled = False
+                try:
+                    handled = await self._process(update, chat_id)
+                finally:
+                    self._done(update, handled)
+        finally:
+            # Остановка прервала очередь чата: ее обновления не обработаны
+            while queue:
+                self._done(queue.popleft(), False)
+            del self._chats[chat_id]
+
+    async def _process(self, update, chat_id=None):
+        async with self._semaphore:
+            if self.on_start is not None:
+                self.on_start(update)
+            # Отдельная задача, чтобы новая команда чата могла прервать только эту обработку
+            handler = Interruptible()
+            task = handler.task = asyncio.create_task(self._handle(update, handler))
+            if chat_id is not None:
+                self._running[chat_id] = handler
+            try:
+                await asyncio.wait({task})
+            except asyncio.CancelledError:
+                task.cancel()
+                raise
+            finally:
+                self._running.pop(chat_id, None)
+            if task.cancelled():
+                # Пользователь перешел к новой команде: повторять обработку не нужно
+                UPDATES_CANCELLED_TOTAL.inc()
+                logger.info("Обработка обновления %s прервана новой командой", update.update_id)
+                return True
+            return task.result()
+
+    async def _handle(self, update, handler):
+        """Обрабатывает обновление. Возвращает False, если обработчик завершился ошибкой"""
+        current_handler.set(handler)
+        try:
+            Bot.set_current(self.dispatcher.bot)
+            Dispatcher.set_current(self.dispatcher)
+            # Через updates_handler, как в aiogram: вызываются и middleware уровня обновления
+            await self.dispatcher.updates_handler.notify(update)
+            return True
+        except Exception as e:
+            logger.error("Ошибка обработки обновления %s: %s", update.update_id, e, exc_info=True)
+            return False
+
+    def _done(self, update, handled):
+        if self.on_done is not None:
+            self.on_done(update, handled)
+        self._finish(update.update_id, handled)
+
+    def _finish(self, update_id, handled):
+        """Обновление обработано (handled) или нет: в этом случае снимается его отметка"""
+        if not handled and self.deduplicate:
+            self._releases.append(update_id)
+            if self._releasing is None:
+                self._releasing = asyncio.create_task(self._write_releases())
+        future = self._waiters.pop(update_id, None)
+        if future is not None and not future.done():
+            future.set_result(handled)
+        self._pending -= 1
+        self._space.set()
+        if not self._pending:
+            self._idle.set()
@@ -0,0 +1,69 @@
+import logging
+from aiohttp import web
+from aiogram import types
+
+from config import WEBHOOK_HOST, WEBHOOK_PATH, WEBHOOK_SECRET, WEBAPP_HOST, WEBAPP_PORT, UPDATE_CONCURRENCY
+from server.lifecycle import lifecycle, DRAIN_UPDATES, DRAIN_QUEUES
+from server.updates import UpdatePool, ABORT_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+def create_webhook_app(dispatcher, on_startup=None, on_shutdown=None, pool=None):
+    """Создает aiohttp-приложение, принимающее обновления от Telegram"""
+    app = web.Application()
+    if pool is None:
+        pool = UpdatePool(dispatcher)
+    app["update_pool"] = pool
+    # Прием прекращает сам aiohttp: при остановке сначала закрывается порт, затем вызывается on_shutdown
+    lifecycle.on_shutdown(DRAIN_UPDATES, "принятые обновления", pool.join)
+    lifecycle.on_shutdown(DRAIN_UPDATES, "прерывание необработанных", pool.abort, min_timeout=ABORT_TIMEOUT)
+    if on_shutdown is not None:
+        lifecycle.on_shutdown(DRAIN_QUEUES, "on_shutdown", lambda: on_shutdown(dispatcher))
+
+    async def handle_update(request):
+        if WEBHOOK_SECRET and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != WEBHOOK_SECRET:
+            return web.Response(status=403)
+        update = types.Update(**(await request.json()))
+        if pool.full:
+            # Перегрузка: Telegram повторит доставку обновления позже
+            logger.warning("Очередь обновлений переполнена, обновление %s отклонено", update.update_id)
+            return web.Response(status=503)
+        try:
+            fresh = await pool.claim([update])
+        except Exception as e:
+            # Отметку поставить не удалось: Telegram повторит доставку, обновление не потеряется
+            logger.error("Не удалось отметить обновление %s: %s", update.update_id, e)
+            return web.Response(status=503)
+        # Ответ — после обработки: если она не завершилась (ошибка, остановка), отметка снята,
+        # и Telegram доставит обновление повторно
+        for update in fresh:
+            if not await pool.process(update):
+                return web.Response(status=503)
+        return web.Response(text="ok")
+
+    async def startup(app):
+        await dispatcher.bot.set_webhook(
+            WEBHOOK_HOST.rstrip("/") + WEBHOOK_PATH,
+            max_connections=min(UPDATE_CONCURRENCY, 100),
+            # Обновления, пришедшие во время перезапуска, не сбрасываются: повторы отсеивает processed_updates
+            drop_pending_updates=False,
+            secret_token=WEBHOOK_SECRET or None
+        )
+        logger.info("Webhook установлен: %s%s", WEBHOOK_HOST, WEBHOOK_PATH)
+        if on_startup is not None:
+            await on_startup(dispatcher)
+
+    async def shutdown(app):
+        await lifecycle.shutdown()
+
+    app.router.add_post(WEBHOOK_PATH, handle_update)
+    app.on_startup.append(startup)
+    app.on_shutdown.append(shutdown)
+    return app
+
+def start_webhook(dispatcher, on_startup=None, on_shutdown=None, pool=None):
+    """Запускает бота в режиме webhook"""
+    if not WEBHOOK_HOST:
+        raise RuntimeError("Для режима webhook нужно задать WEBHOOK_HOST")
+    app = create_webhook_app(dispatcher, on_startup=on_startup, on_shutdown=on_shutdown, pool=pool)
+    web.run_app(app, host=WEBAPP_HOST, port=WEBAPP_PORT)
@@ -0,0 +1,381 @@
+import asyncio
+import bisect
+import hashlib
+import json
+import logging
+import os
+import signal
+import socket
+import sys
+from aiogram import types
+
+from config import (
+    BOT_MODE,
+    BOT_WORKERS,
+    BOT_WORKER_ID,
+    BOT_WORKER_FD,
+    WORKER_RESTART_DELAY,
+    WORKER_STOP_TIMEOUT,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_EXECUTOR_WORKERS,
+    SEND_GLOBAL_RATE,
+    SEND_GLOBAL_BURST,
+    THROTTLE_GLOBAL_RATE,
+    THROTTLE_GLOBAL_BURST,
+    METRICS_PORT,
+    LOG_FILE,
+)
+from server.lifecycle import lifecycle, DRAIN_UPDATES, DRAIN_QUEUES, CLOSE
+from server.metrics import metrics_server
+from server.updates import UpdatePool, get_chat_id, ABORT_TIMEOUT
+from utils.metrics import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+# Сколько раз обновление отправляется заново после падения рабочего процесса, прежде чем будет пропущено
+MAX_DELIVERY_ATTEMPTS = 3
+# Максимальная длина строки протокола (одно обновление в JSON), байт
+LINE_LIMIT = 2 ** 20
+# Соединения с БД супервизора: отметки processed_updates и обслуживание БД (архивирование секций
+# может надолго занять одно соединение). Вычитаются из DB_POOL_SIZE + DB_MAX_OVERFLOW до деления между рабочими процессами
+SUPERVISOR_DB_POOL_SIZE = 2
+
+WORKER_UP = Gauge("bot_worker_up", "Рабочий процесс запущен и готов к обработке", ["worker"])
+
+# Рабочие процессы супервизора (последний созданный WorkerPool)
+active_workers = {}
+
+Gauge("bot_workers_ready", "Готовые к обработке рабочие процессы",
+      function=lambda: sum(worker.ready for worker in active_workers.values()))
+WORKER_RESTARTS_TOTAL = Counter("bot_worker_restarts_total", "Перезапуски рабочих процессов после падения", ["worker"])
+
+class HashRing:
+    """
+    Консистентное хеширование: ключ -> узел. У каждого узла replicas точек на кольце,
+    поэтому ключи распределяются равномерно, а при изменении числа узлов
+    переезжает только их небольшая часть
+    """
+
+    def __init__(self, nodes, replicas=64):
+        points = sorted((self._hash(f"{node}:{i}"), node) for node in nodes for i in range(replicas))
+        self._points = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    @staticmethod
+    def _hash(value):
+        return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+    def get(self, key):
+        index = bisect.bisect(self._points, self._hash(str(key))) % len(self._points)
+        return self._nodes[index]
+
+def db_pool_share(count):
+    """
+    Пул соединений одного из count рабочих процессов: (pool_size, max_overflow).
+    Все соединения процессов вместе с пулом супервизора не превышают DB_POOL_SIZE + DB_MAX_OVERFLOW
+    """
+    budget = (DB_POOL_SIZE + DB_MAX_OVERFLOW - SUPERVISOR_DB_POOL_SIZE) // count
+    if budget < 1:
+        raise RuntimeError(
+            f"DB_POOL_SIZE + DB_MAX_OVERFLOW = {DB_POOL_SIZE + DB_MAX_OVERFLOW} не хватает на {count} рабочих "
+            f"процессов: нужно не меньше {count + SUPERVISOR_DB_POOL_SIZE} (по соединению на процесс "
+            f"и {SUPERVISOR_DB_POOL_SIZE} супервизору)"
+        )
+    pool_size = min(budget, max(1, (DB_POOL_SIZE - SUPERVISOR_DB_POOL_SIZE) // count))
+    return pool_size, budget - pool_size
+
+def worker_env(number, count):
+    """
+    Переменные окружения рабочего процесса: общие лимиты делятся между процессами
+    (соединения с БД — за вычетом пула супервизора), у каждого процесса свой порт метрик и свой файл логов
+    """
+    pool_size, max_overflow = db_pool_share(count)
+    env = {
+        "BOT_WORKER_ID": str(number),
+        "DB_POOL_SIZE": str(pool_size),
+        "DB_MAX_OVERFLOW": str(max_overflow),
+        "DB_EXECUTOR_WORKERS": str(max(1, DB_EXECUTOR_WORKERS // count)),
+        "SEND_GLOBAL_RATE": str(SEND_GLOBAL_RATE / count),
+        "SEND_GLOBAL_BURST": str(max(1, SEND_GLOBAL_BURST // count)),
+        "THROTTLE_GLOBAL_RATE": str(THROTTLE_GLOBAL_RATE / count),
+        "THROTTLE_GLOBAL_BURST": str(max(1, THROTTLE_GLOBAL_BURST // count)),
+        "METRICS_PORT": str(METRICS_PORT + number if METRICS_PORT else 0),
+    }
+    if LOG_FILE:
+        root, ext = os.path.splitext(LOG_FILE)
+        env["LOG_FILE"] = f"{root}.worker{number}{ext}"
+    return env
+
+class WorkerProcess:
+    """
+    Рабочий процесс: тот же скрипт бота, запущенный с BOT_WORKER_ID.
+    Обновления передаются через socketpair строками JSON, процесс сообщает о начале
+    обработки каждого обновления и подтверждает каждое обработанное. Неподтвержденные
+    обновления после падения отправляются перезапущенному процессу в том же порядке;
+    попытка доставки учитывается только тем, обработка которых уже началась.
+    """
+
+    def __init__(self, number, env, on_done):
+        self.number = number
+        self.env = env
+        # on_done(update_id, handled) вызывается, когда обновление подтверждено или пропущено
+        self.on_done = on_done
+        self.ready = False
+        self.restarts = 0
+        self.process = None
+        self.inflight = {}  # update_id -> [строка JSON, попытки доставки, обработка началась]
+        self._writer = None
+        self._task = None
+        self._stopping = False
+
+    def start(self):
+        self._task = asyncio.create_task(self._run(), name=f"worker-{self.number}")
+
+    def send(self, update):
+        line = (json.dumps(update.to_python(), ensure_ascii=False) + "\n").encode()
+        self.inflight[update.update_id] = [line, 0, False]
+        if self._writer is not None:
+            self._writer.write(line)
+
+    async def stop(self, timeout=WORKER_STOP_TIMEOUT):
+        """Закрывает канал: процесс дообрабатывает полученные обновления и завершается"""
+        self._stopping = True
+        if self._task is None:
+            return
+        if self._writer is None:
+            # Процесс не запущен (ожидание перезапуска)
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            return
+        self._writer.write_eof()
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Рабочий процесс %s не завершился за %s с, принудительная остановка", self.number, timeout)
+            self._kill()
+        except asyncio.CancelledError:
+            # Истек общий срок остановки супервизора (SHUTDOWN_TIMEOUT)
+            logger.warning("Рабочий процесс %s не завершился к сроку остановки, принудительная остановка", self.number)
+            self._kill()
+            raise
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    def _kill(self):
+        if self.process is not None and self.process.returncode is None:
+            self.process.kill()
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                reader = await self._spawn()
+            except Exception as e:
+                logger.error("Не удалось запустить рабочий процесс %s: %s", self.number, e)
+            else:
+                await self._read(reader)
+                returncode = await self.process.wait()
+                self._writer.close()
+                self._writer = None
+                self.ready = False
+                WORKER_UP.set(0, self.number)
+                if self._stopping:
+                    logger.info("Рабочий процесс %s завершен", self.number)
+                    break
+                logger.error("Рабочий процесс %s завершился с кодом %s", self.number, returncode)
+                self._expire()
+            self.restarts += 1
+            WORKER_RESTARTS_TOTAL.inc(self.number)
+            await asyncio.sleep(WORKER_RESTART_DELAY)
+
+    async def _spawn(self):
+        parent, child = socket.socketpair()
+        env = dict(os.environ, **self.env, BOT_WORKER_FD=str(child.fileno()))
+        try:
+            # Тот же скрипт и аргументы, что у супервизора
+            self.process = await asyncio.create_subprocess_exec(
+                sys.executable, *sys.argv, env=env, pass_fds=(child.fileno(),)
+            )
+        except Exception:
+            parent.close()
+            raise
+        finally:
+            child.close()
+        reader, writer = await asyncio.open_connection(sock=parent, limit=LINE_LIMIT)
+        # Сначала неподтвержденные обновления прошлого запуска, затем новые
+        for line, _, _ in self.inflight.values():
+            writer.write(line)
+        self._writer = writer
+        logger.info("Запущен рабочий процесс %s (pid %s)", self.number, self.process.pid)
+        return reader
+
+    async def _read(self, reader):
+        while True:
+            try:
+                line = await reader.readline()
+            except (ConnectionError, ValueError) as e:
+                logger.error("Ошибка связи с рабочим процессом %s: %s", self.number, e)
+                return
+            if not line:
+                return
+            message = json.loads(line)
+            if "ack" in message:
+                if self.inflight.pop(message["ack"], None) is not None:
+                    self.on_done(message["ack"], message.get("handled", True))
+            elif "started" in message:
+                entry = self.inflight.get(message["started"])
+                if entry is not None:
+                    entry[2] = True
+            elif message.get("ready"):
+                self.ready = True
+                WORKER_UP.set(1, self.number)
+
+    def _expire(self):
+        """
+        Учитывает попытку доставки обновлений, которые обрабатывались в момент падения;
+        превысившие лимит пропускаются. Ожидавшие в очереди процесса отправляются заново без учета
+        """
+        for update_id, entry in list(self.inflight.items()):
+            if not entry[2]:
+                continue
+            entry[1] += 1
+            entry[2] = False
+            if entry[1] >= MAX_DELIVERY_ATTEMPTS:
+                del self.inflight[update_id]
+                logger.error(
+                    "Обновление %s пропущено: рабочий процесс %s завершался при его обработке %s раз",
+                    update_id, self.number, entry[1],
+                )
+                # Отметка остается: повторная доставка снова уронила бы процесс
+                self.on_done(update_id, True)
+
+class WorkerPool(UpdatePool):
+    """
+    Очередь обновлений супервизора: вместо обработки в своем процессе обновление
+    передается рабочему процессу, выбранному по chat id на кольце консистентного хеширования.
+    Все обновления чата попадают в один процесс, а в нем UpdatePool выполняет их по очереди.
+    Отметка в processed_updates (claim) и ограничение очереди — как у UpdatePool;
+    обновление считается обработанным, когда рабочий процесс его подтвердил.
+    """
+
+    def __init__(self, dispatcher, workers=BOT_WORKERS, **kwargs):
+        super().__init__(dispatcher, **kwargs)
+        self.workers = {
+            number: WorkerProcess(number, worker_env(number, workers), self._acknowledged)
+            for number in range(1, workers + 1)
+        }
+        self.ring = HashRing(self.workers)
+        global active_workers
+        active_workers = self.workers
+
+    def submit(self, update):
+        if self.full:
+            return False
+        chat_id = get_chat_id(update)
+        worker = self.workers[self.ring.get(chat_id if chat_id is not None else update.update_id)]
+        self._pending += 1
+        self._idle.clear()
+        worker.send(update)
+        return True
+
+    def _acknowledged(self, update_id, handled):
+        self._finish(update_id, handled)
+
+    def health(self):
+        """Текст проблемы для /readyz или None, если все рабочие процессы готовы"""
+        down = [str(number) for number, worker in self.workers.items() if not worker.ready]
+        if down:
+            return f"workers not ready: {', '.join(down)}"
+        return None
+
+    async def start(self):
+        for worker in self.workers.values():
+            worker.start()
+
+    async def abort(self):
+        # Рабочие процессы прерывают свою обработку сами и сообщают о ней в подтверждениях
+        pass
+
+    async def stop(self):
+        await asyncio.gather(*(worker.stop() for worker in self.workers.values()))
+        # Обновления, которые остановленные процессы не подтвердили, будут доставлены повторно
+        for worker in self.workers.values():
+            for update_id in list(worker.inflight):
+                del worker.inflight[update_id]
+                self._finish(update_id, False)
+        await super().abort()
+
+def start_supervisor(dispatcher, on_startup=None, on_shutdown=None):
+    """
+    Запускает супервизор: обновления получаются в этом процессе (BOT_MODE),
+    а обрабатываются в BOT_WORKERS рабочих процессах
+    """
+    pool = WorkerPool(dispatcher)
+    metrics_server.checks.append(pool.health)
+    # После подтверждения принятых обновлений (DRAIN_UPDATES) каналы закрываются,
+    # и процессы дописывают свои очереди и завершаются сами
+    lifecycle.on_shutdown(DRAIN_QUEUES, "рабочие процессы", pool.stop)
+
+    async def startup(dispatcher):
+        if on_startup is not None:
+            await on_startup(dispatcher)
+        await pool.start()
+        logger.info("Запущено рабочих процессов: %s", len(pool.workers))
+
+    if BOT_MODE == "webhook":
+        from server.webhook import start_webhook
+        start_webhook(dispatcher, on_startup=startup, on_shutdown=on_shutdown, pool=pool)
+    else:
+        from server.polling import start_polling
+        start_polling(dispatcher, on_startup=startup, on_shutdown=on_shutdown, pool=pool)
+
+async def _serve_worker(dispatcher, on_startup, on_shutdown):
+    sock = socket.socket(fileno=BOT_WORKER_FD)
+    reader, writer = await asyncio.open_connection(sock=sock, limit=LINE_LIMIT)
+
+    def started(update):
+        writer.write(json.dumps({"started": update.update_id}).encode() + b"\n")
+
+    def acknowledge(update, handled):
+        writer.write(json.dumps({"ack": update.update_id, "handled": handled}).encode() + b"\n")
+
+    async def close_channel():
+        await writer.drain()
+        writer.close()
+
+    # Повторы уже отсеял супервизор
+    pool = UpdatePool(dispatcher, deduplicate=False, on_start=started, on_done=acknowledge)
+    lifecycle.on_shutdown(DRAIN_UPDATES, "принятые обновления", pool.join)
+    lifecycle.on_shutdown(DRAIN_UPDATES, "прерывание необработанных", pool.abort, min_timeout=ABORT_TIMEOUT)
+    if on_shutdown is not None:
+        lifecycle.on_shutdown(DRAIN_QUEUES, "on_shutdown", lambda: on_shutdown(dispatcher))
+    # Подтверждения обработанных обновлений уходят супервизору до закрытия канала
+    lifecycle.on_shutdown(CLOSE, "канал супервизора", close_channel)
+    if on_startup is not None:
+        await on_startup(dispatcher)
+    writer.write(b'{"ready": true}\n')
+    logger.info("Рабочий процесс %s готов", BOT_WORKER_ID)
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            await pool.put(types.Update(**json.loads(line)))
+    finally:
+        # Канал закрыт супервизором: дообрабатываем полученное и завершаемся
+        await lifecycle.shutdown()
+
+def run_worker(dispatcher, on_startup=None, on_shutdown=None):
+    """Запускает рабочий процесс супервизора (BOT_WORKER_ID задан)"""
+    # Процессом управляет супервизор: Ctrl+C и SIGTERM всей группе процессов
+    # не должны прерывать обработку, остановка — по закрытию канала
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, signal.SIG_IGN)
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(_serve_worker(dispatcher, on_startup, on_shutdown))
+    logger.info("Рабочий процесс %s остановлен", BOT_WORKER_ID)
@@ -0,0 +1,17 @@
+import os
+import tempfile
+
+from database.database import init_engine
+from database.migrations import migrate
+
+# Движок БД в процессе один, поэтому все тесты используют одну временную SQLite
+_directory = None
+
+def create_test_database():
+    """Создает временную БД со схемой (один раз за запуск тестов). Возвращает каталог для файлов тестов"""
+    global _directory
+    if _directory is None:
+        _directory = tempfile.TemporaryDirectory()
+        init_engine(f"sqlite:///{os.path.join(_directory.name, 'test.db')}")
+        migrate()
+    return _directory.name
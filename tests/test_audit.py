@@ -0,0 +1,77 @@
+import asyncio
+import unittest
+from unittest import mock
+from sqlalchemy import text
+
+from tests import create_test_database
+from database.database import get_engine
+from database.audit import AuditWriter
+
+class AuditWriterTest(unittest.TestCase):
+    """Очередь логов: при остановке каждое событие записано в БД или выведено в лог"""
+
+    @classmethod
+    def setUpClass(cls):
+        create_test_database()
+
+    def setUp(self):
+        with get_engine().begin() as conn:
+            conn.execute(text("DELETE FROM user_logs"))
+
+    def written(self):
+        with get_engine().connect() as conn:
+            return conn.execute(text("SELECT count(*) FROM user_logs")).scalar()
+
+    def test_stop_writes_queue(self):
+        async def run():
+            writer = AuditWriter(batch_size=2, flush_interval=10)
+            await writer.start()
+            for user_id in range(5):
+                await writer.log(user_id, "user", "START_COMMAND", "Вход администратора")
+            await writer.stop()
+
+        asyncio.run(run())
+        self.assertEqual(self.written(), 5)
+
+    def run_cancelled_stop(self):
+        """Остановка очереди прерывается, пока записывается первая пачка; затем вызывается close()"""
+        class SlowWriter(AuditWriter):
+            released = None
+
+            async def _write(self, batch, retries=None):
+                await self.released.wait()
+                await super()._write(batch, retries)
+
+        async def run():
+            writer = SlowWriter(batch_size=2, flush_interval=10, retries=1)
+            writer.released = asyncio.Event()
+            await writer.start()
+            for user_id in range(5):
+                await writer.log(user_id, "user", "START_COMMAND", "Вход администратора")
+            while writer._writing is None:
+                await asyncio.sleep(0)
+            stop = asyncio.create_task(writer.stop())
+            await asyncio.sleep(0)
+            stop.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await stop
+            writer.released.set()
+            await writer.close()
+
+        asyncio.run(run())
+
+    def test_cancelled_stop_written_on_close(self):
+        self.run_cancelled_stop()
+        self.assertEqual(self.written(), 5)
+
+    def test_close_logs_unwritten(self):
+        def fail(rows):
+            raise RuntimeError("БД недоступна")
+
+        with mock.patch("database.audit.add_user_logs", fail), self.assertLogs("database.audit", "ERROR") as logs:
+            self.run_cancelled_stop()
+        lost = [line for line in logs.output if "Событие не записано" in line]
+        self.assertEqual(len(lost), 5)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+import os
+import unittest
+from sqlalchemy import create_engine, text
+
+from tests import create_test_database
+from database.actions import TEMPLATES, ACTIONS, parse_details, render_details, encode_details
+from database.migrations import load_migrations
+
+class DetailsTest(unittest.TestCase):
+    """Детали журнала: текст -> (шаблон, аргументы) -> тот же текст"""
+
+    def round_trip(self, details):
+        template, args = parse_details(details)
+        self.assertEqual(render_details(template, args), details)
+        return template, args
+
+    def test_templates(self):
+        for code, template in TEMPLATES.items():
+            args = tuple(f"арг {index}" for index in range(template.count("%s")))
+            self.assertEqual(self.round_trip(template % args), (code, list(args) or None))
+
+    def test_ambiguous_arguments(self):
+        # Аргумент содержит разделитель шаблона: разбор не теряет текст
+        self.round_trip("Добавлена запись: Иванов, Иван, 79990000000, Москва")
+        self.round_trip("Найдено 3 результатов по запросу: Найдено 1 результатов по запросу: x")
+        self.round_trip("Неверный код: 100%s")
+
+    def test_free_text(self):
+        self.assertEqual(self.round_trip("Произвольный текст 50%"), (None, ["Произвольный текст 50%"]))
+        self.assertEqual(parse_details(""), (None, None))
+        self.assertEqual(render_details(None, None), "")
+
+    def test_encode_details(self):
+        self.assertEqual(encode_details("Неверный код: %s", ("00000",)), (6, ["00000"]))
+        self.assertEqual(encode_details("Вход администратора", ()), (1, None))
+        # Шаблон не из каталога сохраняется готовым текстом
+        self.assertEqual(encode_details("Новое событие %s", ("x",)), (None, ["Новое событие x"]))
+        # Аргументы хранятся в JSON строкой
+        self.assertEqual(render_details(7, '["2", "Иванов"]'), "Найдено 2 результатов по запросу: Иванов")
+
+class AuditCodesMigrationTest(unittest.TestCase):
+    """Миграция 7 на SQLite: имена действий и тексты деталей заменяются кодами без потерь"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = create_test_database()
+
+    def setUp(self):
+        path = os.path.join(self.directory, "migration.db")
+        if os.path.exists(path):
+            os.remove(path)
+        self.engine = create_engine(f"sqlite:///{path}")
+        self.migrations = {migration.VERSION: migration for migration in load_migrations()}
+
+    def tearDown(self):
+        self.engine.dispose()
+
+    def upgrade(self, versions):
+        for version in versions:
+            migration = self.migrations[version]
+            if getattr(migration, "TRANSACTIONAL", True):
+                with self.engine.begin() as conn:
+                    migration.upgrade(conn)
+            else:
+                with self.engine.connect() as conn:
+                    conn.execution_options(isolation_level="AUTOCOMMIT")
+                    migration.upgrade(conn)
+
+    def test_recode(self):
+        self.upgrade(range(1, 7))
+        logs = [
+            ("2024-01-01 10:00:00", 1, "AUTH_FAILED", "Неверный код: 00000"),
+            ("2024-01-01 10:00:01", 1, "SEARCH_SUCCESS", "Найдено 2 результатов по запросу: Иванов"),
+            ("2024-01-01 10:00:02", 2, "START_COMMAND", "Вход администратора"),
+            ("2024-01-01 10:00:03", 2, "OLD_ACTION", "Текст, которого нет в шаблонах"),
+            ("2024-01-01 10:00:04", 3, "ADD_SUCCESS", ""),
+        ]
+        with self.engine.begin() as conn:
+            conn.execute(text(
+                "INSERT INTO user_logs (timestamp, user_id, username, action, details) "
+                "VALUES (:timestamp, :user_id, 'user', :action, :details)"
+            ), [dict(zip(("timestamp", "user_id", "action", "details"), log)) for log in logs])
+            conn.execute(text(
+                "INSERT INTO actions_daily (day, action, count) VALUES ('2024-01-01', 'AUTH_FAILED', 1), "
+                "('2024-01-01', 'OLD_ACTION', 1)"
+            ))
+        self.upgrade([7])
+        with self.engine.connect() as conn:
+            view = conn.execute(text("SELECT user_id, action, details FROM user_logs_view ORDER BY id")).all()
+            codes = dict(conn.execute(text(
+                "SELECT a.name, d.action FROM actions_daily d JOIN audit_actions a ON a.id = d.action"
+            )).all())
+            columns = [row[1] for row in conn.execute(text("PRAGMA table_info(user_logs)"))]
+        self.assertEqual([tuple(row) for row in view], [(user_id, action, details) for _, user_id, action, details in logs])
+        self.assertEqual(codes["AUTH_FAILED"], ACTIONS["AUTH_FAILED"])
+        self.assertGreaterEqual(codes["OLD_ACTION"], 1000)
+        self.assertNotIn("details", columns)
+
+if __name__ == "__main__":
+    unittest.main()
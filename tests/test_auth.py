@@ -0,0 +1,51 @@
+import asyncio
+import unittest
+from unittest import mock
+from sqlalchemy import text
+
+from tests import create_test_database
+from database.database import get_engine, revoke_auth_session
+from utils import auth
+
+class AuthCacheTest(unittest.TestCase):
+    """Кэш сессий: срок сессии проверяется при каждом обращении, а не только при чтении из БД"""
+
+    @classmethod
+    def setUpClass(cls):
+        create_test_database()
+
+    def setUp(self):
+        with get_engine().begin() as conn:
+            conn.execute(text("DELETE FROM auth_sessions"))
+        auth._roles.clear()
+
+    def test_cached_role(self):
+        async def run():
+            await auth.authorize(1, "user", "admin")
+            with mock.patch.object(auth, "run_db", side_effect=AssertionError("запрос к БД")):
+                return await auth.get_user_role(1)
+
+        self.assertEqual(asyncio.run(run()), "admin")
+
+    def test_expired_session_in_cache(self):
+        async def run():
+            with mock.patch.object(auth, "AUTH_SESSION_TTL", 0):
+                await auth.authorize(1, "user", "admin")
+            await asyncio.sleep(0.01)
+            return await auth.get_user_role(1)
+
+        self.assertEqual(asyncio.run(run()), "unauthorized")
+
+    def test_revoke_from_other_process(self):
+        async def run():
+            await auth.authorize(1, "user", "user")
+            # Отзыв другим процессом: кэш этого процесса узнает о нем после AUTH_CACHE_TTL
+            revoke_auth_session(1)
+            cached = await auth.get_user_role(1)
+            auth._roles.clear()
+            return cached, await auth.get_user_role(1)
+
+        self.assertEqual(asyncio.run(run()), ("user", "unauthorized"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import glob
+import gzip
+import io
+import json
+import os
+import unittest
+from datetime import datetime, timedelta
+from sqlalchemy import text
+
+from tests import create_test_database
+from database.database import get_engine
+from database.legacy_logs import iter_records, import_legacy_logs
+
+def _record(timestamp, user_id=1):
+    return {
+        "timestamp": timestamp.strftime("%Y-%m-%d %H:%M:%S"),
+        "user_id": user_id,
+        "username": "user",
+        "action": "START_COMMAND",
+        "details": "Вход администратора",
+    }
+
+class IterRecordsTest(unittest.TestCase):
+    """Потоковый разбор журнала: поврежденный фрагмент пропускается, разбор продолжается"""
+
+    def parse(self, data, **kwargs):
+        return [record for record, _ in iter_records(io.BytesIO(data.encode("utf-8")), chunk_size=16, **kwargs)]
+
+    def test_damaged_record_skipped(self):
+        data = '[{"a": 1}, {"a": 2,, "b": 3}, {"a": 3}]'
+        self.assertEqual(self.parse(data), [{"a": 1}, None, {"a": 3}])
+
+    def test_buffer_capped(self):
+        # Незакрытая строка: без ограничения буфер рос бы до конца файла
+        data = '[{"a": 1}, {"a": "' + "x" * 5000 + '}, {"a": 2}]'
+        self.assertEqual(self.parse(data, max_record_size=1024), [{"a": 1}, None, {"a": 2}])
+
+    def test_truncated_tail(self):
+        self.assertEqual(self.parse('[{"a": 1}, {"a": '), [{"a": 1}, None])
+
+class ImportLegacyLogsTest(unittest.TestCase):
+    """Импорт старого журнала: записи старше срока хранения выгружаются сразу в архив"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = create_test_database()
+
+    def setUp(self):
+        with get_engine().begin() as conn:
+            conn.execute(text("DELETE FROM user_logs"))
+            conn.execute(text("DELETE FROM audit_imports"))
+
+    def test_old_records_archived(self):
+        now = datetime.utcnow()
+        records = [_record(now - timedelta(days=3)), _record(now - timedelta(days=400), 2), _record(now, 3)]
+        path = os.path.join(self.directory, "user_logs.json")
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(json.dumps(records[:2], ensure_ascii=False)[:-1] + ', {"broken": }, ' + json.dumps(records[2]) + "]")
+        archive_dir = os.path.join(self.directory, "archive")
+
+        stats = import_legacy_logs(path, batch_size=2, retention=6, archive_dir=archive_dir)
+        self.assertEqual((stats["imported"], stats["archived"], stats["skipped"]), (2, 1, 1))
+        with get_engine().connect() as conn:
+            self.assertEqual(conn.execute(text("SELECT user_id FROM user_logs ORDER BY user_id")).scalars().all(), [1, 3])
+        archives = glob.glob(os.path.join(archive_dir, "*.jsonl.gz"))
+        self.assertEqual(len(archives), 1)
+        with gzip.open(archives[0], "rt", encoding="utf-8") as archive:
+            self.assertEqual([json.loads(line)["user_id"] for line in archive], [2])
+
+        # Повторный импорт не дублирует ни записи, ни архив
+        stats = import_legacy_logs(path, batch_size=2, restart=True, retention=6, archive_dir=archive_dir)
+        self.assertEqual((stats["imported"], stats["archived"]), (0, 1))
+        self.assertEqual(len(glob.glob(os.path.join(archive_dir, "*.jsonl.gz"))), 1)
+
+if __name__ == "__main__":
+    unittest.main()
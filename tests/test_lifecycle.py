@@ -0,0 +1,51 @@
+import asyncio
+import unittest
+
+from server.lifecycle import Lifecycle, STOP_RECEIVING, DRAIN_UPDATES, DRAIN_QUEUES, CLOSE
+
+class LifecycleTest(unittest.TestCase):
+    """Порядок остановки: этапы по очереди, общий срок, минимальный срок шага, CLOSE всегда"""
+
+    def shutdown(self, lifecycle):
+        with self.assertLogs("server.lifecycle", "INFO") as logs:
+            asyncio.run(lifecycle.shutdown())
+        return logs.output
+
+    def test_stage_order(self):
+        lifecycle = Lifecycle(timeout=1)
+        calls = []
+        lifecycle.on_shutdown(CLOSE, "БД", lambda: calls.append("db"))
+        lifecycle.on_shutdown(DRAIN_QUEUES, "очередь", lambda: calls.append("queue"))
+        lifecycle.on_shutdown(CLOSE, "сессия", lambda: calls.append("session"))
+        lifecycle.on_shutdown(DRAIN_UPDATES, "обновления", lambda: calls.append("updates"))
+        lifecycle.on_shutdown(STOP_RECEIVING, "прием", lambda: calls.append("receiving"))
+        self.shutdown(lifecycle)
+        # CLOSE — в обратном порядке регистрации: ресурс, открытый первым, закрывается последним
+        self.assertEqual(calls, ["receiving", "updates", "queue", "session", "db"])
+
+    def test_deadline_and_min_timeout(self):
+        lifecycle = Lifecycle(timeout=0.05)
+        calls = []
+
+        async def slow():
+            await asyncio.sleep(1)
+            calls.append("slow")
+
+        async def flush():
+            await asyncio.sleep(0.05)
+            calls.append("flush")
+
+        async def skipped():
+            calls.append("skipped")
+
+        lifecycle.on_shutdown(DRAIN_UPDATES, "медленный шаг", slow)
+        lifecycle.on_shutdown(DRAIN_QUEUES, "без срока", skipped)
+        lifecycle.on_shutdown(DRAIN_QUEUES, "со своим сроком", flush, min_timeout=1)
+        lifecycle.on_shutdown(CLOSE, "закрытие", lambda: calls.append("close"))
+        output = self.shutdown(lifecycle)
+        # Шаг без времени не начинается, шаг с min_timeout выполняется, CLOSE — всегда
+        self.assertEqual(calls, ["flush", "close"])
+        self.assertEqual(sum("прервано" in line for line in output), 2)
+
+if __name__ == "__main__":
+    unittest.main()
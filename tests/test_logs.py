@@ -0,0 +1,42 @@
+import gzip
+import logging
+import os
+import tempfile
+import unittest
+
+from utils.logs import RotatingLogHandler
+
+class RotatingLogHandlerTest(unittest.TestCase):
+    """Ротация файла логов: архив создается, а без архивов ротация не настраивается"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, "bot.log")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, handler, count):
+        for number in range(count):
+            handler.emit(logging.LogRecord("bot", logging.INFO, "", 0, "запись %s", (number,), None))
+
+    def test_rotation_by_size(self):
+        handler = RotatingLogHandler(self.filename, max_bytes=200, backup_count=2)
+        try:
+            self.write(handler, 50)
+        finally:
+            handler.close()
+        self.assertLessEqual(os.path.getsize(self.filename), 200)
+        self.assertTrue(os.path.exists(self.filename + ".2.gz"))
+        self.assertFalse(os.path.exists(self.filename + ".3.gz"))
+        with gzip.open(self.filename + ".1.gz", "rt", encoding="utf-8") as archive:
+            self.assertIn("запись", archive.read())
+
+    def test_rotation_requires_backup(self):
+        with self.assertRaises(ValueError):
+            RotatingLogHandler(self.filename, max_bytes=200, backup_count=0)
+        # Без ротации архивы не нужны
+        RotatingLogHandler(self.filename, backup_count=0).close()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import asyncio
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from tests import create_test_database
+from database.database import get_engine, add_user_logs, get_logs_page
+import bot
+
+class LogsPageTest(unittest.TestCase):
+    """Keyset-пагинация логов: страницы без пропусков и повторов, в том числе при одинаковом времени"""
+
+    @classmethod
+    def setUpClass(cls):
+        create_test_database()
+
+    def setUp(self):
+        with get_engine().begin() as conn:
+            conn.execute(text("DELETE FROM user_logs"))
+        # 25 неудачных авторизаций, по 3 с одинаковым временем: курсор различает их по id
+        now = datetime.utcnow().replace(microsecond=0)
+        add_user_logs([
+            {"timestamp": now - timedelta(minutes=number // 3), "user_id": number, "username": f"user{number}",
+             "action": "AUTH_FAILED", "details": "Неверный код доступа: %s", "args": (str(number),)}
+            for number in range(25)
+        ])
+        add_user_logs([{"timestamp": now, "user_id": 100, "username": "admin",
+                        "action": "START_COMMAND", "details": "", "args": ()}])
+
+    def ids(self, page):
+        return [log["user_id"] for log in page["logs"]]
+
+    def test_pages(self):
+        first = get_logs_page(limit=10)
+        self.assertEqual((first["has_newer"], first["has_older"]), (False, True))
+        # Курсор проходит через callback_data
+        cursor = bot.decode_cursor(bot.encode_cursor(first["logs"][-1]["cursor"]))
+        second = get_logs_page(before=cursor, limit=10)
+        self.assertEqual((second["has_newer"], second["has_older"]), (True, True))
+        third = get_logs_page(before=second["logs"][-1]["cursor"], limit=10)
+        self.assertEqual((third["has_newer"], third["has_older"]), (True, False))
+        ids = self.ids(first) + self.ids(second) + self.ids(third)
+        self.assertEqual(sorted(ids), list(range(25)))
+        self.assertEqual(len(self.ids(third)), 5)
+        # Назад от последней страницы — та же вторая страница
+        back = get_logs_page(after=third["logs"][0]["cursor"], limit=10)
+        self.assertEqual(self.ids(back), self.ids(second))
+        self.assertEqual((back["has_newer"], back["has_older"]), (True, True))
+        newest = get_logs_page(after=second["logs"][0]["cursor"], limit=10)
+        self.assertEqual(self.ids(newest), self.ids(first))
+        self.assertFalse(newest["has_newer"])
+
+    def test_exact_page(self):
+        first = get_logs_page(limit=25)
+        self.assertEqual(len(first["logs"]), 25)
+        self.assertFalse(first["has_older"])
+        self.assertEqual(get_logs_page(before=first["logs"][-1]["cursor"], limit=10)["logs"], [])
+
+    def test_details_rendered(self):
+        log = get_logs_page(limit=1)["logs"][0]
+        self.assertEqual(log["action"], "AUTH_FAILED")
+        self.assertEqual(log["details"], f"Неверный код доступа: {log['user_id']}")
+
+class LogsHandlerErrorTest(unittest.TestCase):
+    """Ошибка БД при просмотре логов: администратор получает ответ, кнопка не зависает"""
+
+    @classmethod
+    def setUpClass(cls):
+        create_test_database()
+
+    def test_page_callback(self):
+        def fail(**kwargs):
+            raise OperationalError("SELECT", {}, Exception("БД недоступна"))
+
+        call = mock.Mock(data="logs:older:0:1", answer=mock.AsyncMock())
+        call.message.edit_text = mock.AsyncMock()
+        with mock.patch.object(bot, "get_logs_page", fail), self.assertLogs("bot", "ERROR"):
+            asyncio.run(bot.logs_page_callback(call, "admin"))
+        call.answer.assert_awaited_once_with(bot.DB_ERROR_TEXT, show_alert=True)
+        call.message.edit_text.assert_not_awaited()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+import glob
+import gzip
+import json
+import os
+import tempfile
+import unittest
+from datetime import datetime
+from sqlalchemy import text
+
+from tests import create_test_database
+from database.database import get_engine
+from database.partitions import maintain_partitions, _add_months, _month_start
+
+# Срок хранения в тестах: записи старше RETENTION месяцев архивируются
+RETENTION = 3
+
+class ArchiveOldRowsTest(unittest.TestCase):
+    """Архивирование логов без секций (SQLite): повторная выгрузка месяца не теряет архивы"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = create_test_database()
+
+    def setUp(self):
+        self.archive_dir = tempfile.mkdtemp(dir=self.directory)
+        with get_engine().begin() as conn:
+            conn.execute(text("DELETE FROM user_logs"))
+
+    def insert(self, timestamp, username):
+        with get_engine().begin() as conn:
+            conn.execute(text(
+                "INSERT INTO user_logs (timestamp, user_id, username, action, template, args) "
+                "VALUES (:timestamp, 1, :username, 1, 1, NULL)"
+            ), {"timestamp": timestamp, "username": username})
+
+    def archived(self):
+        """{имя файла: [username]} по всем архивам каталога"""
+        result = {}
+        for path in glob.glob(os.path.join(self.archive_dir, "*.jsonl.gz")):
+            with gzip.open(path, "rt", encoding="utf-8") as archive:
+                result[os.path.basename(path)] = [json.loads(line)["username"] for line in archive]
+        return result
+
+    def test_same_month_archived_twice(self):
+        month = _add_months(_month_start(datetime.utcnow()), -RETENTION - 2)
+        self.insert(month.replace(day=10), "first")
+        self.insert(datetime.utcnow(), "current")
+        maintain_partitions(RETENTION, self.archive_dir)
+        first_run = self.archived()
+        self.assertEqual(list(first_run.values()), [["first"]])
+
+        # Импорт старых записей: тот же месяц и месяц раньше
+        self.insert(month.replace(day=20), "second")
+        self.insert(_add_months(month, -1).replace(day=5), "older")
+        maintain_partitions(RETENTION, self.archive_dir)
+        second_run = self.archived()
+
+        for name, usernames in first_run.items():
+            self.assertEqual(second_run.get(name), usernames)
+        self.assertEqual(sorted(sum(second_run.values(), [])), ["first", "older", "second"])
+        self.assertEqual(len(second_run), 3)
+        with get_engine().connect() as conn:
+            self.assertEqual(conn.execute(text("SELECT username FROM user_logs")).scalars().all(), ["current"])
+
+    def test_empty_months_create_no_files(self):
+        month = _add_months(_month_start(datetime.utcnow()), -RETENTION - 4)
+        self.insert(month, "old")
+        maintain_partitions(RETENTION, self.archive_dir)
+        maintain_partitions(RETENTION, self.archive_dir)
+        self.assertEqual(list(self.archived().values()), [["old"]])
+        self.assertEqual(os.listdir(self.archive_dir), list(self.archived()))
+
+if __name__ == "__main__":
+    unittest.main()
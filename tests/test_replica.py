@@ -0,0 +1,73 @@
+import os
+import threading
+import time
+import unittest
+from datetime import datetime
+from unittest import mock
+from sqlalchemy import create_engine, text
+
+from tests import create_test_database
+import database.database as db
+from database.database import get_engine, get_user_logs, add_user_logs
+from database.replica import ReplicaRouter
+
+def wait_check(router):
+    """Ждет окончания проверки, запущенной available()"""
+    with router._lock:
+        pass
+
+class ReplicaRouterTest(unittest.TestCase):
+    """Проверка реплики не задерживает запросы, при недоступной реплике чтение идет в основную БД"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = create_test_database()
+
+    def test_check_off_request_path(self):
+        released = threading.Event()
+        engine = create_engine(f"sqlite:///{os.path.join(self.directory, 'replica.db')}")
+        router = ReplicaRouter(engine, max_lag=5, check_interval=60)
+
+        def slow_connect(**kwargs):
+            released.wait(5)
+            return engine.connect()
+
+        with mock.patch.object(router, "engine", mock.Mock(connect=slow_connect, dialect=engine.dialect)):
+            started = time.monotonic()
+            # Пока идет проверка, чтение идет в основную БД, запрос ее не ждет
+            self.assertFalse(router.available())
+            self.assertFalse(router.available())
+            self.assertLess(time.monotonic() - started, 1)
+            released.set()
+            wait_check(router)
+        self.assertTrue(router.available())
+        self.assertEqual(router.lag, 0.0)
+
+    def test_failed_check(self):
+        engine = create_engine("sqlite:////nonexistent/replica.db")
+        router = ReplicaRouter(engine, max_lag=5, check_interval=60)
+        router.available()
+        wait_check(router)
+        self.assertFalse(router.available())
+        self.assertIsNone(router.lag)
+
+    def test_read_falls_back_to_primary(self):
+        with get_engine().begin() as conn:
+            conn.execute(text("DELETE FROM user_logs"))
+        add_user_logs([{"timestamp": datetime.utcnow(), "user_id": 1, "username": "user",
+                        "action": "START_COMMAND", "details": "", "args": ()}])
+        # Реплика считалась доступной, но соединение с ней не открывается
+        router = ReplicaRouter(create_engine("sqlite:////nonexistent/replica.db"), max_lag=5, check_interval=60)
+        router._healthy = True
+        router._next_check = time.monotonic() + 60
+        db.ReplicaSessionLocal.configure(bind=router.engine)
+        try:
+            with mock.patch.object(db, "replica_router", router), self.assertLogs("database.replica", "WARNING"):
+                logs = get_user_logs()
+        finally:
+            db.ReplicaSessionLocal.configure(bind=None)
+        self.assertEqual(len(logs), 1)
+        self.assertFalse(router.available())
+
+if __name__ == "__main__":
+    unittest.main()
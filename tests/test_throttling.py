@@ -0,0 +1,84 @@
+import asyncio
+import unittest
+from unittest import mock
+from aiogram import Bot, Dispatcher
+from aiogram.contrib.fsm_storage.memory import MemoryStorage
+from aiogram.types import Message
+from sqlalchemy import text
+
+from tests import create_test_database
+from tests.test_updates import make_update
+from database.database import get_engine
+from server.updates import UpdatePool
+from utils.throttling import RateLimiter, ThrottlingMiddleware
+
+class CountingStorage(MemoryStorage):
+    """Хранилище FSM, считающее обращения к bucket-данным"""
+
+    def __init__(self):
+        super().__init__()
+        self.reads = 0
+        self.writes = 0
+
+    async def get_bucket(self, **kwargs):
+        self.reads += 1
+        return await super().get_bucket(**kwargs)
+
+    async def update_bucket(self, **kwargs):
+        self.writes += 1
+        return await super().update_bucket(**kwargs)
+
+class ThrottleBeforeClaimTest(unittest.TestCase):
+    """Обновления сверх лимита отклоняются в памяти: без отметки в БД и без обращений к хранилищу"""
+
+    @classmethod
+    def setUpClass(cls):
+        create_test_database()
+
+    def setUp(self):
+        with get_engine().begin() as conn:
+            conn.execute(text("DELETE FROM processed_updates"))
+
+    def claimed(self):
+        with get_engine().connect() as conn:
+            return {row[0] for row in conn.execute(text("SELECT update_id FROM processed_updates"))}
+
+    def test_rejected_before_claim(self):
+        storage = CountingStorage()
+        notify = mock.AsyncMock()
+
+        async def run():
+            dispatcher = Dispatcher(Bot("123:abc"), storage=storage)
+            limiter = RateLimiter(storage, rate=0.001, burst=2, sync_interval=0.01)
+            dispatcher.middleware.setup(ThrottlingMiddleware(limiter))
+            pool = UpdatePool(dispatcher, deduplicate=True)
+            fresh = await pool.claim([make_update(update_id) for update_id in range(1, 6)])
+            # Чтение при первом запросе пользователя, дальше решения только в памяти
+            self.assertEqual((storage.reads, storage.writes), (1, 0))
+            await asyncio.sleep(0.05)
+            await limiter.close()
+            return [update.update_id for update in fresh]
+
+        with mock.patch.object(Message, "answer", notify), self.assertLogs("utils.throttling", "WARNING"):
+            fresh = asyncio.run(run())
+        self.assertEqual(fresh, [1, 2])
+        self.assertEqual(self.claimed(), {1, 2})
+        # Изменения записаны одной фоновой записью, пользователь предупрежден один раз
+        self.assertEqual(storage.writes, 1)
+        notify.assert_awaited_once()
+
+    def test_admitted_not_checked_again(self):
+        async def run():
+            dispatcher = Dispatcher(Bot("123:abc"))
+            limiter = RateLimiter(rate=0.001, burst=1)
+            middleware = ThrottlingMiddleware(limiter)
+            dispatcher.middleware.setup(middleware)
+            update = make_update(1)
+            self.assertTrue(await middleware.admit(update))
+            # Обработка уже допущенного обновления не забирает второй токен
+            await middleware.on_pre_process_update(update, {})
+
+        asyncio.run(run())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+import asyncio
+import unittest
+from unittest import mock
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from sqlalchemy import text
+
+from tests import create_test_database
+from database.database import get_engine
+from server.updates import UpdatePool
+
+def make_update(update_id, chat_id=1, text="/start"):
+    return Update.to_object({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "test"},
+            "text": text,
+        },
+    })
+
+class UpdatePoolDedupTest(unittest.TestCase):
+    """Отметки processed_updates: повтор пропускается, отметка необработанного обновления снимается"""
+
+    @classmethod
+    def setUpClass(cls):
+        create_test_database()
+
+    def setUp(self):
+        with get_engine().begin() as conn:
+            conn.execute(text("DELETE FROM processed_updates"))
+
+    def claimed(self):
+        with get_engine().connect() as conn:
+            return {row[0] for row in conn.execute(text("SELECT update_id FROM processed_updates"))}
+
+    def run_pool(self, handler, scenario):
+        async def run():
+            dispatcher = Dispatcher(Bot("123:abc"))
+            pool = UpdatePool(dispatcher, deduplicate=True)
+            with mock.patch.object(dispatcher.updates_handler, "notify", handler):
+                return await scenario(pool)
+
+        return asyncio.run(run())
+
+    def test_duplicate_skipped(self):
+        handled = []
+
+        async def handler(update):
+            handled.append(update.update_id)
+
+        async def scenario(pool):
+            for update in await pool.claim([make_update(1), make_update(1), make_update(2, chat_id=2)]):
+                await pool.put(update)
+            for update in await pool.claim([make_update(2, chat_id=2)]):
+                await pool.put(update)
+            await pool.join()
+
+        self.run_pool(handler, scenario)
+        self.assertEqual(sorted(handled), [1, 2])
+        self.assertEqual(self.claimed(), {1, 2})
+
+    def test_failed_update_released(self):
+        async def handler(update):
+            if update.update_id == 2:
+                raise RuntimeError("ошибка обработчика")
+
+        async def scenario(pool):
+            results = []
+            for update in await pool.claim([make_update(1), make_update(2)]):
+                results.append(await pool.process(update))
+            await pool.abort()
+            return results
+
+        with self.assertLogs("server.updates", "ERROR"):
+            results = self.run_pool(handler, scenario)
+        self.assertEqual(results, [True, False])
+        self.assertEqual(self.claimed(), {1})
+
+    def test_abort_releases_unfinished(self):
+        started = None
+
+        async def handler(update):
+            started.set()
+            await asyncio.sleep(60)
+
+        async def scenario(pool):
+            nonlocal started
+            started = asyncio.Event()
+            # Обновления одного чата: второе ждет в очереди, пока обрабатывается первое
+            for update in await pool.claim([make_update(1, text="текст"), make_update(2, text="текст")]):
+                await pool.put(update)
+            await started.wait()
+            await pool.abort()
+            return pool.pending
+
+        self.assertEqual(self.run_pool(handler, scenario), 0)
+        self.assertEqual(self.claimed(), set())
+
+if __name__ == "__main__":
+    unittest.main()
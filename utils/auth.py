@@ -0,0 +1,63 @@
+import logging
+from datetime import datetime
+from aiogram.dispatcher.middlewares import BaseMiddleware
+
+from config import AUTH_SESSION_TTL, AUTH_CACHE_SIZE, AUTH_CACHE_TTL
+from database import run_db, create_auth_session, get_auth_role, revoke_auth_session
+from utils.cache import TTLCache, MISSING
+
+logger = logging.getLogger(__name__)
+
+# Кэш сессий: user_id -> (role, expires_at) или None, если действующей сессии нет.
+# Сессии хранятся в БД, а повторные проверки обслуживаются из памяти; срок сессии проверяется
+# при каждом обращении, а отзыв в другом процессе виден не позже чем через AUTH_CACHE_TTL
+_roles = TTLCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL)
+
+async def get_user_role(user_id):
+    """Возвращает роль пользователя: admin, user или unauthorized"""
+    session = _roles.get(user_id)
+    if session is MISSING:
+        try:
+            session = await run_db(get_auth_role, user_id)
+        except Exception as e:
+            logger.error("Ошибка чтения сессии пользователя %s: %s", user_id, e)
+            return "unauthorized"
+        _roles.set(user_id, session)
+    if session is None:
+        return "unauthorized"
+    role, expires_at = session
+    if expires_at < datetime.utcnow():
+        _roles.set(user_id, None)
+        return "unauthorized"
+    return role
+
+async def is_authorized(user_id):
+    """Проверяет, авторизован ли пользователь (любая роль)"""
+    return await get_user_role(user_id) != "unauthorized"
+
+async def is_admin(user_id):
+    """Проверяет, является ли пользователь администратором"""
+    return await get_user_role(user_id) == "admin"
+
+async def authorize(user_id, username, role):
+    """Создает сессию пользователя с указанной ролью"""
+    expires_at = await run_db(create_auth_session, user_id, username, role, AUTH_SESSION_TTL)
+    _roles.set(user_id, (role, expires_at))
+
+async def revoke(user_id):
+    """Отзывает сессию пользователя. Другие процессы увидят это не позже чем через AUTH_CACHE_TTL"""
+    revoked = await run_db(revoke_auth_session, user_id)
+    _roles.pop(user_id)
+    return revoked
+
+class AuthMiddleware(BaseMiddleware):
+    """
+    Определяет роль отправителя один раз на обновление и передает ее обработчикам
+    аргументом role; сами проверки доступа выполняет utils.router.MessageRouter
+    """
+
+    async def on_pre_process_message(self, message, data):
+        data["role"] = await get_user_role(message.from_user.id)
+
+    async def on_pre_process_callback_query(self, call, data):
+        data["role"] = await get_user_role(call.from_user.id)
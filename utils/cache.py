@@ -0,0 +1,39 @@
+import time
+from collections import OrderedDict
+
+# Маркер отсутствия записи в кэше (None — тоже допустимое закэшированное значение)
+MISSING = object()
+
+class TTLCache:
+    """LRU-кэш ограниченного размера, записи которого устаревают через ttl секунд"""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+
+    def get(self, key):
+        item = self._data.get(key)
+        if item is None:
+            return MISSING
+        value, expires = item
+        if expires < time.monotonic():
+            del self._data[key]
+            return MISSING
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        self._data[key] = (value, time.monotonic() + self.ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
@@ -0,0 +1,160 @@
+import atexit
+import gzip
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+import sys
+import time
+from datetime import datetime, timezone
+
+from config import (
+    LOG_LEVEL,
+    LOG_LEVELS,
+    LOG_FILE,
+    LOG_FORMAT,
+    LOG_MAX_BYTES,
+    LOG_ROTATE_INTERVAL,
+    LOG_BACKUP_COUNT,
+    LOG_COMPRESS,
+    LOG_QUEUE_SIZE,
+)
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# Стандартные атрибуты LogRecord; остальные (переданные через extra=) попадают в JSON как поля
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись — одна строка JSON: время, уровень, логгер, сообщение, поля из extra и исключение"""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class RotatingLogHandler(logging.handlers.RotatingFileHandler):
+    """
+    Файл логов с ротацией по размеру (max_bytes) и по времени (interval, секунд);
+    архивные файлы сжимаются gzip: bot.log.1.gz, bot.log.2.gz, ...
+    При ротации нужен хотя бы один архив: без него RotatingFileHandler не переименовывает
+    файл, и тот растет дальше, переоткрываясь на каждой записи
+    """
+
+    def __init__(self, filename, max_bytes=0, interval=0, backup_count=1, compress=True):
+        if (max_bytes or interval) and backup_count < 1:
+            raise ValueError("Для ротации логов нужен LOG_BACKUP_COUNT не меньше 1")
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+        self.interval = interval
+        self.rollover_at = self._next_rollover()
+        if compress:
+            self.namer = lambda name: name + ".gz"
+            self.rotator = self._compress
+
+    def _next_rollover(self):
+        return time.time() + self.interval if self.interval else None
+
+    def shouldRollover(self, record):
+        if self.rollover_at is not None and time.time() >= self.rollover_at:
+            return True
+        return bool(super().shouldRollover(record))
+
+    def doRollover(self):
+        super().doRollover()
+        self.rollover_at = self._next_rollover()
+
+    @staticmethod
+    def _compress(source, dest):
+        with open(source, "rb") as src, gzip.open(dest, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(source)
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """
+    Ставит запись в очередь без форматирования: подстановка аргументов,
+    трассировка исключения и JSON выполняются в потоке QueueListener, а не в event loop.
+    При переполнении очереди запись отбрасывается, чтобы не блокировать обработку обновлений.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+def parse_levels(value):
+    """'aiogram=WARNING,database=DEBUG' -> {'aiogram': 'WARNING', 'database': 'DEBUG'}"""
+    levels = {}
+    for item in (value or "").split(","):
+        name, sep, level = item.partition("=")
+        if sep and name.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+_listener = None
+
+def setup_logging():
+    """
+    Настраивает логирование процесса: корневой логгер пишет только в очередь,
+    фоновый поток выводит записи в консоль и в файл с ротацией. Повторный вызов ничего не делает.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    console = logging.StreamHandler(sys.stderr)
+    console.setFormatter(logging.Formatter(TEXT_FORMAT))
+    handlers = [console]
+    if LOG_FILE:
+        file_handler = RotatingLogHandler(
+            LOG_FILE,
+            max_bytes=LOG_MAX_BYTES,
+            interval=LOG_ROTATE_INTERVAL,
+            backup_count=LOG_BACKUP_COUNT,
+            compress=LOG_COMPRESS,
+        )
+        file_handler.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT))
+        handlers.append(file_handler)
+
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(LazyQueueHandler(log_queue))
+    root.setLevel(LOG_LEVEL.upper())
+    for name, level in parse_levels(LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+def stop_logging():
+    """Дописывает оставшиеся в очереди записи и останавливает фоновый поток"""
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
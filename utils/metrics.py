@@ -0,0 +1,155 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Границы гистограмм задержек, секунд
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REGISTRY = []
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    """Базовая метрика с метками; значения изменяются из любых потоков"""
+
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labelvalues):
+        if len(labelvalues) != len(self.labelnames):
+            raise ValueError(f"{self.name}: ожидаются метки {self.labelnames}")
+        return tuple(str(value) for value in labelvalues)
+
+    def samples(self):
+        """Возвращает [(суффикс имени, значения меток, доп. метки, значение)]"""
+        with self._lock:
+            return [("", key, (), value) for key, value in sorted(self._values.items())]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, key, extra, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(self.labelnames, key, extra)} {_format_value(value)}")
+        return "\n".join(lines)
+
+class Counter(Metric):
+    """Монотонно растущий счетчик"""
+
+    kind = "counter"
+
+    def inc(self, *labelvalues, amount=1):
+        key = self._key(labelvalues)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(Metric):
+    """Текущее значение; вместо set() можно передать функцию, вызываемую при чтении метрик"""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def set(self, value, *labelvalues):
+        key = self._key(labelvalues)
+        with self._lock:
+            self._values[key] = value
+
+    def samples(self):
+        if self.function is None:
+            return super().samples()
+        try:
+            return [("", (), (), self.function())]
+        except Exception as e:
+            logger.warning("Не удалось получить значение метрики %s: %s", self.name, e)
+            return []
+
+class Histogram(Metric):
+    """Распределение значений по корзинам (накопительные счетчики, сумма и количество)"""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets) + (float("inf"),)
+
+    def observe(self, value, *labelvalues):
+        key = self._key(labelvalues)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            self._values[key] = (counts, total + value)
+
+    def time(self, *labelvalues):
+        """Контекстный менеджер, замеряющий время выполнения блока"""
+        return _Timer(self, labelvalues)
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        samples = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                samples.append(("_bucket", key, (("le", _format_value(bound)),), cumulative))
+            samples.append(("_sum", key, (), total))
+            samples.append(("_count", key, (), cumulative))
+        return samples
+
+class _Timer:
+    def __init__(self, histogram, labelvalues):
+        self.histogram = histogram
+        self.labelvalues = labelvalues
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labelvalues)
+
+def render():
+    """Все метрики в текстовом формате Prometheus"""
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+# Запуск процесса: импорт, проверка схемы БД, создание приложения, запуск фоновых задач
+STARTUP_SECONDS = Gauge("bot_startup_seconds", "Длительность этапов запуска процесса", ["stage"])
+
+# Обновления и обработчики
+UPDATES_TOTAL = Counter("bot_updates_total", "Полученные обновления", ["type"])
+UPDATE_SECONDS = Histogram("bot_update_duration_seconds", "Время обработки обновления", ["type"])
+HANDLER_SECONDS = Histogram("bot_handler_duration_seconds", "Время работы обработчика", ["handler"])
+UPDATES_DUPLICATE_TOTAL = Counter("bot_updates_duplicate_total", "Повторно доставленные обновления, пропущенные без обработки")
+THROTTLED_TOTAL = Counter("bot_throttled_updates_total", "Обновления, отброшенные ограничением частоты", ["reason"])
+UPDATES_CANCELLED_TOTAL = Counter("bot_updates_cancelled_total", "Обработка обновлений, прерванная новой командой из того же чата")
+
+# База данных
+DB_CALL_SECONDS = Histogram("bot_db_call_duration_seconds", "Время выполнения функции работы с БД в потоке", ["function"])
+DB_EXECUTOR_WAIT_SECONDS = Histogram("bot_db_executor_wait_seconds", "Ожидание свободного потока для запроса к БД")
+DB_POOL_CHECKOUT_SECONDS = Histogram("bot_db_pool_checkout_seconds", "Ожидание соединения из пула SQLAlchemy")
+DB_READS_TOTAL = Counter("bot_db_reads_total", "Функции чтения по месту выполнения (replica / primary)", ["target"])
+DB_TIMEOUTS_TOTAL = Counter("bot_db_timeouts_total", "Запросы к БД, прерванные по истечении срока", ["function"])
+DB_CANCELLED_TOTAL = Counter("bot_db_cancelled_total", "Запросы к БД, отмененные вместе с обработкой обновления", ["function"])
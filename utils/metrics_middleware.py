@@ -0,0 +1,53 @@
+import time
+from aiogram.dispatcher.handler import current_handler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+
+from utils.metrics import UPDATES_TOTAL, UPDATE_SECONDS, HANDLER_SECONDS
+from utils.router import ROUTED_HANDLER
+
+class MetricsMiddleware(BaseMiddleware):
+    """Считает обновления и замеряет время обработки обновлений и отдельных обработчиков"""
+
+    async def on_pre_process_update(self, update, data):
+        data["_metrics_started"] = time.perf_counter()
+        UPDATES_TOTAL.inc(self._update_type(update))
+
+    async def on_post_process_update(self, update, results, data):
+        started = data.get("_metrics_started")
+        if started is not None:
+            UPDATE_SECONDS.observe(time.perf_counter() - started, self._update_type(update))
+
+    async def on_process_message(self, message, data):
+        self._handler_started(data)
+
+    async def on_post_process_message(self, message, results, data):
+        self._handler_finished(data)
+
+    async def on_process_callback_query(self, call, data):
+        self._handler_started(data)
+
+    async def on_post_process_callback_query(self, call, results, data):
+        self._handler_finished(data)
+
+    @staticmethod
+    def _update_type(update):
+        for name in ("message", "callback_query", "edited_message", "inline_query"):
+            if getattr(update, name, None) is not None:
+                return name
+        return "other"
+
+    @staticmethod
+    def _handler_started(data):
+        handler = current_handler.get(None)
+        data["_metrics_handler"] = (getattr(handler, "__name__", "unknown"), time.perf_counter())
+
+    @staticmethod
+    def _handler_finished(data):
+        handler = data.pop("_metrics_handler", None)
+        if handler is not None:
+            name, started = handler
+            # Для сообщений, разобранных MessageRouter, учитывается выбранный им обработчик
+            routed = data.get(ROUTED_HANDLER)
+            if routed is not None:
+                name = getattr(routed, "__name__", name)
+            HANDLER_SECONDS.observe(time.perf_counter() - started, name)
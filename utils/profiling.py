@@ -0,0 +1,90 @@
+import cProfile
+import itertools
+import logging
+import os
+import time
+from contextvars import ContextVar
+from aiogram.dispatcher.handler import current_handler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+
+from config import PROFILE_SAMPLE_RATE, PROFILE_SLOW_MS, PROFILE_DIR
+from utils.router import ROUTED_HANDLER
+
+logger = logging.getLogger(__name__)
+
+# Имя обработчика текущего обновления: обработчики сообщений вызываются с отдельным data,
+# а контекст задачи обновления общий
+_handler_name = ContextVar("profile_handler", default="unhandled")
+
+class ProfilingMiddleware(BaseMiddleware):
+    """
+    Профилирует каждое sample_rate-е обновление через cProfile и сохраняет профиль
+    в directory, если обработка заняла не меньше slow_ms (0 — сохранять все).
+    С sample_rate=1 и slow_ms=200 сохраняется профиль любого обновления дольше 200 мс.
+
+    Одновременно активен только один профиль; обновления, попавшие в выборку во время
+    него, пропускаются. Профиль охватывает весь поток event loop, поэтому в него
+    попадает и работа других обновлений, выполнявшихся параллельно.
+    Файлы открываются через python -m pstats или snakeviz.
+    """
+
+    def __init__(self, sample_rate=PROFILE_SAMPLE_RATE, slow_ms=PROFILE_SLOW_MS, directory=PROFILE_DIR):
+        super().__init__()
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.directory = directory
+        self._counter = itertools.count(1)
+        self._active = None
+
+    async def on_pre_process_update(self, update, data):
+        if not self.sample_rate or self._active is not None or next(self._counter) % self.sample_rate:
+            return
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Профилировщик уже запущен другим инструментом
+            return
+        self._active = update.update_id
+        _handler_name.set("unhandled")
+        data["_profile"] = (profile, time.perf_counter())
+
+    async def on_process_message(self, message, data):
+        self._remember_handler()
+
+    async def on_process_callback_query(self, call, data):
+        self._remember_handler()
+
+    async def on_post_process_message(self, message, results, data):
+        # Обработчик, выбранный MessageRouter, известен только после вызова route_message
+        routed = data.get(ROUTED_HANDLER)
+        if routed is not None:
+            _handler_name.set(getattr(routed, "__name__", "unknown"))
+
+    async def on_post_process_update(self, update, results, data):
+        sample = data.pop("_profile", None)
+        if sample is None:
+            return
+        profile, started = sample
+        profile.disable()
+        self._active = None
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if elapsed_ms < self.slow_ms:
+            return
+        handler = _handler_name.get()
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(
+            self.directory, f"{time.strftime('%Y%m%d-%H%M%S')}_{update.update_id}_{handler}_{elapsed_ms:.0f}ms.prof"
+        )
+        try:
+            profile.dump_stats(path)
+        except OSError as e:
+            logger.error("Не удалось сохранить профиль %s: %s", path, e)
+            return
+        logger.info("Обновление %s (%s) обработано за %.1f мс, профиль: %s", update.update_id, handler, elapsed_ms, path)
+
+    @staticmethod
+    def _remember_handler():
+        handler = current_handler.get(None)
+        if handler is not None:
+            _handler_name.set(getattr(handler, "__name__", "unknown"))
@@ -0,0 +1,123 @@
+import inspect
+from aiogram.dispatcher.handler import ctx_data
+
+# Уровни доступа ролей из utils.auth: маршрут доступен роли не ниже указанной
+ROLE_LEVELS = {"unauthorized": 0, "user": 1, "admin": 2}
+
+# Ключ data с обработчиком, выбранным маршрутизатором: по нему метрики и профилирование
+# подписывают обработку настоящим именем обработчика, а не route_message
+ROUTED_HANDLER = "routed_handler"
+
+class Route:
+    """Обработчик с минимальной ролью и действием для журнала при отказе в доступе"""
+
+    __slots__ = ("handler", "access", "denied", "wants")
+
+    def __init__(self, handler, access="unauthorized", denied=None):
+        if access not in ROLE_LEVELS:
+            raise ValueError(f"Неизвестная роль: {access}")
+        self.handler = handler
+        self.access = access
+        # (действие, предмет): ("FIND_COMMAND", "поиска") -> "Попытка поиска без авторизации"
+        self.denied = denied
+        # Дополнительные аргументы, которые принимает обработчик, определяются один раз при регистрации
+        parameters = inspect.signature(handler).parameters
+        self.wants = tuple(name for name in ("state", "role") if name in parameters)
+
+    def allows(self, role):
+        return ROLE_LEVELS.get(role, 0) >= ROLE_LEVELS[self.access]
+
+class MessageRouter:
+    """
+    Маршрутизация текстовых сообщений вне диалогов по таблицам.
+    Вместо перебора зарегистрированных в aiogram фильтров (лямбда на каждую кнопку,
+    отдельная проверка авторизации в каждом обработчике) в диспетчере регистрируется
+    один обработчик: команда или текст кнопки ищется в словаре, доступ проверяется
+    один раз по роли, которую определил AuthMiddleware.
+
+    Текст, не являющийся командой, от неавторизованного пользователя уходит в обработчик
+    unauthorized (ввод кода доступа), все ненайденное — в обработчик fallback.
+    Шаги диалогов (FSM) остаются обычными обработчиками aiogram с фильтром состояния.
+    """
+
+    def __init__(self):
+        self.commands = {}
+        self.texts = {}
+        self.unauthorized = None
+        self.fallback = None
+        self.denied = None
+
+    def command(self, *names, access="unauthorized", denied=None):
+        """Регистрирует обработчик команд /name (без учета регистра)"""
+        def decorator(handler):
+            route = Route(handler, access, denied)
+            for name in names:
+                self._add(self.commands, name.lower(), route)
+            return handler
+        return decorator
+
+    def text(self, *texts, access="unauthorized", denied=None):
+        """Регистрирует обработчик точного текста сообщения (кнопки клавиатуры)"""
+        def decorator(handler):
+            route = Route(handler, access, denied)
+            for text in texts:
+                self._add(self.texts, text, route)
+            return handler
+        return decorator
+
+    def unauthorized_text(self, handler):
+        """Обработчик текста (не команды) от неавторизованного пользователя"""
+        self.unauthorized = Route(handler)
+        return handler
+
+    def default(self, handler):
+        """Обработчик сообщений, для которых не нашлось маршрута"""
+        self.fallback = Route(handler)
+        return handler
+
+    def access_denied(self, handler):
+        """Обработчик отказа в доступе: handler(message, role, route)"""
+        self.denied = handler
+        return handler
+
+    @staticmethod
+    def _add(table, key, route):
+        if key in table:
+            raise ValueError(f"Маршрут уже зарегистрирован: {key}")
+        table[key] = route
+
+    def resolve(self, text, role):
+        """Возвращает маршрут для текста сообщения или None"""
+        if text.startswith("/"):
+            command = text.split(maxsplit=1)[0][1:].partition("@")[0].lower()
+            return self.commands.get(command, self.fallback)
+        if role == "unauthorized" and self.unauthorized is not None:
+            return self.unauthorized
+        return self.texts.get(text, self.fallback)
+
+    async def dispatch(self, message, state, role):
+        route = self.resolve(message.text, role)
+        if route is None:
+            return None
+        data = ctx_data.get()
+        if not route.allows(role):
+            if self.denied is None:
+                return None
+            data[ROUTED_HANDLER] = self.denied
+            return await self.denied(message, role, route)
+        data[ROUTED_HANDLER] = route.handler
+        arguments = {"state": state, "role": role}
+        return await route.handler(message, **{name: arguments[name] for name in route.wants})
+
+    def register(self, dispatcher):
+        """Регистрирует маршрутизатор в диспетчере для текстовых сообщений вне состояний"""
+        async def route_message(message, state, role="unauthorized"):
+            return await self.dispatch(message, state, role)
+
+        dispatcher.register_message_handler(route_message, content_types=["text"], state=None)
+
+    def routes(self):
+        """Все зарегистрированные маршруты (без повторов)"""
+        routes = list(self.commands.values()) + list(self.texts.values())
+        routes += [route for route in (self.unauthorized, self.fallback) if route is not None]
+        return list({id(route): route for route in routes}.values())
@@ -0,0 +1,112 @@
+import asyncio
+import logging
+from collections import deque
+from aiogram.utils.exceptions import RetryAfter
+
+from config import SEND_CHAT_RATE, SEND_CHAT_BURST, SEND_GLOBAL_RATE, SEND_GLOBAL_BURST, SEND_MAX_RETRIES
+from utils.throttling import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Ограничение Telegram на длину сообщения
+MAX_MESSAGE_LENGTH = 4096
+
+async def _acquire(bucket):
+    """Ждет, пока в ведре появится токен, и забирает его"""
+    while not bucket.consume():
+        await asyncio.sleep((1 - bucket.tokens) / bucket.rate)
+
+class MessageSender:
+    """
+    Очередь исходящих сообщений.
+
+    send() не ждет отправки: сообщения уходят в фоне с ограничением скорости
+    на чат и на весь бот, по порядку внутри чата. Подряд идущие сообщения
+    одного чата без клавиатуры склеиваются, если помещаются в одно. При
+    RetryAfter отправка повторяется после указанной сервером паузы.
+    """
+
+    def __init__(self, bot, chat_rate=SEND_CHAT_RATE, chat_burst=SEND_CHAT_BURST,
+                 global_rate=SEND_GLOBAL_RATE, global_burst=SEND_GLOBAL_BURST, max_retries=SEND_MAX_RETRIES):
+        self.bot = bot
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._global = TokenBucket(global_rate, global_burst)
+        self._chats = {}  # chat_id -> (очередь сообщений, ведро чата)
+        self._tasks = set()
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    @property
+    def pending(self):
+        """Количество сообщений в очереди"""
+        return sum(len(queue) for queue, _ in self._chats.values())
+
+    def send(self, chat_id, text, **kwargs):
+        """Ставит сообщение в очередь на отправку"""
+        self.send_many(chat_id, [text], **kwargs)
+
+    def send_many(self, chat_id, texts, **kwargs):
+        """Ставит в очередь несколько сообщений подряд (например, части длинного ответа)"""
+        entry = self._chats.get(chat_id)
+        if entry is None:
+            entry = (deque(), TokenBucket(self.chat_rate, self.chat_burst))
+            self._chats[chat_id] = entry
+            self._idle.clear()
+            task = asyncio.create_task(self._run_chat(chat_id))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        entry[0].extend((text, kwargs) for text in texts)
+
+    async def join(self):
+        """Ждет отправки всех сообщений из очереди"""
+        await self._idle.wait()
+
+    async def stop(self):
+        """Отменяет отправку оставшихся сообщений (если join не успел к сроку остановки)"""
+        dropped = self.pending
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if dropped:
+            logger.error("Остановка: не отправлено сообщений: %s", dropped)
+
+    def _coalesce(self, queue):
+        text, kwargs = queue.popleft()
+        if "reply_markup" in kwargs:
+            return text, kwargs
+        while queue:
+            next_text, next_kwargs = queue[0]
+            if next_kwargs != kwargs or len(text) + 1 + len(next_text) > MAX_MESSAGE_LENGTH:
+                break
+            queue.popleft()
+            text = f"{text}\n{next_text}"
+        return text, kwargs
+
+    async def _run_chat(self, chat_id):
+        queue, bucket = self._chats[chat_id]
+        try:
+            while queue:
+                text, kwargs = self._coalesce(queue)
+                await _acquire(bucket)
+                await _acquire(self._global)
+                await self._deliver(chat_id, text, kwargs)
+        finally:
+            del self._chats[chat_id]
+            if not self._chats:
+                self._idle.set()
+
+    async def _deliver(self, chat_id, text, kwargs):
+        for attempt in range(self.max_retries + 1):
+            try:
+                await self.bot.send_message(chat_id, text, **kwargs)
+                return
+            except RetryAfter as e:
+                logger.warning("Ограничение Telegram для чата %s, повтор через %s с", chat_id, e.timeout)
+                await asyncio.sleep(e.timeout)
+            except Exception as e:
+                logger.error("Ошибка отправки сообщения в чат %s: %s", chat_id, e)
+                return
+        logger.error("Сообщение в чат %s не отправлено после %s повторов", chat_id, self.max_retries)
@@ -0,0 +1,233 @@
+import asyncio
+import logging
+import time
+from aiogram import Bot
+from aiogram.dispatcher.handler import CancelHandler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+
+from config import (
+    THROTTLE_RATE, THROTTLE_BURST, THROTTLE_GLOBAL_RATE, THROTTLE_GLOBAL_BURST,
+    AUTH_FAIL_RATE, AUTH_FAIL_BURST, THROTTLE_MAX_USERS, THROTTLE_SYNC_INTERVAL,
+)
+from utils.cache import TTLCache, MISSING
+from utils.metrics import THROTTLED_TOTAL
+
+logger = logging.getLogger(__name__)
+
+class TokenBucket:
+    """Ведро токенов: пополняется со скоростью rate, вмещает не больше capacity"""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated", "notified")
+
+    def __init__(self, rate, capacity, tokens=None, updated=None, notified=False):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity if tokens is None else tokens
+        self.updated = time.time() if updated is None else updated
+        self.notified = notified
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def consume(self, now=None):
+        """Забирает токен. Возвращает False, если токенов нет"""
+        self._refill(time.time() if now is None else now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            self.notified = False
+            return True
+        return False
+
+    def empty(self, now=None):
+        """Проверяет, пусто ли ведро, не забирая токен"""
+        self._refill(time.time() if now is None else now)
+        return self.tokens < 1
+
+    def refill_time(self):
+        """Через сколько секунд ведро полностью пополнится"""
+        return self.capacity / self.rate if self.rate else 0
+
+    def to_dict(self):
+        return {"tokens": self.tokens, "updated": self.updated, "notified": self.notified}
+
+class RateLimiter:
+    """
+    Ограничивает частоту запросов пользователей.
+
+    Решения принимаются по ведрам в памяти процесса (полные ведра вытесняются).
+    Если передано storage, ведра также сохраняются в bucket-данных хранилища FSM:
+    они читаются при первом запросе пользователя (или после вытеснения), а изменения
+    записываются в фоне не чаще раза в sync_interval — запрос сверх лимита не обращается
+    к хранилищу, а лимиты переживают перезапуск и общие для процессов бота с точностью
+    до sync_interval. Глобальное ведро всегда своё у каждого процесса.
+    """
+
+    def __init__(self, storage=None, rate=THROTTLE_RATE, burst=THROTTLE_BURST,
+                 global_rate=THROTTLE_GLOBAL_RATE, global_burst=THROTTLE_GLOBAL_BURST,
+                 auth_rate=AUTH_FAIL_RATE, auth_burst=AUTH_FAIL_BURST, max_users=THROTTLE_MAX_USERS,
+                 sync_interval=THROTTLE_SYNC_INTERVAL):
+        self.storage = storage
+        self.sync_interval = sync_interval
+        self.limits = {"rate": (rate, burst), "auth": (auth_rate, auth_burst)}
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        # Запись живет, пока ведро не пополнится полностью: после этого она ничем не отличается от новой
+        ttl = max(burst / rate if rate else 0, auth_burst / auth_rate if auth_rate else 0)
+        self._buckets = TTLCache(max_users, ttl)
+        self._dirty = {}  # user_id -> ведра, ожидающие записи в storage
+        self._syncing = None
+
+    def _new_buckets(self, state=None):
+        state = state or {}
+        return {name: TokenBucket(rate, capacity, **state.get(name, {}))
+                for name, (rate, capacity) in self.limits.items()}
+
+    async def _load(self, user_id):
+        buckets = self._buckets.get(user_id)
+        if buckets is not MISSING:
+            return buckets
+        if self.storage is not None:
+            bucket = await self.storage.get_bucket(chat=user_id, user=user_id)
+            return self._new_buckets(bucket.get("throttle"))
+        return self._new_buckets()
+
+    def _save(self, user_id, buckets):
+        self._buckets.set(user_id, buckets)
+        if self.storage is not None:
+            self._dirty[user_id] = buckets
+            if self._syncing is None:
+                self._syncing = asyncio.create_task(self._sync())
+
+    async def _sync(self):
+        """Записывает измененные ведра в хранилище раз в sync_interval, пока они есть"""
+        try:
+            while self._dirty:
+                await asyncio.sleep(self.sync_interval)
+                await self.flush()
+        finally:
+            self._syncing = None
+
+    async def flush(self):
+        """Записывает в хранилище ведра, измененные после прошлой записи"""
+        dirty, self._dirty = self._dirty, {}
+        for user_id, buckets in dirty.items():
+            try:
+                await self.storage.update_bucket(
+                    chat=user_id, user=user_id,
+                    throttle={name: bucket.to_dict() for name, bucket in buckets.items()}
+                )
+            except Exception as e:
+                logger.error("Ошибка записи лимитов пользователя %s: %s", user_id, e)
+
+    async def close(self):
+        """Останавливает фоновую запись и записывает оставшиеся изменения (до закрытия хранилища)"""
+        if self._syncing is not None:
+            self._syncing.cancel()
+            await asyncio.gather(self._syncing, return_exceptions=True)
+        if self._dirty:
+            await self.flush()
+
+    def allow_global(self):
+        """Забирает токен из общего ведра процесса"""
+        return self.global_bucket.consume()
+
+    async def check(self, user_id):
+        """
+        Проверяет запрос пользователя.
+
+        Возвращает None, если запрос разрешен, иначе причину отказа ("rate" или
+        "auth") и признак того, что пользователя еще не предупреждали.
+        """
+        buckets = await self._load(user_id)
+        now = time.time()
+        if buckets["auth"].empty(now):
+            reason = "auth"
+        elif buckets["rate"].consume(now):
+            self._save(user_id, buckets)
+            return None
+        else:
+            reason = "rate"
+        bucket = buckets[reason]
+        notify = not bucket.notified
+        bucket.notified = True
+        self._save(user_id, buckets)
+        return reason, notify
+
+    async def register_failed_auth(self, user_id):
+        """Учитывает неверный код доступа"""
+        buckets = await self._load(user_id)
+        buckets["auth"].consume()
+        self._save(user_id, buckets)
+
+def _get_user_id(update):
+    for name in ("message", "edited_message", "callback_query", "inline_query"):
+        event = getattr(update, name, None)
+        if event is not None and event.from_user is not None:
+            return event.from_user.id
+    return None
+
+def find_throttling(dispatcher):
+    """ThrottlingMiddleware, подключенный к диспетчеру, или None"""
+    for middleware in dispatcher.middleware.applications:
+        if isinstance(middleware, ThrottlingMiddleware):
+            return middleware
+    return None
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Отклоняет обновления сверх лимитов до вызова обработчиков и любых запросов к БД.
+    UpdatePool проверяет лимиты еще до отметки обновления в processed_updates (admit);
+    такое обновление при обработке повторно не проверяется
+    """
+
+    messages = {
+        "rate": "⏳ Слишком много запросов. Подождите немного и попробуйте снова.",
+        "auth": "🚫 Слишком много неверных кодов доступа. Попробуйте позже.",
+    }
+
+    def __init__(self, limiter):
+        super().__init__()
+        self.limiter = limiter
+        self._notifications = set()
+
+    async def admit(self, update):
+        """
+        Проверяет лимиты и возвращает False, если обновление отклонено.
+        Предупреждение пользователю отправляется в фоне: прием обновлений его не ждет
+        """
+        update.conf["throttled"] = True
+        user_id = _get_user_id(update)
+        if user_id is None:
+            return True
+        if not self.limiter.allow_global():
+            logger.warning("Превышен общий лимит запросов, обновление %s отклонено", update.update_id)
+            THROTTLED_TOTAL.inc("global")
+            return False
+        verdict = await self.limiter.check(user_id)
+        if verdict is None:
+            return True
+        reason, notify = verdict
+        THROTTLED_TOTAL.inc(reason)
+        if notify:
+            logger.warning("Пользователь %s превысил лимит (%s)", user_id, reason)
+            task = asyncio.create_task(self._notify(update, self.messages[reason]))
+            self._notifications.add(task)
+            task.add_done_callback(self._notifications.discard)
+        return False
+
+    async def _notify(self, update, text):
+        # Задача вне обработки обновления: контекст бота задается явно
+        Bot.set_current(self.manager.bot)
+        try:
+            if update.message is not None:
+                await update.message.answer(text)
+            elif update.callback_query is not None:
+                await update.callback_query.answer(text)
+        except Exception as e:
+            logger.error("Не удалось предупредить о лимите (обновление %s): %s", update.update_id, e)
+
+    async def on_pre_process_update(self, update, data):
+        if update.conf.get("throttled"):
+            return
+        if not await self.admit(update):
+            raise CancelHandler()
@@ -0,0 +1,82 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+
+from config import LOOP_LAG_INTERVAL, LOOP_LAG_THRESHOLD
+from utils.metrics import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+LOOP_LAG_SECONDS = Histogram(
+    "bot_event_loop_lag_seconds", "Опоздание event loop относительно запланированного пробуждения",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+LOOP_STALLS_TOTAL = Counter("bot_event_loop_stalls_total", "Блокировки event loop дольше LOOP_LAG_THRESHOLD")
+
+class LoopWatchdog:
+    """
+    Следит за отзывчивостью event loop.
+    Задача в loop просыпается каждые interval секунд и записывает опоздание в метрику.
+    Отдельный поток проверяет, давно ли loop отмечался: если дольше threshold,
+    loop чем-то заблокирован, и в лог пишется стек потока loop в этот момент —
+    то есть синхронный код, который его держит.
+    """
+
+    def __init__(self, interval=LOOP_LAG_INTERVAL, threshold=LOOP_LAG_THRESHOLD):
+        self.interval = interval
+        self.threshold = threshold
+        self._beat = time.monotonic()
+        self._loop_thread_id = None
+        self._task = None
+        self._thread = None
+        self._stopped = threading.Event()
+
+    async def start(self):
+        if not self.interval or self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._run(), name="loop-watchdog")
+        self._thread = threading.Thread(target=self._monitor, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._stopped.set()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._thread.join()
+        self._thread = None
+
+    async def _run(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._beat = now
+            LOOP_LAG_SECONDS.observe(max(now - expected, 0.0))
+
+    def _monitor(self):
+        reported = None
+        while not self._stopped.wait(self.threshold / 2):
+            beat = self._beat
+            stalled = time.monotonic() - beat - self.interval
+            if stalled < self.threshold or beat == reported:
+                continue
+            # Один отчет на одну блокировку: следующий — только после нового пробуждения loop
+            reported = beat
+            LOOP_STALLS_TOTAL.inc()
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else "стек недоступен"
+            logger.warning("Event loop заблокирован дольше %.3f с, стек:\n%s", stalled, stack)
+
+loop_watchdog = LoopWatchdog()